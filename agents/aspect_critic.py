@@ -0,0 +1,165 @@
+from __future__ import annotations
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from agents.critic_agent import CriticAgent
+from llm.aio import acall_llm
+from llm.budget import OutputCaps, stage_output_limit
+from llm.cancel import OperationCancelled
+from llm.context import stage_scope
+from llm.deadline import DeadlineExceeded
+from llm.structured import as_json_llm, parse_json_lenient
+
+# Boyut -> (başlık, neye bakılacağı); anahtarlar CriticAgent JSON şemasındaki alanlardır
+ASPECTS: Dict[str, tuple] = {
+    "theme": ("Tema", "Tema ne kadar net ve hikaye boyunca hissediliyor?"),
+    "language": ("Dil kullanımı", "Dil akıcı mı, tekrarlar, anlatım bozuklukları ve üslup tutarlılığı."),
+    "characters": ("Karakterler", "Karakterler inandırıcı mı, iç dünyaları ve gelişimleri görünüyor mu?"),
+    "plot": ("Olay örgüsü", "Kurgu, tempo, çatışma ve sonun tatmin ediciliği."),
+}
+
+
+class AspectCriticAgent(CriticAgent):
+    """
+    CriticAgent'ın boyut bazlı sürümü: tema, dil, karakter ve kurgu için ayrı ve kısa eleştiri
+    promptları eşzamanlı çalıştırılır, sonuçlar yerelde CriticAgent'ın JSON şemasında birleştirilir
+    (EditorAgent.revise aynı formatı alır).
+    - Eleştirmen süresi boyutların toplamı değil, en yavaş boyut kadardır.
+    - Başarısız (hata ya da okunamayan JSON) boyut tek başına max_retries kez tekrar denenir;
+      yine olmazsa birleştirmede boş kalır. Hiçbir boyut alınamazsa yedek geri bildirim döner.
+    - Revizyon turu değerlendirmesi (review_revision) CriticAgent'taki tek prompttur.
+    """
+
+    def __init__(self, llm: Callable[[str], str], aspects: Optional[List[str]] = None, max_retries: int = 1):
+        super().__init__(llm)
+        self.aspects = [a for a in (aspects or list(ASPECTS)) if a in ASPECTS]
+        self.max_retries = max(0, max_retries)
+        # Boyut yanıtı kısa bir JSON'dır; çıktı ona göre sınırlanır
+        self.aspect_llm = OutputCaps(as_json_llm(llm)).get(stage_output_limit("critic-aspect"))
+
+    def _build_aspect_prompt(self, story_text: str, aspect: str) -> str:
+        label, focus = ASPECTS[aspect]
+        return f"""
+Sen acımasız değil ama çok titiz bir EDEBİ ELEŞTİRMENSİN.
+
+Görevin: Hikayeyi SADECE aşağıdaki boyuttan değerlendir ve Editörün uygulayabileceği SOMUT bir öneri ver.
+Sadece 'zayıf' deme; 'Murat karakteri daha çok konuşmalı' gibi net konuş. Kısa yaz.
+
+Boyut: {label}
+Odak: {focus}
+
+Çıktıyı SADECE geçerli bir JSON olarak ver. Format:
+{{
+  "comment": "Bu boyutun kısa analizi",
+  "suggestion": "SOMUT öneri (Örn: Şu cümleyi ekle...)",
+  "strength": "Bu boyuttaki güçlü yön (tek cümle)",
+  "weakness": "Bu boyuttaki zayıf yön (tek cümle)",
+  "score": 85
+}}
+
+Hikaye:
+{story_text}
+""".strip()
+
+    @staticmethod
+    def _parse_aspect(raw_response: str) -> Dict[str, Any]:
+        data = parse_json_lenient(raw_response)
+        if not isinstance(data, dict) or not data.get("comment"):
+            raise ValueError("Boyut eleştirisi beklenen alanları içermiyor")
+        return data
+
+    # --- tek boyut (tekrar denemeli) ---
+    def _aspect(self, story_text: str, aspect: str) -> Optional[Dict[str, Any]]:
+        prompt = self._build_aspect_prompt(story_text, aspect)
+        for attempt in range(self.max_retries + 1):
+            try:
+                with stage_scope("critic"):
+                    return self._parse_aspect(self.aspect_llm(prompt))
+            except (DeadlineExceeded, OperationCancelled):
+                raise
+            except Exception as e:
+                print(f"⚠️ '{aspect}' eleştirisi alınamadı ({attempt + 1}. deneme): {e}")
+        return None
+
+    async def _aaspect(self, story_text: str, aspect: str) -> Optional[Dict[str, Any]]:
+        prompt = self._build_aspect_prompt(story_text, aspect)
+        for attempt in range(self.max_retries + 1):
+            try:
+                with stage_scope("critic"):
+                    return self._parse_aspect(await acall_llm(self.aspect_llm, prompt))
+            except (DeadlineExceeded, OperationCancelled):
+                raise
+            except Exception as e:
+                print(f"⚠️ '{aspect}' eleştirisi alınamadı ({attempt + 1}. deneme): {e}")
+        return None
+
+    def run(self, story_text: str) -> str:
+        if self._is_safety_refusal(story_text):
+            return self._safety_refusal_feedback()
+
+        with ThreadPoolExecutor(max_workers=len(self.aspects)) as pool:
+            # Her boyut kendi bağlam kopyasında: metrik, süre ve iptal kapsamları thread'e taşınır
+            futures = {
+                aspect: pool.submit(contextvars.copy_context().run, self._aspect, story_text, aspect)
+                for aspect in self.aspects
+            }
+            outcomes = {}
+            for aspect, future in futures.items():
+                try:
+                    outcomes[aspect] = future.result()
+                except DeadlineExceeded as e:
+                    outcomes[aspect] = e
+        return self._merge(outcomes)
+
+    async def arun(self, story_text: str) -> str:
+        if self._is_safety_refusal(story_text):
+            return self._safety_refusal_feedback()
+
+        results = await asyncio.gather(
+            *(self._aaspect(story_text, aspect) for aspect in self.aspects), return_exceptions=True
+        )
+        outcomes = {}
+        for aspect, result in zip(self.aspects, results):
+            if isinstance(result, BaseException) and not isinstance(result, DeadlineExceeded):
+                raise result
+            outcomes[aspect] = result
+        return self._merge(outcomes)
+
+    # --- birleştirme ---
+    def _merge(self, outcomes: Dict[str, Any]) -> str:
+        done = {aspect: data for aspect, data in outcomes.items() if isinstance(data, dict)}
+        if not done:
+            timeouts = [e for e in outcomes.values() if isinstance(e, DeadlineExceeded)]
+            if timeouts:
+                # Hiçbir boyut yetişmediyse süre aşımı pipeline'a iletilir
+                raise timeouts[0]
+            return self._fallback_feedback()
+
+        scores = {}
+        for aspect, data in done.items():
+            try:
+                scores[aspect] = float(data.get("score", 0))
+            except (TypeError, ValueError):
+                scores[aspect] = 0.0
+        weakest = min(scores, key=scores.get)
+        strongest = max(scores, key=scores.get)
+
+        merged: Dict[str, Any] = {
+            "general_evaluation": (
+                f"En güçlü boyut: {ASPECTS[strongest][0]}; en çok gelişime açık boyut: {ASPECTS[weakest][0]}. "
+                + str(done[weakest].get("comment", ""))
+            ).strip(),
+        }
+        for aspect in ASPECTS:
+            data = done.get(aspect, {})
+            merged[aspect] = {"comment": data.get("comment", ""), "suggestion": data.get("suggestion", "")}
+        merged["strengths"] = list(dict.fromkeys(str(d["strength"]) for d in done.values() if d.get("strength")))
+        merged["areas_to_improve"] = list(dict.fromkeys(str(d["weakness"]) for d in done.values() if d.get("weakness")))
+        merged["confidence_score"] = round(sum(scores.values()) / len(scores))
+        merged["next_step_for_writer"] = done[weakest].get("suggestion", "")
+        missing = [a for a in self.aspects if a not in done]
+        if missing:
+            merged["missing_aspects"] = missing
+        return self._format(merged)
@@ -0,0 +1,269 @@
+from __future__ import annotations
+import asyncio
+import contextvars
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from agents.editor_agent import EditorAgent
+from agents.safety import GENERATION_SAFETY_RULES
+from agents.patch_editor import split_paragraphs
+from llm.aio import acall_llm
+from llm.budget import edit_output_limit
+from llm.context import stage_scope
+from llm.deadline import DeadlineExceeded
+from llm.structured import parse_json_lenient
+
+# Eleştirmen JSON'ında öneri taşıyan alanlar
+_SUGGESTION_FIELDS = ("theme", "language", "characters", "plot")
+# Dil önerisi üslupla ilgilidir; her pencereye gider
+_GLOBAL_FIELDS = ("language",)
+_FIRST_HINTS = ("giriş", "başta", "başında", "ilk paragraf", "açılış")
+_LAST_HINTS = ("son paragraf", "sonda", "sonunda", "final", "bitiş", "son bölüm")
+_WORD_RE = re.compile(r"\w{4,}")
+
+
+def _words(text: str) -> set:
+    return {w.lower() for w in _WORD_RE.findall(text)}
+
+
+class ChunkedEditorAgent(EditorAgent):
+    """
+    Uzun taslaklar için parçalı Editör.
+    - Taslak paragraf pencerelerine bölünür (window paragraf); her pencere komşu paragraflarla
+      (overlap) birlikte gönderilir, komşular sadece bağlamdır ve değiştirilmez.
+    - Her pencereye eleştirinin sadece o pencereyle ilgili önerileri gider (konum ipucu
+      -> kelime örtüşmesi; eşleşmeyen öneri tüm pencerelere).
+    - Pencereler eşzamanlı düzenlenir, sonra her ek yerinde (seam) sonraki pencerenin ilk
+      paragrafı öncekine bağlanacak şekilde kısa bir çağrıyla yumuşatılır (ek yerleri de eşzamanlı).
+    Böylece editör süresi yaklaşık 'bir pencere + bir ek yeri' kadardır.
+    min_paragraphs'tan kısa taslaklar tam metin (EditorAgent) yoluyla düzenlenir.
+    """
+
+    def __init__(self, llm: Callable[[str], str], window: int = 3, overlap: int = 1,
+                 min_paragraphs: int = 6, max_concurrency: Optional[int] = None, smooth_seams: bool = True):
+        super().__init__(llm)
+        self.window = max(1, window)
+        self.overlap = max(0, overlap)
+        self.min_paragraphs = max(self.window + 1, min_paragraphs)
+        self.max_concurrency = max_concurrency
+        self.smooth_seams = smooth_seams
+        self._lock = threading.Lock()
+        self._stats = {"chunked": 0, "full": 0, "windows": 0, "seams": 0, "seam_skipped": 0}
+
+    # --- pencereler ve öneri dağıtımı ---
+    def _windows(self, paragraphs: List[str]) -> List[Tuple[int, int]]:
+        return [(start, min(start + self.window, len(paragraphs))) for start in range(0, len(paragraphs), self.window)]
+
+    def _suggestions_for(self, critic_feedback_json: str, paragraphs: List[str],
+                         windows: List[Tuple[int, int]]) -> List[List[str]]:
+        try:
+            feedback = parse_json_lenient(critic_feedback_json, record=False)
+        except ValueError:
+            feedback = {}
+        if not isinstance(feedback, dict):
+            feedback = {}
+        items = []
+        for field in _SUGGESTION_FIELDS:
+            section = feedback.get(field)
+            if isinstance(section, dict) and section.get("suggestion"):
+                items.append((field, str(section["suggestion"])))
+        if feedback.get("next_step_for_writer"):
+            items.append(("next_step", str(feedback["next_step_for_writer"])))
+
+        window_words = [_words(" ".join(paragraphs[start:end])) for start, end in windows]
+        out: List[List[str]] = [[] for _ in windows]
+        for field, suggestion in items:
+            lower = suggestion.lower()
+            if field in _GLOBAL_FIELDS:
+                targets = range(len(windows))
+            elif any(hint in lower for hint in _LAST_HINTS):
+                targets = [len(windows) - 1]
+            elif any(hint in lower for hint in _FIRST_HINTS):
+                targets = [0]
+            else:
+                overlaps = [len(_words(suggestion) & words) for words in window_words]
+                best = max(overlaps)
+                targets = [i for i, score in enumerate(overlaps) if score == best] if best > 0 else range(len(windows))
+            for i in targets:
+                out[i].append(suggestion)
+        return out
+
+    def _build_window_prompt(self, paragraphs: List[str], start: int, end: int, suggestions: List[str]) -> str:
+        before = paragraphs[max(0, start - self.overlap):start]
+        after = paragraphs[end:end + self.overlap]
+        context_before = "\n\n".join(before) or "(Hikayenin başı)"
+        context_after = "\n\n".join(after) or "(Hikayenin sonu)"
+        suggestion_text = "\n".join(f"- {s}" for s in suggestions) or "- Dili akıcı ve edebi hale getir."
+        window_text = "\n\n".join(paragraphs[start:end])
+        return f"""
+Sen yazarlığa yeni başlamış kişilere yardım eden destekleyici bir HİKÂYE EDİTÖRÜ etmensin.
+
+{GENERATION_SAFETY_RULES}
+
+Uzun bir hikayenin sadece bir BÖLÜMÜNÜ düzenliyorsun; diğer bölümleri başka editörler düzenliyor.
+
+Görevin:
+- Aşağıdaki önerileri SADECE 'Düzenlenecek Paragraflar' kısmına uygula.
+- Önceki/sonraki bağlam paragraflarını DEĞİŞTİRME ve tekrar YAZMA; sadece akışı korumak için oku.
+- Temel fikri koru, dili daha edebi ve profesyonel hale getir.
+
+ÇOK ÖNEMLİ BİÇİM KURALLARI (BUNA KESİNLİKLE UY):
+1. Çıktıda ASLA başlık, 'Revize Edilmiş Metin' veya giriş cümlesi yazma.
+2. SADECE düzenlenmiş paragrafları, aralarında boş satır bırakarak yaz.
+
+Öneriler:
+{suggestion_text}
+
+Önceki Bağlam (değiştirme):
+{context_before}
+
+Paragraf sayısı: {end - start}
+Düzenlenecek Paragraflar:
+{window_text}
+
+Sonraki Bağlam (değiştirme):
+{context_after}
+
+Düzenlenmiş Paragraflar:
+""".strip()
+
+    def _build_seam_prompt(self, previous: str, paragraph: str) -> str:
+        return f"""
+Sen bir HİKÂYE EDİTÖRÜSÜN. Bir hikayenin ayrı ayrı düzenlenmiş iki bölümü birleştiriliyor.
+
+Görevin: 'Paragraf' kısmını, 'Önceki Paragraf'tan doğal bir geçişle devam edecek şekilde düzelt.
+- Sadece geçişi yumuşat (tekrarları, kopuk bağlaçları, çelişen ayrıntıları gider); içeriği değiştirme.
+- SADECE düzeltilmiş paragrafı yaz; önceki paragrafı, başlık veya açıklama yazma.
+
+Paragraf sayısı: 1
+Önceki Paragraf:
+{previous}
+
+Paragraf:
+{paragraph}
+
+Düzeltilmiş Paragraf:
+""".strip()
+
+    # --- pencere / ek yeri çağrıları ---
+    def _revise_window(self, prompt: str, original: List[str]) -> List[str]:
+        with stage_scope("editor"):
+            llm = self.caps.get(edit_output_limit("\n\n".join(original)))
+            revised = split_paragraphs(self._clean_output(llm(prompt)))
+        return revised or original
+
+    async def _arevise_window(self, prompt: str, original: List[str], semaphore: asyncio.Semaphore) -> List[str]:
+        async with semaphore:
+            with stage_scope("editor"):
+                llm = self.caps.get(edit_output_limit("\n\n".join(original)))
+                revised = split_paragraphs(self._clean_output(await acall_llm(llm, prompt)))
+        return revised or original
+
+    def _smooth(self, previous: str, paragraph: str) -> str:
+        with stage_scope("editor"):
+            llm = self.caps.get(edit_output_limit(paragraph))
+            smoothed = self._clean_output(llm(self._build_seam_prompt(previous, paragraph)))
+        return smoothed or paragraph
+
+    async def _asmooth(self, previous: str, paragraph: str, semaphore: asyncio.Semaphore) -> str:
+        async with semaphore:
+            with stage_scope("editor"):
+                llm = self.caps.get(edit_output_limit(paragraph))
+                smoothed = self._clean_output(await acall_llm(llm, self._build_seam_prompt(previous, paragraph)))
+        return smoothed or paragraph
+
+    def _plan(self, story_text: str, critic_feedback_json: str) -> Optional[Tuple[List[str], List[Tuple[int, int]], List[str]]]:
+        paragraphs = split_paragraphs(story_text)
+        if len(paragraphs) < self.min_paragraphs:
+            with self._lock:
+                self._stats["full"] += 1
+            return None
+        windows = self._windows(paragraphs)
+        suggestions = self._suggestions_for(critic_feedback_json, paragraphs, windows)
+        prompts = [self._build_window_prompt(paragraphs, start, end, s) for (start, end), s in zip(windows, suggestions)]
+        with self._lock:
+            self._stats["chunked"] += 1
+            self._stats["windows"] += len(windows)
+        return paragraphs, windows, prompts
+
+    def _seams(self, chunks: List[List[str]]) -> List[Tuple[int, str, str]]:
+        # (pencere, önceki paragraf, pencerenin ilk paragrafı)
+        return [(i, chunks[i - 1][-1], chunks[i][0]) for i in range(1, len(chunks))] if self.smooth_seams else []
+
+    def _note_seams(self, done: int, skipped: int) -> None:
+        with self._lock:
+            self._stats["seams"] += done
+            self._stats["seam_skipped"] += skipped
+
+    def revise(self, story_text: str, critic_feedback_json: str) -> str:
+        if "yardımcı olamam" in story_text.lower():
+            return story_text
+        plan = self._plan(story_text, critic_feedback_json)
+        if plan is None:
+            return super().revise(story_text, critic_feedback_json)
+        paragraphs, windows, prompts = plan
+
+        workers = min(len(windows), self.max_concurrency or len(windows))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Her pencere kendi bağlam kopyasında: aşama, metrik, süre ve iptal kapsamları thread'e taşınır
+            futures = [
+                pool.submit(contextvars.copy_context().run, self._revise_window, prompt, paragraphs[start:end])
+                for prompt, (start, end) in zip(prompts, windows)
+            ]
+            chunks = [f.result() for f in futures]
+
+            seams = self._seams(chunks)
+            seam_futures = [
+                (i, pool.submit(contextvars.copy_context().run, self._smooth, previous, first))
+                for i, previous, first in seams
+            ]
+            skipped = 0
+            for i, future in seam_futures:
+                try:
+                    chunks[i][0] = future.result()
+                except DeadlineExceeded:
+                    # Süre yetmezse ek yeri düzeltmesiz kalır; düzenlenmiş pencereler yine kullanılır
+                    skipped += 1
+        self._note_seams(len(seams) - skipped, skipped)
+        return "\n\n".join(p for chunk in chunks for p in chunk)
+
+    async def arevise(self, story_text: str, critic_feedback_json: str) -> str:
+        if "yardımcı olamam" in story_text.lower():
+            return story_text
+        plan = self._plan(story_text, critic_feedback_json)
+        if plan is None:
+            return await super().arevise(story_text, critic_feedback_json)
+        paragraphs, windows, prompts = plan
+
+        semaphore = asyncio.Semaphore(self.max_concurrency or len(windows))
+        chunks = list(await asyncio.gather(
+            *(self._arevise_window(prompt, paragraphs[start:end], semaphore)
+              for prompt, (start, end) in zip(prompts, windows))
+        ))
+        seams = self._seams(chunks)
+        results = await asyncio.gather(
+            *(self._asmooth(previous, first, semaphore) for _, previous, first in seams), return_exceptions=True
+        )
+        skipped = 0
+        for (i, _, _), result in zip(seams, results):
+            if isinstance(result, DeadlineExceeded):
+                skipped += 1
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                chunks[i][0] = result
+        self._note_seams(len(seams) - skipped, skipped)
+        return "\n\n".join(p for chunk in chunks for p in chunk)
+
+    def stream_revise(self, story_text: str, critic_feedback_json: str) -> Iterator[str]:
+        """Kısa taslakta tam metin akışı; parçalı düzenlemede final tek parça halinde verilir."""
+        if len(split_paragraphs(story_text)) < self.min_paragraphs:
+            yield from super().stream_revise(story_text, critic_feedback_json)
+            return
+        yield self.revise(story_text, critic_feedback_json)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
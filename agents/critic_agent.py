@@ -1,8 +1,13 @@
 from __future__ import annotations
 from typing import Callable, Dict, Any
 import json
-import re
-from agents.safety import SafetyGuard
+from llm.aio import acall_llm
+from llm.budget import OutputCaps, minify_json, stage_output_limit
+from llm.context import stage_scope
+from llm.structured import as_json_llm, parse_json_lenient, record_parse
+
+_FALLBACK_EVALUATION = "Sistem hatası: Eleştiri formatı düzeltilemedi."
+
 
 class CriticAgent:
     """
@@ -16,17 +21,17 @@ class CriticAgent:
 
     def __init__(self, llm: Callable[[str], str]):
         self.llm = llm
+        # İstemci destekliyorsa model JSON çıktı modunda, şemanın boyuyla sınırlı çağrılır
+        self.json_llm = OutputCaps(as_json_llm(llm)).get(stage_output_limit("critic"))
 
-    def _clean_json_text(self, text: str) -> str:
-        # Markdown kod bloklarını temizleyelim
-        text = text.replace("```json", "").replace("```", "")
-        return text.strip()
+    def _format(self, parsed: Any) -> str:
+        return json.dumps(parsed, ensure_ascii=False, indent=2)
 
-    def _fix_json_with_llm(self, broken_text: str, error_msg: str) -> str:
+    def _build_repair_prompt(self, broken_text: str, error_msg: str) -> str:
         
         # Model JSON'ı hatalı verirse, hatayı gösterip düzeltmesini isteriz.
         
-        repair_prompt = f"""
+        return f"""
         Aşağıdaki JSON metninde bir format hatası var.
         Hata: {error_msg}
         
@@ -36,18 +41,47 @@ class CriticAgent:
         Görevin:
         Sadece düzeltilmiş, geçerli JSON'ı döndür. Başka açıklama yapma.
         """
-        return self.llm(repair_prompt)
 
-    def run(self, story_text: str) -> str:
-        # Güvenlik reddi varsa eleştirme yapsın
-        if "yardımcı olamam" in story_text.lower() or "güvenlik filtresi" in story_text.lower():
-            return json.dumps({
-                "general_evaluation": "Güvenlik nedeniyle içerik oluşturulamadı.",
-                "strengths": [], "areas_to_improve": [], 
-                "confidence_score": 0, "next_step_for_writer": "Güvenli bir tema seç."
-            }, ensure_ascii=False)
-
-        prompt = f"""
+    def _fix_json_with_llm(self, broken_text: str, error_msg: str) -> str:
+        with stage_scope("critic-repair"):
+            return self.json_llm(self._build_repair_prompt(broken_text, error_msg))
+
+    def _is_safety_refusal(self, story_text: str) -> bool:
+        return "yardımcı olamam" in story_text.lower() or "güvenlik filtresi" in story_text.lower()
+
+    def _safety_refusal_feedback(self) -> str:
+        return json.dumps({
+            "general_evaluation": "Güvenlik nedeniyle içerik oluşturulamadı.",
+            "strengths": [], "areas_to_improve": [], 
+            "confidence_score": 0, "next_step_for_writer": "Güvenli bir tema seç."
+        }, ensure_ascii=False)
+
+    def _fallback_feedback(self) -> str:
+        # Onarım da başarısız olursa (çökmemesi için)
+        return json.dumps({
+            "general_evaluation": _FALLBACK_EVALUATION,
+            "strengths": [], "areas_to_improve": [], "confidence_score": 0,
+            "next_step_for_writer": "Lütfen tekrar deneyin.",
+        }, ensure_ascii=False)
+
+    @staticmethod
+    def is_fallback(feedback: str) -> bool:
+        """
+        Geri bildirim gerçek eleştiri değil de hata sonrası yedek mi? (kayıt/checkpoint'e yazılmaz)
+        Kullanıcıya giden JSON'a işaret eklenmez; yedek, sabit değerlendirme metninden tanınır.
+        Birleşik bölüm eleştirisinde herhangi bir bölüm yedekse sonuç da yedek sayılır.
+        """
+        try:
+            data = parse_json_lenient(feedback, record=False)
+        except (TypeError, ValueError):
+            return False
+        if not isinstance(data, dict):
+            return False
+        reviews = [data] + [c for c in data.get("chapters") or [] if isinstance(c, dict)]
+        return any(review.get("general_evaluation") == _FALLBACK_EVALUATION for review in reviews)
+
+    def _build_prompt(self, story_text: str) -> str:
+        return f"""
         Sen acımasız değil ama çok titiz bir EDEBİ ELEŞTİRMENSİN.
         
         Görevin: Hikayeyi analiz et ve Editörün işini kolaylaştıracak SOMUT öneriler ver.
@@ -87,28 +121,83 @@ class CriticAgent:
         {story_text}
         """
 
-        raw_response = self.llm(prompt)
-        cleaned_response = self._clean_json_text(raw_response)
+    def run(self, story_text: str) -> str:
+        # Güvenlik reddi varsa eleştirme yapsın
+        if self._is_safety_refusal(story_text):
+            return self._safety_refusal_feedback()
+
+        with stage_scope("critic"):
+            raw_response = self.json_llm(self._build_prompt(story_text))
+        return self._complete(raw_response)
+
+    def _complete(self, raw_response: str) -> str:
+        # Önce yerel (katı + toleranslı) ayrıştırma; sadece o da başarısızsa LLM onarımı
+        try:
+            return self._format(parse_json_lenient(raw_response))
+        except ValueError as e:
+            print(f"⚠️ JSON hatası algılandı: {e}. Onarılıyor...")
+            fixed_response = self._fix_json_with_llm(raw_response, str(e))
+            return self._parse_repaired(fixed_response)
+
+    async def arun(self, story_text: str) -> str:
+        """
+        run'ın asenkron sürümü. Onarım çağrısı da asenkron yapılır.
+        """
+        if self._is_safety_refusal(story_text):
+            return self._safety_refusal_feedback()
+
+        with stage_scope("critic"):
+            raw_response = await acall_llm(self.json_llm, self._build_prompt(story_text))
+        return await self._acomplete(raw_response)
 
-        # JSON PARSE VE RETRY MEKANİZMASI
+    async def _acomplete(self, raw_response: str) -> str:
         try:
-            # Önce parse etmeyi dene
-            parsed = json.loads(cleaned_response)
-            return json.dumps(parsed, ensure_ascii=False, indent=2)
-        except json.JSONDecodeError as e:
-            # Hata varsa: 1 kereye mahsus modeli tekrar çağırıp düzelttir
+            return self._format(parse_json_lenient(raw_response))
+        except ValueError as e:
             print(f"⚠️ JSON hatası algılandı: {e}. Onarılıyor...")
-            fixed_response = self._fix_json_with_llm(cleaned_response, str(e))
-            cleaned_fixed = self._clean_json_text(fixed_response)
-            
-            try:
-                # Tekrar dene
-                parsed = json.loads(cleaned_fixed)
-                return json.dumps(parsed, ensure_ascii=False, indent=2)
-            except Exception:
-                # Yine olmazsa fallback (çökmemesi için)
-                return json.dumps({
-                    "general_evaluation": "Sistem hatası: Eleştiri formatı düzeltilemedi.",
-                    "strengths": [], "areas_to_improve": [], "confidence_score": 0,
-                    "next_step_for_writer": "Lütfen tekrar deneyin."
-                }, ensure_ascii=False)
\ No newline at end of file
+            with stage_scope("critic-repair"):
+                fixed_response = await acall_llm(self.json_llm, self._build_repair_prompt(raw_response, str(e)))
+            return self._parse_repaired(fixed_response)
+
+    # --- Revizyon turu: sadece değişen kısım değerlendirilir ---
+    def _build_revision_prompt(self, diff_text: str, previous_feedback: str) -> str:
+        return f"""
+        Sen acımasız değil ama çok titiz bir EDEBİ ELEŞTİRMENSİN.
+
+        Daha önce değerlendirdiğin bir hikaye, senin önerilerine göre revize edildi.
+        Sana hikayenin TAMAMI değil, sadece değişen cümleler (fark) veriliyor:
+        '-' ile başlayan satırlar çıkarılan, '+' ile başlayan satırlar eklenen cümlelerdir.
+
+        Görevin: Önceki değerlendirmeni bu değişikliklere göre GÜNCELLE.
+        - Önerilerin uygulandıysa puanı buna göre artır; uygulanmayanları tekrar öner.
+        - Değişmeyen kısımlar için önceki yorumların geçerlidir.
+
+        Çıktıyı SADECE önceki değerlendirmeyle AYNI JSON formatında ver.
+
+        Önceki Değerlendirme (JSON):
+        {minify_json(previous_feedback)}
+
+        Değişiklikler:
+        {diff_text}
+        """
+
+    def review_revision(self, diff_text: str, previous_feedback: str) -> str:
+        """Revize edilmiş metni sadece farkı (diff) üzerinden yeniden değerlendirir; run ile aynı JSON."""
+        with stage_scope("critic"):
+            raw_response = self.json_llm(self._build_revision_prompt(diff_text, previous_feedback))
+        return self._complete(raw_response)
+
+    async def areview_revision(self, diff_text: str, previous_feedback: str) -> str:
+        with stage_scope("critic"):
+            raw_response = await acall_llm(self.json_llm, self._build_revision_prompt(diff_text, previous_feedback))
+        return await self._acomplete(raw_response)
+
+    def _parse_repaired(self, fixed_response: str) -> str:
+        try:
+            # Tekrar dene
+            parsed = parse_json_lenient(fixed_response, record=False)
+        except ValueError:
+            record_parse("llm_repair_failed")
+            return self._fallback_feedback()
+        record_parse("llm_repair")
+        return self._format(parsed)
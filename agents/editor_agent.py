@@ -1,5 +1,11 @@
 from __future__ import annotations
-from typing import Callable
+from typing import Callable, Iterator
+from llm.aio import acall_llm
+from llm.budget import OutputCaps, compact_feedback, edit_output_limit
+from llm.context import stage_scope
+from llm.streaming import stream_llm
+from agents.safety import GENERATION_SAFETY_RULES
+from agents.streaming import clean_stream
 
 
 class EditorAgent:
@@ -12,25 +18,52 @@ class EditorAgent:
 
     def __init__(self, llm: Callable[[str], str]):
         self.llm = llm
+        # Çıktı, düzenlenen metnin boyuna göre sınırlanır (max_output_tokens)
+        self.caps = OutputCaps(llm)
 
     def revise(self, story_text: str, critic_feedback_json: str) -> str:
         # Eğer hikaye zaten güvenlik nedeniyle üretilemediyse:
         if "yardımcı olamam" in story_text.lower():
             return story_text
 
-        prompt = f"""
+        # LLM'i çağır ve boşlukları temizle
+        with stage_scope("editor"):
+            raw_text = self.caps.get(edit_output_limit(story_text))(self._build_prompt(story_text, critic_feedback_json))
+        return self._clean_output(raw_text)
+
+    async def arevise(self, story_text: str, critic_feedback_json: str) -> str:
+        """
+        revise'ın asenkron sürümü.
+        """
+        if "yardımcı olamam" in story_text.lower():
+            return story_text
+
+        with stage_scope("editor"):
+            raw_text = await acall_llm(
+                self.caps.get(edit_output_limit(story_text)), self._build_prompt(story_text, critic_feedback_json)
+            )
+        return self._clean_output(raw_text)
+
+    def stream_revise(self, story_text: str, critic_feedback_json: str) -> Iterator[str]:
+        """
+        revise'ın akış sürümü: temizlenmiş final metni geldikçe parça parça verir.
+        """
+        if "yardımcı olamam" in story_text.lower():
+            yield story_text
+            return
+
+        prompt = self._build_prompt(story_text, critic_feedback_json)
+        yield from clean_stream(stream_llm(self.caps.get(edit_output_limit(story_text)), prompt, stage="editor"), self._is_meta_line)
+
+    def _build_prompt(self, story_text: str, critic_feedback_json: str) -> str:
+        return f"""
 Sen yazarlığa yeni başlamış kişilere yardım eden destekleyici bir HİKÂYE EDİTÖRÜ etmensin.
 
-GÜVENLİK VE ETİK KURALLAR:
-- Nefret söylemi, taciz, hedef gösterme üretme.
-- Kendine zarar verme / intihar teşviki üretme.
-- Reşit olmayanları içeren cinsel içerik üretme.
-- Yasadışı/tehlikeli eylemlere yönlendirme yapma.
-- Kişisel verileri isteme/yayma yapma.
+{GENERATION_SAFETY_RULES}
 
 Sana:
 1) Bir hikaye taslağı
-2) Bu hikayeye ait bir eleştirmen geri bildirimi (JSON)
+2) Bu hikayeye ait eleştirmen önerileri (JSON)
 
 verilecek.
 
@@ -50,34 +83,33 @@ Hikaye Taslağı:
 {story_text}
 
 Eleştirmen Geri Bildirimi (JSON):
-{critic_feedback_json}
+{compact_feedback(critic_feedback_json)}
 
 Geliştirilmiş Hikaye:
 """.strip()
 
-        # LLM'i çağır ve boşlukları temizle
-        raw_text = self.llm(prompt).strip()
+    @staticmethod
+    def _is_meta_line(lower_line: str) -> bool:
+        # Başlık satırlarını atla
+        if lower_line.startswith("başlık:") or lower_line.startswith("**başlık"):
+            return True
+
+        # "Revize edilmiş metin:" gibi başlıkları atla
+        if lower_line.startswith("revize") or lower_line.startswith("geliştirilmiş"):
+            return True
+
+        # "İşte hikayeniz" tarzı sohbet cümlelerini atla
+        if "işte" in lower_line and "hikaye" in lower_line:
+            return True
+
+        return False
+
+    def _clean_output(self, raw_text: str) -> str:
+        raw_text = raw_text.strip()
 
         # Manuel Temizlik (Fallback): Eğer model hala inatla "Başlık:" veya "Revize Metin:" gibi şeyler yazarsa onları siliyoruz.
         lines = raw_text.split('\n')
-        cleaned_lines = []
-        
-        for line in lines:
-            lower_line = line.lower().strip()
-            
-            # Başlık satırlarını atla
-            if lower_line.startswith("başlık:") or lower_line.startswith("**başlık"):
-                continue
-            
-            # "Revize edilmiş metin:" gibi başlıkları atla
-            if lower_line.startswith("revize") or lower_line.startswith("geliştirilmiş"):
-                continue
-                
-            # "İşte hikayeniz" tarzı sohbet cümlelerini atla
-            if "işte" in lower_line and "hikaye" in lower_line:
-                continue
-                
-            cleaned_lines.append(line)
+        cleaned_lines = [line for line in lines if not self._is_meta_line(line.lower().strip())]
 
         # Temizlenmiş satırları birleştir
         final_story_text = "\n".join(cleaned_lines).strip()
@@ -0,0 +1,167 @@
+from __future__ import annotations
+import re
+from functools import lru_cache
+from math import comb
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# SafetyGuard ile aynı token tanımı
+_TOKEN_RE = re.compile(r"[a-zA-ZçğıöşüÇĞİÖŞÜ]+")
+
+# (kelime, kategori, tolerans_miktarı, skor)
+KeywordEntry = Tuple[str, str, int, int]
+
+
+def bounded_levenshtein(a: str, b: str, max_dist: int) -> int:
+    """
+    Levenshtein mesafesi; sonuç max_dist'i aşacaksa erken çıkıp max_dist + 1 döner.
+    Sadece ana köşegen etrafındaki ±max_dist bantlık hücreler hesaplanır.
+    """
+    if a == b: return 0
+    la, lb = len(a), len(b)
+    if abs(la - lb) > max_dist: return max_dist + 1
+    if not a or not b: return max(la, lb)
+    over = max_dist + 1
+    prev = list(range(lb + 1))
+    for i in range(1, la + 1):
+        ca = a[i - 1]
+        lo = max(1, i - max_dist)
+        hi = min(lb, i + max_dist)
+        curr = [over] * (lb + 1)
+        curr[0] = i if i <= max_dist else over
+        row_min = curr[0]
+        for j in range(lo, hi + 1):
+            v = min(curr[j - 1] + 1, prev[j] + 1, prev[j - 1] + (ca != b[j - 1]))
+            if v > over: v = over
+            curr[j] = v
+            if v < row_min: row_min = v
+        if row_min > max_dist:
+            return over
+        prev = curr
+    return min(prev[lb], over)
+
+
+@lru_cache(maxsize=8192)
+def _deletes(term: str, depth: int) -> Tuple[Tuple[str, int], ...]:
+    """term'den en fazla `depth` harf silinerek elde edilen varyantlar ve silme sayıları."""
+    seen = {term: 0}
+    frontier = [term]
+    for d in range(1, depth + 1):
+        nxt = []
+        for word in frontier:
+            for i in range(len(word)):
+                v = word[:i] + word[i + 1:]
+                if v not in seen:
+                    seen[v] = d
+                    nxt.append(v)
+        frontier = nxt
+    return tuple(seen.items())
+
+
+class FuzzyKeywordMatcher:
+    """
+    SafetyGuard._FUZZY_KEYWORDS için önceden derlenmiş bulanık eşleştirici (silme indeksi).
+
+    Levenshtein(t, k) <= d ise t ve k'den en fazla d harf silinerek ortak bir dizgeye
+    ulaşılabilir. Her anahtar kelimenin kendi toleransı kadar silme varyantı indekslenir;
+    sorguda tokenın varyantları sözlükten aranır ve sadece aday anahtarlar bantlı
+    mesafeyle doğrulanır. Böylece maliyet anahtar listesinin boyutundan neredeyse bağımsızdır.
+
+    - Metin tek sefer tokenize edilir, tekrar eden tokenlar bir kez sorgulanır.
+    - Tek tokenlar tüm anahtarlara karşı sorgulanır (eski davranış: "kafakesme" -> "kafa kesme");
+      n-kelimelik pencereler ise sadece n kelimelik anahtarlara karşı sorgulanır
+      ("kafa kesme", "seri katil" artık iki ayrı token olarak da yakalanır).
+    - Birden fazla anahtar eşleşirse listede ilk sıradaki döner (eski döngüyle aynı öncelik).
+    """
+
+    def __init__(self, keywords: Sequence[KeywordEntry]):
+        self.keywords = [(kw.lower(), cat, max_dist, score) for kw, cat, max_dist, score in keywords]
+        # kelime sayısı -> {silme varyantı: [(anahtar indeksi, silme sayısı), ...]}
+        self._index: Dict[int, Dict[str, List[Tuple[int, int]]]] = {}
+        # kelime sayısı -> {uzunluk: [anahtar indeksleri]} (küçük aday kümelerinde doğrudan kontrol için)
+        self._by_len: Dict[int, Dict[int, List[int]]] = {}
+        self._max_dist: Dict[int, int] = {}
+        for idx, (kw, _cat, max_dist, _score) in enumerate(self.keywords):
+            n_words = len(kw.split())
+            self._by_len.setdefault(n_words, {}).setdefault(len(kw), []).append(idx)
+            bucket = self._index.setdefault(n_words, {})
+            for variant, d in _deletes(kw, max_dist):
+                bucket.setdefault(variant, []).append((idx, d))
+            self._max_dist[n_words] = max(self._max_dist.get(n_words, 0), max_dist)
+        self._token_cache: Dict[Tuple[str, bool], int] = {}
+
+    def _best_for(self, term: str, single_token: bool) -> int:
+        """Terime uyan en öncelikli anahtarın indeksi (yoksa len(keywords))."""
+        key = (term, single_token)
+        cached = self._token_cache.get(key)
+        if cached is not None:
+            return cached
+
+        groups = list(self._index) if single_token else [len(term.split())]
+        groups = [n for n in groups if n in self._index]
+        depth = max((self._max_dist[n] for n in groups), default=0)
+
+        # Uzunluğu uyumlu anahtar sayısı azsa (küçük listeler) doğrudan doğrulamak,
+        # tokenın tüm silme varyantlarını üretmekten ucuzdur.
+        length = len(term)
+        nearby = []
+        for n_words in groups:
+            by_len = self._by_len[n_words]
+            k = self._max_dist[n_words]
+            for l in range(length - k, length + k + 1):
+                nearby.extend(by_len.get(l, ()))
+        n_variants = sum(comb(length, d) for d in range(depth + 1))
+
+        if len(nearby) * 8 <= n_variants:
+            candidates = {idx for idx in nearby if abs(len(self.keywords[idx][0]) - length) <= self.keywords[idx][2]}
+        else:
+            candidates = set()
+            for variant, dt in _deletes(term, depth):
+                for n_words in groups:
+                    for idx, _dk in self._index[n_words].get(variant, ()):
+                        if dt <= self.keywords[idx][2]:
+                            candidates.add(idx)
+
+        best = len(self.keywords)
+        for idx in sorted(candidates):
+            kw, _cat, max_dist, _score = self.keywords[idx]
+            if bounded_levenshtein(term, kw, max_dist) <= max_dist:
+                best = idx
+                break
+
+        if len(self._token_cache) > 4096:
+            self._token_cache.clear()
+        self._token_cache[key] = best
+        return best
+
+    def match(self, text: str) -> Optional[Tuple[str, str, int]]:
+        """Eşleşme varsa (kategori, anahtar_kelime, skor), yoksa None."""
+        if not text or not self.keywords:
+            return None
+        tokens = _TOKEN_RE.findall(text.lower())
+        if not tokens:
+            return None
+
+        best = len(self.keywords)
+        for tok in set(tokens):
+            best = min(best, self._best_for(tok, True))
+
+        for n_words in self._index:
+            if n_words < 2 or best == 0:
+                continue
+            for i in range(len(tokens) - n_words + 1):
+                best = min(best, self._best_for(" ".join(tokens[i:i + n_words]), False))
+
+        if best >= len(self.keywords):
+            return None
+        kw, cat, _max_dist, score = self.keywords[best]
+        return cat, kw, score
+
+
+@lru_cache(maxsize=8)
+def _compile(keywords: Tuple[KeywordEntry, ...]) -> FuzzyKeywordMatcher:
+    return FuzzyKeywordMatcher(keywords)
+
+
+def compile_matcher(keywords: Sequence[KeywordEntry]) -> FuzzyKeywordMatcher:
+    """Aynı anahtar listesi için derlenmiş eşleştiriciyi süreç genelinde paylaşır."""
+    return _compile(tuple(keywords))
@@ -0,0 +1,289 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import re
+
+from agents.fuzzy_matcher import bounded_levenshtein
+
+# Yerel (çevrimdışı) Türkçe normalleştirici: ASCII ile yazılmış Türkçe kelimeleri düzeltir,
+# başlık/isimleri Türkçe kurallarıyla büyütür ve bilinen eser/tür adlarını tanır.
+# Emin olamadığı girdilerde düşük güven skoru döner; o zaman LLM düzeltmesine gidilir.
+
+_WORD_RE = re.compile(r"[A-Za-zÇĞİÖŞÜçğıöşü]+|[^A-Za-zÇĞİÖŞÜçğıöşü]+")
+_TURKISH_CHARS = set("çğıöşüÇĞİÖŞÜ")
+_ASCII_FOLD = str.maketrans("çğıöşüÇĞİÖŞÜ", "cgiosuCGIOSU")
+
+# Başlıkta küçük kalan bağlaçlar (ilk kelime hariç)
+_SMALL_WORDS = {"ve", "ile", "ya", "da", "de", "ki", "mi", "veya"}
+
+# --- Sözlükler ---
+# Hikaye girdilerinde sık geçen kelimeler (doğru Türkçe yazımlarıyla)
+_LEXICON_WORDS = """
+aşk kayıp umut değişim özgürlük yalnızlık dostluk arkadaşlık aile anne baba kardeş çocuk
+çocukluk gençlik yaşlılık ölüm yaşam hayat ölümsüz savaş barış intikam ihanet sadakat güven
+korku cesaret kahraman kötü iyi kötülük iyilik gizem sır sırlar rüya rüyalar kabus gece gündüz
+sabah akşam güneş ay yıldız yıldızlar gökyüzü deniz dağ orman şehir köy ev okul yol yolculuk
+macera keşif hazine ejderha büyü büyücü cadı prens prenses kral kraliçe şövalye savaşçı
+kayıp kırık pencere kapı anahtar ayna gölge ışık karanlık sessizlik çığlık fısıltı zaman
+geçmiş gelecek bugün yarın dün hatıra anı anılar özlem hasret veda dönüş kaçış arayış
+kurtuluş kader şans mutluluk hüzün üzüntü öfke kıskançlık pişmanlık affetmek af sevgi
+nefret yalan gerçek doğruluk adalet suç ceza dedektif katil cinayet polis soruşturma
+küçük büyük eski yeni son ilk kırmızı mavi yeşil sarı siyah beyaz altın gümüş
+kış yaz bahar sonbahar ilkbahar kar yağmur rüzgar fırtına ateş su toprak hava
+bilim teknoloji robot uzay gezegen uzaylı yapay zeka makine insan insanlık dünya
+müzik şarkı resim kitap mektup hikaye masal efsane destan şiir
+kalp ruh beden akıl düş düşler hayal hayaller sonsuz sonsuzluk yalnız
+değişim dönüşüm büyüme olgunlaşma kimlik aidiyet göç sürgün vatan özgür esaret
+dram drama fantastik korku bilim kurgu macera gizem polisiye romantik komedi tarih tarihi
+gerilim distopya ütopya mitoloji masal efendisi yüzüklerin madonna kürk mantolu simyacı
+sefiller sineklerin tanrısı şeker portakalı fareler insanlar savaş barış
+ve ile veya ya da de ki mi bir bu
+""".split()
+
+# ASCII'ye indirgenmiş yazım -> doğru Türkçe yazım
+_LEXICON: Dict[str, str] = {}
+for _w in _LEXICON_WORDS:
+    _LEXICON.setdefault(_w.translate(_ASCII_FOLD).lower(), _w)
+
+# Bilinen eser adları (ASCII'ye indirgenmiş anahtar -> doğru yazım)
+_KNOWN_TITLES = {
+    "kucuk prens": "Küçük Prens",
+    "harry potter": "Harry Potter",
+    "suc ve ceza": "Suç ve Ceza",
+    "sefiller": "Sefiller",
+    "kurk mantolu madonna": "Kürk Mantolu Madonna",
+    "simyaci": "Simyacı",
+    "yuzuklerin efendisi": "Yüzüklerin Efendisi",
+    "seker portakali": "Şeker Portakalı",
+    "fareler ve insanlar": "Fareler ve İnsanlar",
+    "sineklerin tanrisi": "Sineklerin Tanrısı",
+    "savas ve baris": "Savaş ve Barış",
+    "dorian grayin portresi": "Dorian Gray'in Portresi",
+    "alice harikalar diyarinda": "Alice Harikalar Diyarında",
+    "pinokyo": "Pinokyo",
+    "kirmizi baslikli kiz": "Kırmızı Başlıklı Kız",
+    "pamuk prenses": "Pamuk Prenses",
+    "kulkedisi": "Külkedisi",
+}
+
+# Türler (ASCII'ye indirgenmiş yazım -> standart ad)
+_KNOWN_GENRES = {
+    "dram": "Dram",
+    "drama": "Dram",
+    "fantastik": "Fantastik",
+    "fantezi": "Fantastik",
+    "korku": "Korku",
+    "bilim kurgu": "Bilim Kurgu",
+    "bilimkurgu": "Bilim Kurgu",
+    "macera": "Macera",
+    "gizem": "Gizem",
+    "polisiye": "Polisiye",
+    "romantik": "Romantik",
+    "komedi": "Komedi",
+    "tarihi": "Tarihi",
+    "tarih": "Tarihi",
+    "gerilim": "Gerilim",
+    "distopya": "Distopya",
+    "distopik": "Distopya",
+    "masal": "Masal",
+    "mitoloji": "Mitoloji",
+}
+
+# Sık karakter isimleri (ASCII'ye indirgenmiş -> doğru yazım)
+_KNOWN_NAMES: Dict[str, str] = {}
+for _n in """
+Ahmet Mehmet Mustafa Ali Ayşe Fatma Zeynep Elif Emine Hatice Aynur Nurgül Gül Gülşen Şule
+Şeyma Özge Özlem Öykü Ümit Çağla Çağrı Çiğdem Doğa Doğan Ege Deniz Efe Emre Can Cem Burak
+Büşra Selin Seda Serkan Sinan Murat Kemal Hüseyin Hasan İbrahim İsmail İlker İrem Ilgın Işık
+Ömer Oğuz Oğuzhan Tuğba Tuğçe Yağmur Yiğit Kağan Barış Bahar Defne Ece Esra Merve Kübra
+Gökhan Gökçe Gizem Nazlı Nilüfer Sıla Sude Tülin Ufuk Ülkü Yusuf Zehra Leyla Mecnun Kerem Aslı
+Harry Hermione Ron Alice Dorian Frodo Gandalf
+""".split():
+    _KNOWN_NAMES.setdefault(_n.translate(_ASCII_FOLD).lower(), _n)
+
+# Kök + ek ayrıştırması için ASCII ekler. "I" büyük ünlü uyumuyla (ı/i/u/ü) çözülür.
+_SUFFIXES = ("larI", "lerI", "lar", "ler", "nIn", "In", "sI", "I")
+# Ünlüyle başlayan ek alınca yumuşayan sert ünsüzler: ASCII yazımdaki harf -> (kökteki, ekli hali)
+_SOFTENED = {"g": ("k", "ğ"), "c": ("ç", "c"), "d": ("t", "d"), "b": ("p", "b")}
+
+CONFIDENCE_THRESHOLD = 0.8
+
+
+@dataclass
+class NormalizationResult:
+    fields: Dict[str, object]
+    confidence: float
+    uncertain: List[str] = field(default_factory=list)  # emin olunamayan kelimeler
+
+
+# --- Türkçe büyük/küçük harf ---
+def tr_lower(text: str) -> str:
+    return text.replace("I", "ı").replace("İ", "i").lower()
+
+
+def tr_upper(text: str) -> str:
+    return text.replace("i", "İ").replace("ı", "I").upper()
+
+
+def tr_capitalize(word: str) -> str:
+    return tr_upper(word[:1]) + tr_lower(word[1:]) if word else word
+
+
+def tr_title(text: str) -> str:
+    """Türkçe 'Title Case': her kelimenin ilk harfi büyük, bağlaçlar (ilk kelime hariç) küçük."""
+    out = []
+    first = True
+    for part in _WORD_RE.findall(text):
+        if not part[0].isalpha():
+            out.append(part)
+            continue
+        lower = tr_lower(part)
+        out.append(lower if (not first and lower in _SMALL_WORDS) else tr_capitalize(lower))
+        first = False
+    return "".join(out)
+
+
+def ascii_fold(text: str) -> str:
+    return tr_lower(text).translate(_ASCII_FOLD)
+
+
+# --- Deasciifier ---
+def _harmony_vowel(stem: str) -> str:
+    """Büyük ünlü uyumu: kökün son ünlüsüne göre ı/i/u/ü."""
+    for ch in reversed(stem):
+        if ch in "aı": return "ı"
+        if ch in "ei": return "i"
+        if ch in "ou": return "u"
+        if ch in "öü": return "ü"
+    return "i"
+
+
+def _deasciify_word(word: str) -> Tuple[str, bool]:
+    """
+    Tek kelimeyi (küçük harf) Türkçeleştirir. (sonuç, emin_mi) döner.
+    Önce sözlük, sonra kök + ek tablosu (ünsüz yumuşaması dahil) denenir; ikisi de
+    tutmazsa kelime olduğu gibi ama "emin değil" olarak döner.
+    """
+    if any(ch in _TURKISH_CHARS for ch in word):
+        return word, True  # kullanıcı zaten Türkçe karakter kullanmış
+    if word in _LEXICON:
+        return _LEXICON[word], True
+    for suffix in _SUFFIXES:
+        pattern = suffix.replace("I", "i")
+        if len(word) > len(pattern) + 1 and word.endswith(pattern):
+            key = word[:-len(pattern)]
+            stem = _LEXICON.get(key)
+            if stem:
+                return stem + suffix.replace("I", _harmony_vowel(stem)), True
+            if suffix[0] == "I" and key[-1] in _SOFTENED:
+                hard, soft = _SOFTENED[key[-1]]
+                stem = _LEXICON.get(key[:-1] + hard.translate(_ASCII_FOLD))
+                if stem and stem.endswith(hard):
+                    return stem[:-1] + soft + suffix.replace("I", _harmony_vowel(stem)), True
+    return word, False
+
+
+def deasciify(text: str) -> Tuple[str, List[str]]:
+    """Metindeki kelimeleri Türkçeleştirir; (sonuç, emin olunamayan kelimeler) döner."""
+    out, uncertain = [], []
+    for part in _WORD_RE.findall(text):
+        if not part[0].isalpha():
+            out.append(part)
+            continue
+        # Türkçe karakter yoksa kelime ASCII yazılmıştır: "I" -> "ı" değil "i" olarak küçültülür
+        typed_turkish = any(ch in _TURKISH_CHARS for ch in part)
+        fixed, sure = _deasciify_word(tr_lower(part) if typed_turkish else part.lower())
+        if not sure:
+            # Emin olunamayan kelime kullanıcının yazdığı gibi kalır (düzeltmeyi LLM yapar)
+            uncertain.append(part)
+            out.append(part)
+            continue
+        # Orijinal büyük harf konumu korunur
+        if part[:1].isupper():
+            fixed = tr_capitalize(fixed)
+        out.append(fixed)
+    return "".join(out), uncertain
+
+
+def _lookup(text: str, table: Dict[str, str]) -> Optional[str]:
+    """
+    Sözlükte tam (ASCII'ye indirgenmiş) eşleşme ya da aynı uzunlukta tek harf hatalı eşleşme arar.
+    Harf eklenmiş/eksik yazımlar eşlenmez: "Küçük Prenses" bilinen "Küçük Prens" değildir.
+    """
+    key = " ".join(ascii_fold(text).split())
+    if not key:
+        return None
+    if key in table:
+        return table[key]
+    if len(key) < 5:
+        return None
+    for cand, value in table.items():
+        if len(cand) == len(key) and bounded_levenshtein(key, cand, 1) <= 1:
+            return value
+    return None
+
+
+class TurkishNormalizer:
+    """
+    Yazım düzeltmenin mekanik kısmını yerelde yapar (ağ çağrısı yok):
+    - title: bilinen eser adı ya da Türkçeleştirilmiş + Title Case
+    - genre: bilinen tür adı ya da Türkçeleştirilmiş + Title Case
+    - theme: Türkçeleştirilir (büyük/küçük harf korunur)
+    - characters: bilinen isim ya da Türkçe kurallarıyla baş harfi büyütülür
+
+    Güven skoru, emin olunan kelimelerin tüm kelimelere oranıdır (0-1). Emin olunamayan tek
+    bir kelime bile varsa sonuç yeterli sayılmaz (LLM düzeltmesine gidilir).
+    """
+
+    def __init__(self, threshold: float = CONFIDENCE_THRESHOLD):
+        self.threshold = threshold
+
+    def normalize(self, user_input: Dict) -> NormalizationResult:
+        fields: Dict[str, object] = {}
+        uncertain: List[str] = []
+        total = 0
+
+        for key in ("title", "genre"):
+            value = str(user_input.get(key) or "").strip()
+            if not value:
+                continue
+            known = _lookup(value, _KNOWN_TITLES if key == "title" else _KNOWN_GENRES)
+            words = len(value.split())
+            total += words
+            if known:
+                fields[key] = known
+                continue
+            fixed, unsure = deasciify(value)
+            fields[key] = tr_title(fixed)
+            uncertain.extend(unsure)
+
+        theme = str(user_input.get("theme") or "").strip()
+        if theme:
+            fixed, unsure = deasciify(theme)
+            fields["theme"] = fixed
+            total += len(theme.split())
+            uncertain.extend(unsure)
+
+        characters = user_input.get("characters")
+        if isinstance(characters, list):
+            names = []
+            for name in characters:
+                name = str(name).strip()
+                if not name:
+                    continue
+                total += 1
+                known = _KNOWN_NAMES.get(ascii_fold(name))
+                if known:
+                    names.append(known)
+                    continue
+                fixed, unsure = deasciify(name)
+                names.append(tr_title(fixed))
+                if unsure:
+                    uncertain.append(name)
+            fields["characters"] = names
+
+        confidence = 1.0 if total == 0 else max(0.0, 1.0 - len(uncertain) / total)
+        return NormalizationResult(fields=fields, confidence=round(confidence, 3), uncertain=uncertain)
+
+    def is_confident(self, result: NormalizationResult) -> bool:
+        return not result.uncertain and result.confidence >= self.threshold
@@ -0,0 +1,192 @@
+from __future__ import annotations
+import re
+import threading
+from typing import Any, Callable, Dict, Iterator, List
+
+from agents.editor_agent import EditorAgent
+from agents.safety import GENERATION_SAFETY_RULES
+from llm.aio import acall_llm
+from llm.budget import OutputCaps, compact_feedback, edit_output_limit
+from llm.cancel import OperationCancelled
+from llm.context import stage_scope
+from llm.deadline import DeadlineExceeded
+from llm.structured import as_json_llm, parse_json_lenient
+
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+_MARKER = re.compile(r"^\[P\d+\]\s*")
+_OPS = ("replace", "insert_after", "delete")
+
+
+class PatchError(ValueError):
+    """Editörün düzenleme listesi uygulanamadı (geçersiz işlem, paragraf numarası ya da metin)."""
+
+
+def split_paragraphs(text: str) -> List[str]:
+    return [p.strip() for p in _PARAGRAPH_SPLIT.split(text.strip()) if p.strip()]
+
+
+def number_paragraphs(paragraphs: List[str]) -> str:
+    """Taslağı editöre paragraf numaralarıyla verir: "[P1] ..."."""
+    return "\n\n".join(f"[P{i}] {p}" for i, p in enumerate(paragraphs, start=1))
+
+
+def _clean_paragraph(text: str) -> str:
+    # Model paragraf numarasını ya da başlık/giriş satırını tekrar ederse silinir
+    text = _MARKER.sub("", text.strip())
+    lines = [line for line in text.split("\n") if not EditorAgent._is_meta_line(line.lower().strip())]
+    return "\n".join(lines).strip()
+
+
+def apply_edits(paragraphs: List[str], edits: Any) -> str:
+    """
+    Düzenlemeleri özgün paragraf numaralarına göre uygular ve yeni metni döndürür.
+    - {"op": "replace", "paragraph": n, "text": "..."}
+    - {"op": "insert_after", "paragraph": n, "text": "..."}  (n = 0: en başa)
+    - {"op": "delete", "paragraph": n}
+    Doğrulama: bilinen işlem, aralıktaki numara, boş olmayan metin, aynı paragrafa tek
+    replace/delete, sonuçta en az bir paragraf. Aksi halde PatchError.
+    """
+    if not isinstance(edits, list):
+        raise PatchError("'edits' bir liste olmalı")
+    count = len(paragraphs)
+    replaced: Dict[int, str] = {}
+    deleted = set()
+    inserted: Dict[int, List[str]] = {}
+    for edit in edits:
+        if not isinstance(edit, dict) or edit.get("op") not in _OPS:
+            raise PatchError(f"Geçersiz işlem: {edit!r}")
+        op = edit["op"]
+        try:
+            index = int(edit.get("paragraph"))
+        except (TypeError, ValueError):
+            raise PatchError(f"Geçersiz paragraf numarası: {edit.get('paragraph')!r}")
+        low = 0 if op == "insert_after" else 1
+        if not low <= index <= count:
+            raise PatchError(f"Paragraf numarası aralık dışında: {index} (1-{count})")
+        if op == "delete":
+            if index in replaced or index in deleted:
+                raise PatchError(f"P{index} birden fazla kez değiştirildi")
+            deleted.add(index)
+            continue
+        text = _clean_paragraph(str(edit.get("text") or ""))
+        if not text:
+            raise PatchError(f"P{index} için boş metin")
+        if op == "replace":
+            if index in replaced or index in deleted:
+                raise PatchError(f"P{index} birden fazla kez değiştirildi")
+            replaced[index] = text
+        else:
+            inserted.setdefault(index, []).append(text)
+
+    out = list(inserted.get(0, []))
+    for index, paragraph in enumerate(paragraphs, start=1):
+        if index not in deleted:
+            out.append(replaced.get(index, paragraph))
+        out.extend(inserted.get(index, []))
+    if not out:
+        raise PatchError("Düzenleme sonrası metin boş kaldı")
+    return "\n\n".join(out)
+
+
+class PatchEditorAgent(EditorAgent):
+    """
+    Hikayeyi baştan yazdırmak yerine düzenleme listesi isteyen Editör.
+    Taslak paragraf numaralarıyla verilir, model sadece değişen paragrafları (replace /
+    insert_after / delete) JSON olarak döndürür; düzenlemeler yerelde uygulanıp doğrulanır.
+    Çıktı tokenları sadece değişen kısım kadar olduğundan düzenleme hem hızlı hem ucuzdur.
+    Düzenleme listesi okunamaz ya da uygulanamazsa tam metin düzenlemesine (EditorAgent) düşülür.
+    """
+
+    def __init__(self, llm: Callable[[str], str]):
+        super().__init__(llm)
+        self.json_caps = OutputCaps(as_json_llm(llm))
+        self._lock = threading.Lock()
+        self._stats = {"patched": 0, "unchanged": 0, "fallback": 0, "edits": 0}
+
+    def _build_patch_prompt(self, paragraphs: List[str], critic_feedback_json: str) -> str:
+        return f"""
+Sen yazarlığa yeni başlamış kişilere yardım eden destekleyici bir HİKÂYE EDİTÖRÜ etmensin.
+
+{GENERATION_SAFETY_RULES}
+
+Sana paragraf numaralı ([P1], [P2], ...) bir hikaye taslağı ve eleştirmen geri bildirimi (JSON) verilecek.
+
+Görevin:
+- Eleştirmenin "suggestion" (öneri) kısımlarını uygula; temel fikri ve akışı KORU.
+- Hikayeyi baştan YAZMA. SADECE değişmesi gereken paragrafları düzenleme olarak ver.
+- Değişmeyen paragrafları ASLA tekrar yazma.
+
+Çıktıyı SADECE geçerli bir JSON olarak ver. Format:
+{{
+  "edits": [
+    {{"op": "replace", "paragraph": 2, "text": "Paragrafın yeni hali"}},
+    {{"op": "insert_after", "paragraph": 3, "text": "3. paragraftan sonra eklenecek yeni paragraf"}},
+    {{"op": "delete", "paragraph": 4}}
+  ]
+}}
+- paragraph: taslaktaki özgün numara (insert_after için 0 = en başa).
+- text: paragraf numarası ya da başlık içermeyen düz hikaye metni.
+
+Paragraf Numaralı Taslak:
+{number_paragraphs(paragraphs)}
+
+Eleştirmen Geri Bildirimi (JSON):
+{compact_feedback(critic_feedback_json)}
+""".strip()
+
+    def _apply(self, paragraphs: List[str], raw_response: str) -> str:
+        try:
+            data = parse_json_lenient(raw_response)
+        except ValueError as e:
+            raise PatchError(str(e))
+        edits = data.get("edits") if isinstance(data, dict) else data
+        text = apply_edits(paragraphs, edits)
+        with self._lock:
+            self._stats["patched" if edits else "unchanged"] += 1
+            self._stats["edits"] += len(edits)
+        return text
+
+    def _note_fallback(self, error: Exception) -> None:
+        print(f"⚠️ Düzenleme listesi uygulanamadı ({error}). Tam metin düzenlemesine geçiliyor...")
+        with self._lock:
+            self._stats["fallback"] += 1
+
+    def revise(self, story_text: str, critic_feedback_json: str) -> str:
+        if "yardımcı olamam" in story_text.lower():
+            return story_text
+
+        paragraphs = split_paragraphs(story_text)
+        try:
+            with stage_scope("editor"):
+                json_llm = self.json_caps.get(edit_output_limit(story_text))
+                raw_response = json_llm(self._build_patch_prompt(paragraphs, critic_feedback_json))
+            return self._apply(paragraphs, raw_response)
+        except (DeadlineExceeded, OperationCancelled):
+            raise
+        except Exception as e:
+            self._note_fallback(e)
+        return super().revise(story_text, critic_feedback_json)
+
+    async def arevise(self, story_text: str, critic_feedback_json: str) -> str:
+        if "yardımcı olamam" in story_text.lower():
+            return story_text
+
+        paragraphs = split_paragraphs(story_text)
+        try:
+            with stage_scope("editor"):
+                json_llm = self.json_caps.get(edit_output_limit(story_text))
+                raw_response = await acall_llm(json_llm, self._build_patch_prompt(paragraphs, critic_feedback_json))
+            return self._apply(paragraphs, raw_response)
+        except (DeadlineExceeded, OperationCancelled):
+            raise
+        except Exception as e:
+            self._note_fallback(e)
+        return await super().arevise(story_text, critic_feedback_json)
+
+    def stream_revise(self, story_text: str, critic_feedback_json: str) -> Iterator[str]:
+        """Düzenleme listesi parça parça uygulanamaz; final tek parça halinde verilir."""
+        yield self.revise(story_text, critic_feedback_json)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,208 @@
+from __future__ import annotations
+import json
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from agents.normalizer import TurkishNormalizer
+from agents.safety import SafetyGuard
+from llm.aio import acall_llm
+from llm.context import stage_scope
+from llm.deadline import DeadlineExceeded
+from llm.structured import as_json_llm, parse_json_lenient, parse_json_object
+
+# Düzeltme adımının değiştirebileceği alanlar
+_CORRECTABLE_FIELDS = ("title", "genre", "theme", "characters")
+
+_TYPO_RULES = """
+KURALLAR:
+1. "Kucuk prns", "Harry pottr" gibi bilinen kitap/film adlarını tanı ve tam doğrusunu yaz (Küçük Prens, Harry Potter).
+2. "drma", "fantstik", "korku" gibi türleri düzelt (Dram, Fantastik, Korku).
+3. Karakter isimlerindeki yazım yanlışlarını gider ve Baş Harflerini Büyüt (Örn: "nurhgül" -> "Nurgül", "aynur" -> "Aynur").
+4. İngilizce karakterlerle yazılmış Türkçe kelimeleri düzelt (s -> ş, i -> ı, g -> ğ, c -> ç vb. bağlama göre).
+5. Başlıkları "Title Case" yap (İlk harfler büyük). Anlamı bozma, sadece imla düzelt.
+""".strip()
+
+
+def _build_typo_prompt(user_input: dict) -> str:
+    return f"""
+Sen uzman bir Türkçe Editörü ve Düzeltmenisin.
+Görevin: Aşağıdaki JSON verisindeki alanları analiz et ve hatalı/eksik yazımları EN DOĞRU Türkçe haline çevir.
+
+{_TYPO_RULES}
+6. SADECE JSON formatında yanıt ver.
+
+Örnek Davranış:
+Girdi: {{"title": "kucuk prns", "genre": "drma", "characters": ["aynur", "nurhgul"]}}
+Çıktı: {{"title": "Küçük Prens", "genre": "Dram", "characters": ["Aynur", "Nurgül"]}}
+
+ŞİMDİ BU VERİYİ DÜZELT:
+{json.dumps(user_input, ensure_ascii=False)}
+"""
+
+
+# --- AKILLI DÜZELTİCİ ---
+def correct_typos_with_llm(user_input: dict, llm) -> dict:
+    """
+    Kullanıcı girdisindeki bozuk yazımları, eksik harfleri ve karakter isimlerini düzeltir.
+    Örn: "Kucuk Prns" -> "Küçük Prens", "drma" -> "Dram", "nurhgül" -> "Nurgül"
+    """
+    return _correct_typos(user_input, llm)[0]
+
+
+async def acorrect_typos_with_llm(user_input: dict, llm) -> dict:
+    """correct_typos_with_llm'in asenkron sürümü."""
+    return (await _acorrect_typos(user_input, llm))[0]
+
+
+def _correct_typos(user_input: dict, llm) -> Tuple[dict, bool]:
+    # (girdi, düzeltildi_mi): hata olursa girdi olduğu gibi ve False döner
+    try:
+        with stage_scope("typo"):
+            response = llm(_build_typo_prompt(user_input))
+        return _merge_typo_response(user_input, response), True
+
+    except Exception as e:
+        print(f"⚠️  Düzeltme sırasında hata oluştu (önemsiz): {e}")
+        return user_input, False
+
+
+async def _acorrect_typos(user_input: dict, llm) -> Tuple[dict, bool]:
+    try:
+        with stage_scope("typo"):
+            response = await acall_llm(llm, _build_typo_prompt(user_input))
+        return _merge_typo_response(user_input, response), True
+
+    except Exception as e:
+        print(f"⚠️  Düzeltme sırasında hata oluştu (önemsiz): {e}")
+        return user_input, False
+
+
+def _merge_typo_response(user_input: dict, response: str) -> dict:
+    # Kod bloğu, sondaki virgül vb. yerelde tolere edilir
+    corrected_data = parse_json_lenient(response)
+    if not isinstance(corrected_data, dict):
+        raise ValueError("Düzeltme yanıtı JSON nesnesi değil")
+
+    # Eski veriyle birleştir
+    user_input.update(corrected_data)
+    return user_input
+
+
+class PreflightAgent:
+    """
+    Birleşik ön kontrol: yazım düzeltme ve güvenlik skorlamasını TEK LLM çağrısıyla yapar.
+
+    - Düzeltilmiş alanlar girdiye işlenir.
+    - Güvenlik JSON'ı SafetyGuard'ın karar önbelleğine konur; böylece ardından gelen
+      guard.check_and_input ikinci bir LLM çağrısı yapmaz (fuzzy kontroller yine yerelde çalışır).
+    - Yanıt ayrıştırılamazsa eski iki aşamalı yola (ayrı typo çağrısı + guard'ın kendi skorlaması) düşer.
+    - Önce yerel normalleştirici denenir; güveni yüksekse düzeltme için LLM'e hiç gidilmez
+      (güvenlik skorunu guard.check_and_input kendisi alır).
+    """
+
+    def __init__(self, llm: Callable[[str], str], guard: Optional[SafetyGuard] = None,
+                 normalizer: Optional[TurkishNormalizer] = None):
+        self.llm = llm
+        self.json_llm = as_json_llm(llm)
+        self.guard = guard if guard is not None else SafetyGuard(llm)
+        self.normalizer = normalizer if normalizer is not None else TurkishNormalizer()
+        self.local_hits = 0
+
+    def _normalize_locally(self, user_input: dict) -> bool:
+        """Yerel düzeltmeyi girdiye uygular; LLM'e gerek kalmadıysa True döner."""
+        result = self.normalizer.normalize(user_input)
+        user_input.update(result.fields)
+        if self.normalizer.is_confident(result):
+            self.local_hits += 1
+            return True
+        return False
+
+    def _build_prompt(self, user_input: dict) -> str:
+        return f"""
+Sen bir hikaye yazma uygulaması için hem Türkçe DÜZELTMEN hem de GÜVENLİK SINIFLANDIRICISIN.
+SADECE geçerli JSON döndür. JSON dışında hiçbir yazı yazma.
+
+GÖREV 1 - DÜZELTME:
+Aşağıdaki girdideki "title", "genre", "theme" ve "characters" alanlarını düzelt.
+{_TYPO_RULES}
+
+GÖREV 2 - GÜVENLİK (düzeltilmiş girdi üzerinden):
+- 0 ile 10 arasında 'olumsuzluk_skoru' üret, 'kategori' seç, her kategori için 0-10 risk ver,
+  kısa 'gerekceler' yaz ve tamamen Türkçe bir 'oneri' ver.
+{SafetyGuard.SCORING_RULES}
+JSON şeması:
+{{
+  "duzeltilmis": {{"title": "...", "genre": "...", "theme": "...", "characters": ["..."]}},
+  "guvenlik": {SafetyGuard.SCORING_SCHEMA}
+}}
+
+Kullanıcı girdisi:
+{json.dumps({k: user_input.get(k, "") for k in _CORRECTABLE_FIELDS}, ensure_ascii=False)}
+"""
+
+    def _parse(self, raw: str) -> Optional[Dict[str, Any]]:
+        data = parse_json_object(raw)
+        corrected = data.get("duzeltilmis")
+        safety = data.get("guvenlik")
+        if not isinstance(corrected, dict) or not isinstance(safety, dict):
+            return None
+        try:
+            int(safety.get("olumsuzluk_skoru"))
+        except (TypeError, ValueError):
+            return None
+        return data
+
+    def _apply(self, user_input: dict, data: Dict[str, Any]) -> dict:
+        for key in _CORRECTABLE_FIELDS:
+            value = data["duzeltilmis"].get(key)
+            if key == "characters" and isinstance(value, list):
+                user_input[key] = [str(c) for c in value]
+            elif isinstance(value, str) and value.strip():
+                user_input[key] = value.strip()
+        self.guard.seed_verdict(user_input, data["guvenlik"])
+        return user_input
+
+    def run(self, user_input: dict) -> dict:
+        """Girdiyi düzeltir (yerinde) ve döndürür; güvenlik kararı guard'a hazırlanır."""
+        return self.correct(user_input)[0]
+
+    async def arun(self, user_input: dict) -> dict:
+        return (await self.acorrect(user_input))[0]
+
+    def correct(self, user_input: dict) -> Tuple[dict, bool]:
+        """
+        run ile aynı; ek olarak düzeltmenin gerçekten yapılıp yapılmadığını döndürür.
+        Süre aşımı ya da hata yüzünden girdi düzeltilmeden geçtiyse False (kaydedilmemeli).
+        """
+        if self._normalize_locally(user_input):
+            return user_input, True
+        try:
+            with stage_scope("preflight"):
+                raw = self.json_llm(self._build_prompt(user_input))
+            data = self._parse(raw)
+        except DeadlineExceeded:
+            # Süre dolduysa yedek çağrıyla bekletme; girdi olduğu gibi devam eder
+            return user_input, False
+        except Exception:
+            data = None
+
+        if data is None:
+            # Yedek yol: ayrı düzeltme çağrısı (güvenlik skorunu guard kendisi alır)
+            return _correct_typos(user_input, self.json_llm)
+        return self._apply(user_input, data), True
+
+    async def acorrect(self, user_input: dict) -> Tuple[dict, bool]:
+        if self._normalize_locally(user_input):
+            return user_input, True
+        try:
+            with stage_scope("preflight"):
+                raw = await acall_llm(self.json_llm, self._build_prompt(user_input))
+            data = self._parse(raw)
+        except DeadlineExceeded:
+            # Süre dolduysa yedek çağrıyla bekletme; girdi olduğu gibi devam eder
+            return user_input, False
+        except Exception:
+            data = None
+
+        if data is None:
+            return await _acorrect_typos(user_input, self.json_llm)
+        return self._apply(user_input, data), True
@@ -1,8 +1,21 @@
 from __future__ import annotations
+from collections import OrderedDict
 from dataclasses import dataclass
 from typing import Dict, Optional, Callable, Any
-import json
 import re
+import threading
+from llm.aio import acall_llm
+from llm.context import stage_scope
+from llm.structured import as_json_llm, parse_json_object
+from agents.fuzzy_matcher import compile_matcher
+
+# Üretim (yazar/editör) promptlarına eklenen güvenlik kuralları; her çağrıda tekrarlandığı için kısa tutulur
+GENERATION_SAFETY_RULES = (
+    "GÜVENLİK KURALLARI: Nefret söylemi, taciz/hakaret, hedef gösterme; reşit olmayanları içeren cinsel "
+    "içerik; kendine zarar/intihar teşviki; yasadışı/tehlikeli eylem (silah, bomba, hack, uyuşturucu vb.) "
+    "yönlendirmesi; kişisel veri (adres, telefon, kimlik vb.) isteme/yayma YOK. İstek bu sınırlara "
+    "giriyorsa KISACA reddet ve güvenli alternatif öner."
+)
 
 @dataclass
 class SafetyResult:
@@ -17,6 +30,54 @@ class SafetyResult:
     needs_theme_retry: bool = False  # tema yeniden girilmeli mi?
 
 
+def apply_safe_mode(user_input: Dict) -> Dict:
+    """
+    Sınırda (borderline) içerik onaylandığında girdiye 'Güvenli Mod' (PG-13)
+    kısıtlarını ekler. Girdiyi yerinde günceller ve geri döndürür.
+    """
+    constraints = user_input.get("constraints") or []
+    constraints.append(
+        "Güvenli mod: zararlı eylemleri detaylı tarif etme/teşvik etme. "
+        "Grafik detay verme. Etik boyut, iyileşme, umut ve destek temasına odaklan."
+    )
+    user_input["constraints"] = constraints
+    user_input["style"] = (user_input.get("style") or "") + " | PG, grafik detaysız"
+    return user_input
+
+
+class _LRUCache:
+    """Küçük, thread-safe LRU sözlüğü (sınırlı boyut)."""
+
+    _MISSING = object()
+
+    def __init__(self, max_size: int):
+        self.max_size = max(1, max_size)
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return self._MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
 class SafetyGuard:
     # Regex fallback patterns
     _SELF_HARM = re.compile(
@@ -30,8 +91,17 @@ class SafetyGuard:
         re.IGNORECASE
     )
 
-    def __init__(self, llm: Optional[Callable[[str], str]] = None):
+    def __init__(self, llm: Optional[Callable[[str], str]] = None, cache_size: int = 256):
         self.llm = llm
+        # Skorlama çağrıları, istemci destekliyorsa JSON çıktı modunda yapılır
+        self.json_llm = as_json_llm(llm) if llm is not None else None
+
+        # Tekrar denemelerde sadece değişen alan yeniden değerlendirilsin diye:
+        # - alan bazlı fuzzy sonuçları
+        # - tüm girdi için LLM kararları
+        # normalize edilmiş metne göre LRU önbellekte tutulur.
+        self._field_cache = _LRUCache(cache_size)
+        self._verdict_cache = _LRUCache(cache_size)
 
         # TÜRKÇE HASSAS KELİME LİSTESİ (Fuzzy Matching için)
         # Format: ("kelime", "kategori", tolerans_miktarı, SKOR_ETKİSİ)
@@ -69,68 +139,135 @@ class SafetyGuard:
             ("kacakcilik", "yasa_disi", 3, 6),
             ("kara borsa", "yasa_disi", 2, 5),
         ]
+        self._matcher = compile_matcher(self._FUZZY_KEYWORDS)
 
     # =========================
     # PUBLIC
     # =========================
     def check_and_input(self, user_input: Dict) -> Dict:
-        # 1. Alanları al
-        theme = str(user_input.get("theme", "") or "").strip()
-        genre = str(user_input.get("genre", "") or "").strip()
-        title = str(user_input.get("title", "") or "").strip()
-
-        # Yardımcı iç fonksiyon: Fuzzy kontrolü yapıp skora göre Tier belirler
-        def evaluate_field(field_name, text_val):
-             hit = self._fuzzy_check_string(text_val)
-             if hit is not None:
-                cat, matched_kw, base_score = hit
-                
-                # Skor 8 ve üzeriyse -> BLOCK
-                if base_score >= 8:
-                    return SafetyResult(
-                        safe=False, negativity_score=base_score, tier="block",
-                        message=f"⛔ {field_name} alanında KESİN YASAKLI ifade: '{matched_kw}'",
-                        suggestion="Bu içerik politikalarımıza aykırı.",
-                        category=cat, risk_breakdown={cat: base_score},
-                        reasons=[f"{field_name} alanında '{matched_kw}' tespit edildi."],
-                        needs_theme_retry=True
-                    )
-                # Skor 5-7 arasındaysa -> BORDERLINE
-                else:
-                    return SafetyResult(
-                        safe=False, negativity_score=base_score, tier="borderline",
-                        message=f"⚠️ {field_name} alanında hassas ifade: '{matched_kw}'",
-                        suggestion="Güvenli modda devam edebiliriz veya değiştirebilirsin.",
-                        category=cat, risk_breakdown={cat: base_score},
-                        reasons=[f"{field_name} alanında '{matched_kw}' tespit edildi."],
-                        needs_theme_retry=False # Seçim hakkı ver
-                    )
-             return None
-
-        # 2. Alanları Kontrol Et
-        res_genre = evaluate_field("Tür (Genre)", genre)
-        if res_genre: return self._to_dict(res_genre)
-
-        res_theme = evaluate_field("Tema", theme)
-        if res_theme: return self._to_dict(res_theme)
-
-        res_title = evaluate_field("Başlık", title)
-        if res_title: return self._to_dict(res_title)
+        # 1-2. Alanları al ve Fuzzy ile kontrol et
+        res = self._check_fields(user_input)
+        if res: return self._to_dict(res)
 
         # 4. Genel Metin Kontrolü (LLM + Regex)
-        text = f"Başlık: {title}\nTür: {genre}\nTema: {theme}\nKarakterler: {user_input.get('characters', '')}"
+        text = self._build_text(user_input)
         
-        res = None
-        if self.llm is not None:
+        res = self._cached_verdict(text)
+        llm_failed = False
+        if res is None and self.llm is not None:
             try:
                 res = self._score_with_llm(text)
+                self._verdict_cache.put(self._normalize(text), res)
             except Exception:
                 res = None
+                llm_failed = True
         
         if res is None:
             res = self._score_with_regex(text)
 
-        return self._to_dict(res)
+        return self._verdict(res, llm_failed)
+
+    async def acheck_and_input(self, user_input: Dict) -> Dict:
+        """
+        check_and_input'un asenkron sürümü: Fuzzy/Regex kontrolleri yereldir,
+        sadece LLM skorlama çağrısı await edilir.
+        """
+        res = self._check_fields(user_input)
+        if res: return self._to_dict(res)
+
+        text = self._build_text(user_input)
+
+        res = self._cached_verdict(text)
+        llm_failed = False
+        if res is None and self.llm is not None:
+            try:
+                res = await self._ascore_with_llm(text)
+                self._verdict_cache.put(self._normalize(text), res)
+            except Exception:
+                res = None
+                llm_failed = True
+
+        if res is None:
+            res = self._score_with_regex(text)
+
+        return self._verdict(res, llm_failed)
+
+    def _check_fields(self, user_input: Dict) -> Optional[SafetyResult]:
+        # 1. Alanları al
+        theme = str(user_input.get("theme", "") or "").strip()
+        genre = str(user_input.get("genre", "") or "").strip()
+        title = str(user_input.get("title", "") or "").strip()
+
+        # 2. Alanları Kontrol Et
+        res_genre = self._evaluate_field("Tür (Genre)", genre)
+        if res_genre: return res_genre
+
+        res_theme = self._evaluate_field("Tema", theme)
+        if res_theme: return res_theme
+
+        res_title = self._evaluate_field("Başlık", title)
+        if res_title: return res_title
+
+        return None
+
+    def _build_text(self, user_input: Dict) -> str:
+        theme = str(user_input.get("theme", "") or "").strip()
+        genre = str(user_input.get("genre", "") or "").strip()
+        title = str(user_input.get("title", "") or "").strip()
+        return f"Başlık: {title}\nTür: {genre}\nTema: {theme}\nKarakterler: {user_input.get('characters', '')}"
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        return {"fields": self._field_cache.stats(), "verdicts": self._verdict_cache.stats()}
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    def _cached_verdict(self, text: str) -> Optional[SafetyResult]:
+        res = self._verdict_cache.get(self._normalize(text))
+        return None if res is _LRUCache._MISSING else res
+
+    def _cached_fuzzy_check(self, text_val: str) -> Optional[tuple[str, str, int]]:
+        key = self._normalize(text_val)
+        hit = self._field_cache.get(key)
+        if hit is _LRUCache._MISSING:
+            hit = self._fuzzy_check_string(text_val)
+            self._field_cache.put(key, hit)
+        return hit
+
+    # Yardımcı fonksiyon: Fuzzy kontrolü yapıp skora göre Tier belirler
+    def _evaluate_field(self, field_name: str, text_val: str) -> Optional[SafetyResult]:
+        hit = self._cached_fuzzy_check(text_val)
+        if hit is None:
+            return None
+        cat, matched_kw, base_score = hit
+
+        # Skor 8 ve üzeriyse -> BLOCK
+        if base_score >= 8:
+            return SafetyResult(
+                safe=False, negativity_score=base_score, tier="block",
+                message=f"⛔ {field_name} alanında KESİN YASAKLI ifade: '{matched_kw}'",
+                suggestion="Bu içerik politikalarımıza aykırı.",
+                category=cat, risk_breakdown={cat: base_score},
+                reasons=[f"{field_name} alanında '{matched_kw}' tespit edildi."],
+                needs_theme_retry=True
+            )
+        # Skor 5-7 arasındaysa -> BORDERLINE
+        return SafetyResult(
+            safe=False, negativity_score=base_score, tier="borderline",
+            message=f"⚠️ {field_name} alanında hassas ifade: '{matched_kw}'",
+            suggestion="Güvenli modda devam edebiliriz veya değiştirebilirsin.",
+            category=cat, risk_breakdown={cat: base_score},
+            reasons=[f"{field_name} alanında '{matched_kw}' tespit edildi."],
+            needs_theme_retry=False # Seçim hakkı ver
+        )
+
+    def _verdict(self, res: SafetyResult, llm_failed: bool) -> Dict:
+        verdict = self._to_dict(res)
+        if llm_failed:
+            # LLM skorlaması alınamadı, karar sadece regex'e dayanıyor (checkpoint'e yazılmaz)
+            verdict["fallback"] = True
+        return verdict
 
     def _to_dict(self, res: SafetyResult) -> Dict:
         return {
@@ -140,8 +277,8 @@ class SafetyGuard:
             "message": res.message,
             "suggestion": res.suggestion,
             "category": res.category,
-            "risk_breakdown": res.risk_breakdown or {},
-            "reasons": res.reasons or [],
+            "risk_breakdown": dict(res.risk_breakdown or {}),  # sonuçlar önbellekte paylaşıldığı için kopya
+            "reasons": list(res.reasons or []),
             "needs_theme_retry": res.needs_theme_retry,
         }
 
@@ -150,9 +287,28 @@ class SafetyGuard:
     # =========================
     def _score_with_llm(self, text: str) -> SafetyResult:
         prompt = self._build_prompt(text)
-        raw = self.llm(prompt)
-        data = self._parse_json_safely(raw)
-
+        with stage_scope("safety"):
+            raw = self.json_llm(prompt)
+        return self._result_from_llm(raw)
+
+    async def _ascore_with_llm(self, text: str) -> SafetyResult:
+        with stage_scope("safety"):
+            raw = await acall_llm(self.json_llm, self._build_prompt(text))
+        return self._result_from_llm(raw)
+
+    def _result_from_llm(self, raw: str) -> SafetyResult:
+        return self._result_from_data(self._parse_json_safely(raw))
+
+    def seed_verdict(self, user_input: Dict, data: Dict[str, Any]) -> None:
+        """
+        Başka bir çağrıda (örn. birleşik ön kontrol) üretilmiş güvenlik JSON'ını
+        bu girdi için LLM kararı olarak önbelleğe koyar; sonraki check_and_input
+        aynı girdi için ayrı bir LLM çağrısı yapmaz.
+        """
+        text = self._build_text(user_input)
+        self._verdict_cache.put(self._normalize(text), self._result_from_data(data))
+
+    def _result_from_data(self, data: Dict[str, Any]) -> SafetyResult:
         score = int(data.get("olumsuzluk_skoru", 0))
         score = max(0, min(10, score))
 
@@ -176,6 +332,24 @@ class SafetyGuard:
             needs_theme_retry=(score >= 8) # Sadece çok yüksek skorlarda zorla değiştir
         )
 
+    # Güvenlik skorlama kuralları ve JSON şeması (birleşik ön kontrol prompt'u da kullanır)
+    SCORING_RULES = (
+        "KURALLAR:\n"
+        "1. EDEBİ/KURGUSAL Şiddet (Cinayet romanı, savaş dramı) -> Puan: 4-6 (Borderline/Sınırda).\n"
+        "2. AŞIRI VAHŞET, NEFRET, İSTİSMAR, GERÇEK ZARAR -> Puan: 8-10 (Block/Yasak).\n"
+        "3. 'Tür' masum olsa bile 'Tema' vahşet içeriyorsa Puanı yükselt.\n\n"
+        "Kategoriler: kendine_zarar, siddet, nefret, taciz, yasa_disi, cinsel, diger\n"
+    )
+    SCORING_SCHEMA = (
+        "{\n"
+        '  "olumsuzluk_skoru": 0,\n'
+        '  "kategori": "siddet",\n'
+        '  "risk_dagilimi": {"kendine_zarar":0,"siddet":0,"nefret":0,"taciz":0,"yasa_disi":0,"cinsel":0,"diger":0},\n'
+        '  "gerekceler": ["..."],\n'
+        '  "oneri": "..." \n'
+        "}"
+    )
+
     def _build_prompt(self, text: str) -> str:
         return (
             "Sen bir hikaye yazma uygulamasi icin guvenlik siniflandiricisin.\n"
@@ -187,33 +361,14 @@ class SafetyGuard:
             "- Her kategori icin 0-10 arasi risk skoru ver.\n"
             "- Kisa gerekceler yaz.\n"
             "- Tamamen Turkce bir 'oneri' ver.\n\n"
-            "KURALLAR:\n"
-            "1. EDEBİ/KURGUSAL Şiddet (Cinayet romanı, savaş dramı) -> Puan: 4-6 (Borderline/Sınırda).\n"
-            "2. AŞIRI VAHŞET, NEFRET, İSTİSMAR, GERÇEK ZARAR -> Puan: 8-10 (Block/Yasak).\n"
-            "3. 'Tür' masum olsa bile 'Tema' vahşet içeriyorsa Puanı yükselt.\n\n"
-            "Kategoriler: kendine_zarar, siddet, nefret, taciz, yasa_disi, cinsel, diger\n\n"
+            + self.SCORING_RULES + "\n"
             "JSON semasi:\n"
-            "{\n"
-            '  "olumsuzluk_skoru": 0,\n'
-            '  "kategori": "siddet",\n'
-            '  "risk_dagilimi": {"kendine_zarar":0,"siddet":0,"nefret":0,"taciz":0,"yasa_disi":0,"cinsel":0,"diger":0},\n'
-            '  "gerekceler": ["..."],\n'
-            '  "oneri": "..." \n'
-            "}\n\n"
+            + self.SCORING_SCHEMA + "\n\n"
             f"Kullanici girdisi:\n{text}\n"
         )
 
     def _parse_json_safely(self, raw: str) -> Dict[str, Any]:
-        if not raw: return {}
-        raw = raw.strip()
-        if raw.startswith("{") and raw.endswith("}"):
-            try: return json.loads(raw)
-            except: pass
-        m = re.search(r"\{.*\}", raw, flags=re.DOTALL)
-        if m:
-            try: return json.loads(m.group(0))
-            except: return {}
-        return {}
+        return parse_json_object(raw)
 
     def _sanitize_breakdown(self, val: Any) -> Dict[str, int]:
         base = {"kendine_zarar": 0, "siddet": 0, "nefret": 0, "taciz": 0, "yasa_disi": 0, "cinsel": 0, "diger": 0}
@@ -298,35 +453,6 @@ class SafetyGuard:
     def _fuzzy_check_string(self, text: str) -> Optional[tuple[str, str, int]]:
         if not text:
             return None
-        txt = text.lower()
-        
         # Liste formatı artık: (kelime, kategori, tolerans_miktarı, SKOR)
-        for kw, cat, max_dist, score in self._FUZZY_KEYWORDS:
-            if self._contains_fuzzy_keyword(txt, kw, max_dist=max_dist):
-                return cat, kw, score
-        return None
-
-    def _contains_fuzzy_keyword(self, text: str, keyword: str, max_dist: int = 1) -> bool:
-        tokens = re.findall(r"[a-zA-ZçğıöşüÇĞİÖŞÜ]+", text.lower())
-        kw = keyword.lower()
-        for t in tokens:
-            if abs(len(t) - len(kw)) > max_dist:
-                continue
-            if self._levenshtein(t, kw) <= max_dist:
-                return True
-        return False
-
-    def _levenshtein(self, a: str, b: str) -> int:
-        if a == b: return 0
-        if not a: return len(b)
-        if not b: return len(a)
-        prev = list(range(len(b) + 1))
-        for i, ca in enumerate(a, start=1):
-            curr = [i]
-            for j, cb in enumerate(b, start=1):
-                ins = curr[j - 1] + 1
-                dele = prev[j] + 1
-                sub = prev[j - 1] + (0 if ca == cb else 1)
-                curr.append(min(ins, dele, sub))
-            prev = curr
-        return prev[-1]
+        # Derlenmiş eşleştirici (silme indeksi) aynı önceliği korur: listede ilk eşleşen döner.
+        return self._matcher.match(text)
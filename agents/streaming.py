@@ -0,0 +1,87 @@
+from __future__ import annotations
+from typing import Callable, Iterable, Iterator
+
+
+class StreamCleaner:
+    """
+    Akış halinde gelen LLM çıktısına, etmenlerin satır bazlı temizliğini
+    (başlık / sohbet satırlarını atma, baştaki-sondaki boşlukları kırpma) artımlı uygular.
+
+    is_meta_line: küçük harfe çevrilmiş ve kırpılmış satırı alır, atılacaksa True döner.
+
+    Satır bitmeden karar verilemediği için kısa satırlar satır sonu gelene kadar bekletilir.
+    Bir satır `eager_chars` karakteri geçip hâlâ meta satır sayılmıyorsa hikaye metni kabul
+    edilir ve geri kalanı geldiği gibi iletilir (başlık/sohbet satırları kısadır).
+    """
+
+    def __init__(self, is_meta_line: Callable[[str], bool], eager_chars: int = 80):
+        self._is_meta = is_meta_line
+        self._eager_chars = eager_chars
+        self._line = ""           # henüz karar verilmemiş satır
+        self._committed = False   # mevcut satır içerik olarak onaylandı mı
+        self._started = False     # ilk içerik karakteri yazıldı mı
+        self._pending = ""        # ancak arkasından içerik gelirse yazılacak boşluklar/satır sonları
+
+    def _emit(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        stripped = text.rstrip()
+        if not stripped:
+            self._pending += text
+            return ""
+        out = self._pending + stripped
+        self._pending = text[len(stripped):]
+        return out
+
+    def _end_line(self) -> str:
+        if self._committed:
+            self._committed = False
+            out = ""
+        else:
+            line, self._line = self._line, ""
+            if self._is_meta(line.lower().strip()):
+                return ""
+            out = self._emit(line)
+        if self._started:
+            self._pending += "\n"
+        return out
+
+    def feed(self, chunk: str) -> str:
+        out = []
+        for i, part in enumerate(chunk.split("\n")):
+            if i > 0:
+                out.append(self._end_line())
+            if self._committed:
+                out.append(self._emit(part))
+                continue
+            self._line += part
+            if len(self._line.strip()) >= self._eager_chars and not self._is_meta(self._line.lower().strip()):
+                self._committed = True
+                line, self._line = self._line, ""
+                out.append(self._emit(line))
+        return "".join(out)
+
+    def close(self) -> str:
+        out = ""
+        if not self._committed and self._line and not self._is_meta(self._line.lower().strip()):
+            out = self._emit(self._line)
+        self._line = ""
+        self._pending = ""  # sondaki boşluklar kırpılır
+        return out
+
+
+def clean_stream(chunks: Iterable[str], is_meta_line: Callable[[str], bool]) -> Iterator[str]:
+    """
+    Ham parça akışını temizlenmiş parça akışına çevirir (boş parçalar atlanır).
+    """
+    cleaner = StreamCleaner(is_meta_line)
+    for chunk in chunks:
+        piece = cleaner.feed(chunk)
+        if piece:
+            yield piece
+    tail = cleaner.close()
+    if tail:
+        yield tail
@@ -1,6 +1,12 @@
 from __future__ import annotations
-from typing import Dict, List, Callable, Optional, Any
-from agents.safety import SafetyGuard
+from typing import Dict, List, Callable, Optional, Any, Generator
+from agents.safety import GENERATION_SAFETY_RULES, SafetyGuard
+from llm.aio import acall_llm
+from llm.budget import OutputCaps, draft_output_limit, stage_output_limit
+from llm.context import stage_scope
+from llm.streaming import stream_llm
+from llm.structured import as_json_llm, parse_json_lenient
+from agents.streaming import clean_stream
 
 
 class WriterAgent:
@@ -17,6 +23,10 @@ class WriterAgent:
         llm: callable -> llm(prompt: str) -> str
         """
         self.llm = llm
+        # Çıktı uzunluğu istenen hikaye boyuna göre sınırlanır (max_output_tokens)
+        self.caps = OutputCaps(llm)
+        # Bölüm planı (uzun mod) JSON olarak istenir
+        self.json_llm = OutputCaps(as_json_llm(llm)).get(stage_output_limit("outline"))
 
     def _needs_clarification(self, user_input: Dict) -> bool:
         # Çok basit bir belirsizlik ölçütü:
@@ -69,22 +79,11 @@ class WriterAgent:
             "long": "detaylı ve uzun"
         }.get(length, "orta uzunlukta")
 
-        # Güvenlik + etik sistem talimatı
-        safety_rules = """
-GÜVENLİK VE ETİK KURALLAR:
-- Nefret söylemi, hedef gösterme, taciz/hakaret içeren içerik üretme.
-- Reşit olmayanları içeren cinsel içerik üretme.
-- Kendine zarar verme / intihar teşviki üretme.
-- Yasadışı/tehlikeli eylemlere (silah, bomba, hack, uyuşturucu vb.) yönlendirme yapma.
-- Kişisel veri isteme/yayma (adres, telefon, kimlik vb.) yapma.
-- Eğer kullanıcı isteği bu sınırlara giriyorsa: KISA bir şekilde reddet ve güvenli alternatif öner.
-"""
-
         prompt = f"""
 Sen yazarlığa yeni başlayan kişilere örnek olacak bir HİKÂYE YAZARI etmensin.
 Önceliğin güvenilir, güvenli ve sorumlu bir şekilde yardımcı olmak.
 
-{safety_rules}
+{GENERATION_SAFETY_RULES}
 
 Görevin:
 Aşağıdaki bilgilere dayanarak {length_hint}, akıcı ve anlaşılır bir hikâye TASLAĞI yaz.
@@ -116,6 +115,137 @@ Tema: {theme}
         prompt += "\n\nHikâye Taslağı:\n"
         return prompt
 
+    @staticmethod
+    def _story_fields(user_input: Dict) -> str:
+        characters = user_input.get("characters", "")
+        if isinstance(characters, (list, tuple)):
+            characters = ", ".join(characters)
+        lines = [
+            f"Başlık (Sadece konu için): {user_input.get('title', 'Bir Hikâye')}",
+            f"Tür: {user_input.get('genre', 'kısa öykü')}",
+            f"Karakterler: {characters}",
+            f"Tema: {user_input.get('theme', '')}",
+            f"Üslup: {user_input.get('style', 'akıcı, sade Türkçe')}",
+        ]
+        for c in user_input.get("constraints", []) or []:
+            lines.append(f"Kısıt: {c}")
+        return "\n".join(lines)
+
+    # --- Uzun mod: önce bölüm planı, sonra bölümler ---
+    def _build_outline_prompt(self, user_input: Dict, chapters: int) -> str:
+        return f"""
+Sen yazarlığa yeni başlayan kişilere örnek olacak bir HİKÂYE YAZARI etmensin.
+
+{GENERATION_SAFETY_RULES}
+
+Görevin:
+Aşağıdaki bilgilere dayanarak {chapters} bölümlük uzun bir hikâyenin BÖLÜM PLANINI çıkar.
+Bölümler ayrı ayrı ve eşzamanlı yazılacak; bu yüzden karakterleri ve mekanı bölümler arasında
+tutarlı kalacak şekilde net tanımla, her bölümün özetini 1-2 cümleyle yaz.
+
+Çıktıyı SADECE geçerli bir JSON olarak ver. Format:
+{{
+  "characters": "Karakterlerin kısa tarifi (isim, yaş, belirgin özellik)",
+  "setting": "Mekan ve zaman",
+  "chapters": [
+    {{"title": "Bölüm başlığı", "summary": "Bu bölümde olanlar"}}
+  ]
+}}
+
+Bölüm sayısı: {chapters}
+{self._story_fields(user_input)}
+""".strip()
+
+    def _to_outline(self, raw_text: str, user_input: Dict, chapters: int) -> Dict[str, Any]:
+        try:
+            data = parse_json_lenient(raw_text)
+        except ValueError:
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        items = [c for c in data.get("chapters") or [] if isinstance(c, dict)][:chapters]
+        # Plan okunamazsa ya da eksikse bölümler sadece sırasıyla tanımlanır
+        while len(items) < chapters:
+            items.append({"title": f"Bölüm {len(items) + 1}", "summary": ""})
+        characters = user_input.get("characters", "")
+        if isinstance(characters, (list, tuple)):
+            characters = ", ".join(characters)
+        return {
+            "characters": str(data.get("characters") or characters),
+            "setting": str(data.get("setting") or ""),
+            "chapters": [{"title": str(c.get("title") or f"Bölüm {i + 1}"), "summary": str(c.get("summary") or "")}
+                         for i, c in enumerate(items)],
+        }
+
+    def generate_outline(self, user_input: Dict, chapters: int) -> Dict[str, Any]:
+        """
+        Uzun hikaye için bölüm planı:
+        {"characters": str, "setting": str, "chapters": [{"title": str, "summary": str}, ...]}
+        """
+        with stage_scope("outline"):
+            raw_text = self.json_llm(self._build_outline_prompt(user_input, chapters))
+        return self._to_outline(raw_text, user_input, chapters)
+
+    async def agenerate_outline(self, user_input: Dict, chapters: int) -> Dict[str, Any]:
+        with stage_scope("outline"):
+            raw_text = await acall_llm(self.json_llm, self._build_outline_prompt(user_input, chapters))
+        return self._to_outline(raw_text, user_input, chapters)
+
+    def _build_chapter_prompt(self, user_input: Dict, outline: Dict, index: int) -> str:
+        chapters = outline["chapters"]
+        chapter = chapters[index]
+        # Bölüm sadece kendi özetini ve komşu bölümlerin özetlerini görür (tam metinleri değil)
+        neighbours = []
+        if index > 0:
+            neighbours.append(f"Önceki bölüm ({chapters[index - 1]['title']}): {chapters[index - 1]['summary']}")
+        if index + 1 < len(chapters):
+            neighbours.append(f"Sonraki bölüm ({chapters[index + 1]['title']}): {chapters[index + 1]['summary']}")
+        neighbour_text = "\n".join(neighbours) or "Yok (hikaye tek bölüm)."
+        position = "ilk" if index == 0 else "son" if index == len(chapters) - 1 else "ara"
+
+        return f"""
+Sen yazarlığa yeni başlayan kişilere örnek olacak bir HİKÂYE YAZARI etmensin.
+
+{GENERATION_SAFETY_RULES}
+
+Görevin:
+{len(chapters)} bölümlük bir hikâyenin {index + 1}. ({position}) bölümünü yaz. Diğer bölümleri başka
+yazarlar aynı anda yazıyor; sadece bu bölümün olaylarını anlat, komşu bölümlerin olaylarını
+tekrarlama ama onlarla bağlantılı ol. Bu bölüm yaklaşık 3-4 paragraf olsun.
+
+ÇOK ÖNEMLİ BİÇİM KURALLARI (BUNA KESİNLİKLE UY):
+1. Çıktıda ASLA 'Başlık: ...', 'Bölüm ...' veya '**Başlık**' satırı yazma.
+2. 'Harika bir fikir', 'İşte bölüm' gibi giriş cümleleri YAZMA.
+3. SADECE ve SADECE bölümün metnini yaz.
+
+{self._story_fields(user_input)}
+Karakter tarifleri: {outline['characters']}
+Mekan ve zaman: {outline['setting']}
+
+Bu bölüm ({chapter['title']}): {chapter['summary']}
+{neighbour_text}
+
+Bölüm Metni:
+""".strip()
+
+    def generate_chapter(self, user_input: Dict, outline: Dict, index: int) -> str:
+        """Bölüm planındaki index. bölümün temizlenmiş metni."""
+        with stage_scope("writer"):
+            raw_text = self._chapter_llm()(self._build_chapter_prompt(user_input, outline, index))
+        return self._to_draft(raw_text)["content"]
+
+    async def agenerate_chapter(self, user_input: Dict, outline: Dict, index: int) -> str:
+        with stage_scope("writer"):
+            raw_text = await acall_llm(self._chapter_llm(), self._build_chapter_prompt(user_input, outline, index))
+        return self._to_draft(raw_text)["content"]
+
+    def _draft_llm(self, user_input: Dict) -> Callable[[str], str]:
+        return self.caps.get(draft_output_limit(user_input.get("length")))
+
+    def _chapter_llm(self) -> Callable[[str], str]:
+        # Bölüm promptu 3-4 paragraf ister (orta uzunlukta bir taslak kadar)
+        return self.caps.get(draft_output_limit("medium"))
+
     def generate_draft(self, user_input: Dict) -> Dict[str, Any]:
         """
         Dönüş:
@@ -136,24 +266,68 @@ Tema: {theme}
         prompt = self._build_prompt(user_input)
         
         # LLM çıktısını al ve temizle
-        raw_text = self.llm(prompt).strip()
-        
+        with stage_scope("writer"):
+            raw_text = self._draft_llm(user_input)(prompt)
+        return self._to_draft(raw_text)
+
+    async def agenerate_draft(self, user_input: Dict) -> Dict[str, Any]:
+        """
+        generate_draft'ın asenkron sürümü (aynı dönüş formatı).
+        """
+        if self._needs_clarification(user_input):
+            return {
+                "type": "clarification",
+                "content": self.build_clarifying_questions(user_input)
+            }
+
+        prompt = self._build_prompt(user_input)
+        with stage_scope("writer"):
+            raw_text = await acall_llm(self._draft_llm(user_input), prompt)
+        return self._to_draft(raw_text)
+
+    def stream_draft(self, user_input: Dict) -> Generator[str, None, Dict[str, Any]]:
+        """
+        generate_draft'ın akış sürümü: temizlenmiş hikaye metnini geldikçe parça parça verir.
+        Generator'ın dönüş değeri generate_draft ile aynı formattaki sözlüktür
+        (belirsiz girdide hiç parça üretmeden 'clarification' döner).
+        """
+        if self._needs_clarification(user_input):
+            return {
+                "type": "clarification",
+                "content": self.build_clarifying_questions(user_input)
+            }
+
+        prompt = self._build_prompt(user_input)
+        parts = []
+        for piece in clean_stream(stream_llm(self._draft_llm(user_input), prompt, stage="writer"), self._is_meta_line):
+            parts.append(piece)
+            yield piece
+
+        return {
+            "type": "draft",
+            "content": "".join(parts)
+        }
+
+    @staticmethod
+    def _is_meta_line(lower_line: str) -> bool:
+        # Başlık satırlarını atla
+        if lower_line.startswith("başlık:") or lower_line.startswith("**başlık"):
+            return True
+        # Sohbet giriş cümlelerini atla
+        if "işte taslağınız" in lower_line or "hikaye taslağı:" in lower_line:
+            return True
+        return False
+
+    def _to_draft(self, raw_text: str) -> Dict[str, Any]:
+        raw_text = raw_text.strip()
+
         # Manuel temizlik: Model inatla "Başlık:" yazarsa silmek için
         lines = raw_text.split('\n')
-        cleaned_lines = []
-        for line in lines:
-            lower_line = line.lower().strip()
-            # Başlık satırlarını atla
-            if lower_line.startswith("başlık:") or lower_line.startswith("**başlık"):
-                continue
-            # Sohbet giriş cümlelerini atla
-            if "işte taslağınız" in lower_line or "hikaye taslağı:" in lower_line:
-                continue
-            cleaned_lines.append(line)
+        cleaned_lines = [line for line in lines if not self._is_meta_line(line.lower().strip())]
             
         final_story_text = "\n".join(cleaned_lines).strip()
         
         return {
             "type": "draft",
             "content": final_story_text
-        }
\ No newline at end of file
+        }
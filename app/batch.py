@@ -0,0 +1,363 @@
+"""
+Etkileşimsiz toplu (batch) mod.
+
+JSONL dosyasındaki her satırı (user_input sözlüğü) sırasıyla
+typo düzeltme -> SafetyGuard -> StoryWorkshopPipeline adımlarından geçirir.
+Sonuçlar bittikçe çıktı JSONL dosyasına yazılır; bellekte aynı anda en fazla
+birkaç kayıt tutulur.
+
+Kullanım:
+    python -m app.batch girdiler.jsonl -o sonuclar.jsonl --workers 8 --auto-safe-mode --skip-blocked
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import sys
+from contextlib import redirect_stdout
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional, TextIO, Tuple
+
+from agents.writer_agent import WriterAgent
+from agents.aspect_critic import AspectCriticAgent
+from agents.critic_agent import CriticAgent
+from agents.chunked_editor import ChunkedEditorAgent
+from agents.editor_agent import EditorAgent
+from agents.patch_editor import PatchEditorAgent
+from agents.safety import SafetyGuard, apply_safe_mode
+from agents.preflight import PreflightAgent
+from core.best_of_n import BestOfNDrafter
+from core.chapters import DEFAULT_CHAPTERS, ChapterWorkshop
+from core.refine import REFINE_TIERS, RefinementLoop
+from core.checkpoint import CheckpointStore
+from core.pipeline import StoryWorkshopPipeline
+from llm.deadline import Deadline, deadline_scope
+from llm.metrics import GLOBAL_METRICS, MetricsRecorder, metrics_scope
+
+# requests.jsonl formatındaki kimlik/üst veri alanları (user_input'a dahil edilmez)
+_META_KEYS = ("request_id", "id")
+
+
+@dataclass
+class SafetyPolicy:
+    """
+    Etkileşimli arayüzdeki borderline/yaş sorularının yerine geçen kurallar.
+    - auto_safe_mode: Sınırda içerik otomatik olarak Güvenli Mod (PG-13) ile işlenir.
+      Kapalıysa kayıt 'needs_review' durumuyla atlanır.
+    - skip_blocked: Yasaklı içerikler çıktıya hiç yazılmaz.
+      Kapalıysa 'blocked' durumuyla raporlanır.
+    """
+    auto_safe_mode: bool = False
+    skip_blocked: bool = False
+
+
+def apply_safety_policy(user_input: Dict, safety_result: Dict, policy: SafetyPolicy) -> Optional[str]:
+    """
+    Güvenlik sonucunu politikaya göre uygular.
+    Dönüş: None -> üretime devam; aksi halde kaydın son durumu ("blocked" | "needs_review").
+    """
+    if safety_result.get("safe", True):
+        return None
+
+    if safety_result.get("tier") == "block" or safety_result.get("needs_theme_retry", False):
+        return "blocked"
+
+    if policy.auto_safe_mode:
+        apply_safe_mode(user_input)
+        return None
+    return "needs_review"
+
+
+def _read_records(stream: TextIO) -> Iterator[Tuple[str, Optional[Dict], Optional[str]]]:
+    """
+    (kayıt id, user_input, hata) üretir. Okunamayan satır batch'i durdurmaz: user_input None,
+    hata mesajı dolu gelir ve çıktıya "error" kaydı yazılır.
+    """
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield str(line_no), None, f"Geçersiz JSON satırı ({line_no}): {e}"
+            continue
+        if not isinstance(record, dict):
+            yield str(line_no), None, f"Satır {line_no} bir JSON nesnesi değil"
+            continue
+        record_id = str(record.get("request_id") or record.get("id") or line_no)
+        if isinstance(record.get("user_input"), dict):
+            user_input = dict(record["user_input"])
+        else:
+            user_input = {k: v for k, v in record.items() if k not in _META_KEYS}
+        yield record_id, user_input, None
+
+
+class BatchRunner:
+    """
+    Ortak LLM, SafetyGuard ve Pipeline nesnelerini kullanarak kayıtları işler.
+    Etmenler durumsuz olduğundan tüm worker'lar aynı nesneleri paylaşır.
+    deadline_s: kayıt başına toplam süre bütçesi (ön kontrol + güvenlik + pipeline);
+    None ise LLM_DEADLINE_S kullanılır. Aşama zaman aşımları her durumda geçerlidir.
+    checkpoints: verilirse her kaydın aşamaları (düzeltilmiş girdi, güvenlik, taslak, eleştiri,
+    final) kaydedilir; yarıda kalan batch aynı dosyayla tekrar çalıştırıldığında kaldığı yerden sürer.
+    Yedek yoldan geçen aşamalar (düzeltilemeyen girdi, regex'e kalan güvenlik kararı, yedek eleştiri)
+    kaydedilmez; tekrar çalıştırmada yeniden denenir.
+    drafts > 1 ise her kayıt için o kadar taslak paralel üretilip en iyisi seçilir (core.best_of_n).
+    refine_tier: "fast" | "standard" | "premium"; ilk düzenlemeden sonraki eleştirmen -> editör
+    turlarının sayısı ve bütçesi (core.refine.REFINE_TIERS). None ise tur yapılmaz.
+    aspect_critic: eleştirmen tema/dil/karakter/kurgu boyutlarını ayrı ve eşzamanlı promptlarla
+    değerlendirir (agents.aspect_critic); birleşik JSON aynı formattadır.
+    edit_mode: "full" (editör hikayeyi baştan yazar) | "patch" (sadece değişen paragrafları
+    düzenleme listesi olarak döndürür, agents.patch_editor; uygulanamazsa tam metne düşülür)
+    | "chunked" (uzun taslak paragraf pencerelerine bölünüp eşzamanlı düzenlenir, agents.chunked_editor).
+    chapters: "long" kayıtlarda bölüm sayısı; bölümler paralel yazılır (core.chapters). 0 = tek parça.
+    """
+
+    def __init__(self, llm, policy: SafetyPolicy, correct_typos: bool = True,
+                 deadline_s: Optional[float] = None, checkpoints: Optional[CheckpointStore] = None,
+                 drafts: int = 1, draft_concurrency: Optional[int] = None, draft_budget: Optional[int] = None,
+                 refine_tier: Optional[str] = None, chapters: int = DEFAULT_CHAPTERS,
+                 aspect_critic: bool = False, edit_mode: str = "full"):
+        self.llm = llm
+        self.policy = policy
+        self.correct_typos = correct_typos
+        self.deadline_s = deadline_s
+        self.checkpoints = checkpoints
+        self.guard = SafetyGuard(llm)
+        self.preflight = PreflightAgent(llm, self.guard)
+        writer = WriterAgent(llm)
+        editor = {"patch": PatchEditorAgent, "chunked": ChunkedEditorAgent}.get(edit_mode, EditorAgent)(llm)
+        critic = AspectCriticAgent(llm) if aspect_critic else CriticAgent(llm)
+        drafter = None
+        if drafts > 1:
+            drafter = BestOfNDrafter(writer, critic, n=drafts, max_concurrency=draft_concurrency,
+                                     token_budget=draft_budget)
+        refiner = RefinementLoop.for_tier(critic, editor, refine_tier) if refine_tier else None
+        long_form = ChapterWorkshop(writer, critic, editor, chapters=chapters) if chapters > 0 else None
+        self.pipeline = StoryWorkshopPipeline(
+            writer, critic, editor, checkpoints=checkpoints, drafter=drafter, refiner=refiner,
+            long_form=long_form
+        )
+
+    def _record(self, record_id: str, status: str, user_input: Dict, safety: Optional[Dict] = None,
+                result: Optional[Dict] = None, error: Optional[str] = None) -> Dict:
+        out = {"id": record_id, "status": status, "user_input": user_input, "safety": safety}
+        if result is not None:
+            out["result"] = result
+        if error is not None:
+            out["error"] = error
+        return out
+
+    def process(self, record_id: str, user_input: Dict) -> Optional[Dict]:
+        # Ön kontrol ve güvenlik çağrıları da dahil, kayıt başına aşama metrikleri ve süre bütçesi
+        with metrics_scope() as metrics, deadline_scope(Deadline.from_env(self.deadline_s)):
+            record = self._process(record_id, user_input)
+        return self._with_metrics(record, metrics)
+
+    async def aprocess(self, record_id: str, user_input: Dict) -> Optional[Dict]:
+        with metrics_scope() as metrics, deadline_scope(Deadline.from_env(self.deadline_s)):
+            record = await self._aprocess(record_id, user_input)
+        return self._with_metrics(record, metrics)
+
+    def _with_metrics(self, record: Optional[Dict], metrics: MetricsRecorder) -> Optional[Dict]:
+        if record is not None:
+            record["metrics"] = metrics.summary()
+        return record
+
+    def _job(self, record_id: str, user_input: Dict) -> Tuple[Optional[str], Dict]:
+        # Ön kontrol girdiyi yerinde değiştirebildiği için anahtar orijinal girdiden hesaplanır
+        if self.checkpoints is None:
+            return None, {}
+        job_id = self.checkpoints.job_key(record_id, user_input)
+        return job_id, self.checkpoints.load(job_id)
+
+    def _resume(self, job_id: Optional[str], saved: Dict, stage: str):
+        if stage in saved:
+            self.checkpoints.note_resumed(stage)
+            return saved[stage]
+        return None
+
+    def _checkpoint(self, job_id: Optional[str], saved: Dict, stage: str, data, done: bool = True) -> None:
+        # done=False: aşama yedek yoldan geçti (süre aşımı/hata); tekrar çalıştırmada yeniden denenir
+        if job_id is not None and done and stage not in saved:
+            self.checkpoints.save(job_id, stage, data)
+
+    def _process(self, record_id: str, user_input: Dict) -> Optional[Dict]:
+        job_id, saved = self._job(record_id, user_input)
+        try:
+            corrected = True
+            if self.correct_typos:
+                if "input" in saved:
+                    user_input = self._resume(job_id, saved, "input")
+                else:
+                    user_input, corrected = self.preflight.correct(user_input)
+                    self._checkpoint(job_id, saved, "input", user_input, done=corrected)
+            safety = self._resume(job_id, saved, "safety") or self.guard.check_and_input(user_input)
+            # Düzeltilmemiş girdinin ya da sadece regex'e dayanan kararın kaydı tutulmaz
+            self._checkpoint(job_id, saved, "safety", safety, done=corrected and not safety.get("fallback"))
+            verdict = apply_safety_policy(user_input, safety, self.policy)
+            if verdict == "blocked" and self.policy.skip_blocked:
+                return None
+            if verdict is not None:
+                return self._record(record_id, verdict, user_input, safety)
+
+            # Düzeltilmemiş girdiyle üretilen aşamalar da kaydedilmez (tekrar çalıştırmada girdi düzelir)
+            result = self.pipeline.run(user_input, job_id=job_id if corrected else None)
+            return self._record(record_id, result.get("status", "complete"), user_input, safety, result)
+        except Exception as e:
+            return self._record(record_id, "error", user_input, error=str(e))
+
+    async def _aprocess(self, record_id: str, user_input: Dict) -> Optional[Dict]:
+        job_id, saved = self._job(record_id, user_input)
+        try:
+            corrected = True
+            if self.correct_typos:
+                if "input" in saved:
+                    user_input = self._resume(job_id, saved, "input")
+                else:
+                    user_input, corrected = await self.preflight.acorrect(user_input)
+                    self._checkpoint(job_id, saved, "input", user_input, done=corrected)
+            safety = self._resume(job_id, saved, "safety") or await self.guard.acheck_and_input(user_input)
+            # Düzeltilmemiş girdinin ya da sadece regex'e dayanan kararın kaydı tutulmaz
+            self._checkpoint(job_id, saved, "safety", safety, done=corrected and not safety.get("fallback"))
+            verdict = apply_safety_policy(user_input, safety, self.policy)
+            if verdict == "blocked" and self.policy.skip_blocked:
+                return None
+            if verdict is not None:
+                return self._record(record_id, verdict, user_input, safety)
+
+            # Düzeltilmemiş girdiyle üretilen aşamalar da kaydedilmez (tekrar çalıştırmada girdi düzelir)
+            result = await self.pipeline.arun(user_input, job_id=job_id if corrected else None)
+            return self._record(record_id, result.get("status", "complete"), user_input, safety, result)
+        except Exception as e:
+            return self._record(record_id, "error", user_input, error=str(e))
+
+
+def _write(out: TextIO, record: Optional[Dict], counts: Dict[str, int]) -> None:
+    if record is None:
+        counts["skipped"] = counts.get("skipped", 0) + 1
+        return
+    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    out.flush()
+    counts[record["status"]] = counts.get(record["status"], 0) + 1
+
+
+def run_batch_threads(runner: BatchRunner, inp: TextIO, out: TextIO, workers: int = 4) -> Dict[str, int]:
+    """
+    Thread havuzu ile işler. Bekleyen iş sayısı workers*2 ile sınırlıdır,
+    böylece büyük dosyalarda bellek kullanımı sabit kalır.
+    """
+    counts: Dict[str, int] = {}
+    max_pending = max(1, workers) * 2
+    pending = set()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for record_id, user_input, error in _read_records(inp):
+            if error is not None:
+                _write(out, {"id": record_id, "status": "error", "error": error}, counts)
+                continue
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    _write(out, fut.result(), counts)
+            pending.add(pool.submit(runner.process, record_id, user_input))
+        for fut in as_completed(pending):
+            _write(out, fut.result(), counts)
+    return counts
+
+
+async def run_batch_async(runner: BatchRunner, inp: TextIO, out: TextIO, workers: int = 16) -> Dict[str, int]:
+    """
+    asyncio ile işler: sabit sayıda worker görevi sınırlı bir kuyruktan kayıt çeker.
+    """
+    counts: Dict[str, int] = {}
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, workers) * 2)
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                _write(out, await runner.aprocess(*item), counts)
+            finally:
+                queue.task_done()
+
+    tasks = [asyncio.create_task(worker()) for _ in range(max(1, workers))]
+    for record_id, user_input, error in _read_records(inp):
+        if error is not None:
+            _write(out, {"id": record_id, "status": "error", "error": error}, counts)
+            continue
+        await queue.put((record_id, user_input))
+    for _ in tasks:
+        await queue.put(None)
+    await asyncio.gather(*tasks)
+    return counts
+
+
+def _run(args, runner: BatchRunner, inp: TextIO, out: TextIO) -> Dict[str, int]:
+    if args.mode == "async":
+        return asyncio.run(run_batch_async(runner, inp, out, args.workers))
+    return run_batch_threads(runner, inp, out, args.workers)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Yapay Hikaye Atölyesi - toplu (batch) mod")
+    parser.add_argument("input", help="Girdi JSONL dosyası ('-' = stdin)")
+    parser.add_argument("-o", "--output", default="-", help="Çıktı JSONL dosyası ('-' = stdout)")
+    parser.add_argument("--workers", type=int, default=4, help="Eşzamanlı worker sayısı")
+    parser.add_argument("--mode", choices=["thread", "async"], default="thread", help="Worker havuzu tipi")
+    parser.add_argument("--auto-safe-mode", action="store_true", help="Sınırda içerikleri Güvenli Mod ile işle")
+    parser.add_argument("--skip-blocked", action="store_true", help="Yasaklı içerikleri çıktıya yazma")
+    parser.add_argument("--no-typo", action="store_true", help="Yazım hatası düzeltme adımını atla")
+    parser.add_argument("--deadline", type=float, help="Kayıt başına toplam süre bütçesi (saniye)")
+    parser.add_argument("--checkpoint", help="Aşama kayıtlarının tutulacağı SQLite dosyası (kaldığı yerden devam)")
+    parser.add_argument("--drafts", type=int, default=1, help="Kayıt başına paralel taslak sayısı (best-of-N)")
+    parser.add_argument("--draft-concurrency", type=int, help="Aynı anda üretilen taslak sayısı (varsayılan: --drafts)")
+    parser.add_argument("--draft-budget", type=int, help="Taslak adaylarının tahmini toplam token bütçesi")
+    parser.add_argument("--refine-tier", choices=list(REFINE_TIERS),
+                        help="Düzenleme sonrası eleştirmen -> editör turları (fast: tur yok, premium: en çok)")
+    parser.add_argument("--aspect-critic", action="store_true",
+                        help="Eleştiriyi tema/dil/karakter/kurgu boyutlarına bölüp eşzamanlı çalıştır")
+    parser.add_argument("--edit-mode", choices=["full", "patch", "chunked"], default="full",
+                        help="Editör: tam metin, sadece değişen paragraflar (patch) ya da paralel pencereler (chunked)")
+    parser.add_argument("--chapters", type=int, default=DEFAULT_CHAPTERS,
+                        help="'long' kayıtlarda paralel yazılan bölüm sayısı (0 = tek parça üretim)")
+    parser.add_argument("--metrics-out", help="Bitince Prometheus formatında metriklerin yazılacağı dosya")
+    args = parser.parse_args(argv)
+
+    from llm.llm_config import get_llm
+
+    policy = SafetyPolicy(auto_safe_mode=args.auto_safe_mode, skip_blocked=args.skip_blocked)
+    checkpoints = CheckpointStore(args.checkpoint) if args.checkpoint else None
+    runner = BatchRunner(get_llm(), policy, correct_typos=not args.no_typo, deadline_s=args.deadline,
+                         checkpoints=checkpoints, drafts=args.drafts, draft_concurrency=args.draft_concurrency,
+                         draft_budget=args.draft_budget, refine_tier=args.refine_tier,
+                         chapters=args.chapters, aspect_critic=args.aspect_critic,
+                         edit_mode=args.edit_mode)
+
+    inp = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        # Etmenlerin ilerleme print'leri JSONL çıktısına karışmasın diye stderr'e yönlendirilir
+        with redirect_stdout(sys.stderr):
+            counts = _run(args, runner, inp, out)
+    finally:
+        if inp is not sys.stdin:
+            inp.close()
+        if out is not sys.stdout:
+            out.close()
+
+    if args.metrics_out:
+        with open(args.metrics_out, "w", encoding="utf-8") as f:
+            f.write(GLOBAL_METRICS.to_prometheus())
+
+    print(f"Batch tamamlandı: {counts}", file=sys.stderr)
+    if checkpoints is not None:
+        print(f"Kayıtlardan devam edilen aşamalar: {checkpoints.stats()['resumed']}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
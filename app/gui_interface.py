@@ -1,170 +1,99 @@
-import threading
 import json
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import messagebox, scrolledtext, simpledialog
 from tkinter import ttk
 
-from llm.llm_config import get_llm
-from agents.writer_agent import WriterAgent
-from agents.critic_agent import CriticAgent
-from agents.editor_agent import EditorAgent
-from core.pipeline import StoryWorkshopPipeline
-from agents.safety import SafetyGuard
-
-# --- YAZIM HATASI DÜZELTİCİ ---
-def correct_typos_with_llm(user_input: dict, llm) -> dict:
-    """
-    Kullanıcı girdisindeki bariz yazım hatalarını (Typos) düzeltir.
-    Örn: "öümcek" -> "Örümcek", "korku evi" -> "Korku Evi"
-    """
-    try:
-        # LLM'e sadece JSON verip düzeltmesini istiyoruz
-        prompt = f"""
-Sen bir Türkçe İmla Denetçisisin.
-Aşağıdaki JSON verisindeki "title", "genre", "theme" ve "characters" alanlarını düzelt.
-
-KURALLAR:
-1. Başlıkları "Title Case" yap (İlk harfler büyük).
-2. "characters" listesindeki HER İSMİN baş harfini büyüt (Örn: ["elif", "can"] -> ["Elif", "Can"]).
-3. Sadece JSON formatında yanıt ver. Başka hiçbir şey yazma.
-4. Anlamı bozma, sadece imla düzelt.
-
-Girdi JSON:
-{json.dumps(user_input, ensure_ascii=False)}
-"""
-        response = llm(prompt).strip()
-        
-        # JSON temizleme (Markdown ```json ... ``` varsa siler)
-        if "```" in response:
-            response = response.split("```")[1].replace("json", "").strip()
-        elif response.startswith("json"):
-            response = response[4:].strip()
+from core.session import get_session
+from agents.safety import apply_safe_mode
+from llm.cancel import CancelToken, OperationCancelled, cancel_scope
 
-        corrected_data = json.loads(response)
-        
-        # Eski veriyle birleştirir
-        user_input.update(corrected_data)
-        return user_input
+def _ask_safety_resolution(user_input: dict, safety_result: dict) -> str:
 
-    except Exception as e:
-        print(f"Typo düzeltme hatası: {e}")
-        return user_input # Hata olursa orijinalini döndürür
+    # Güvensiz bulunan girdi için uyarı diyaloglarını gösterir (Tk ana thread'inde çağrılır).
+    # Dönüş: "retry" (alan değişti, tekrar kontrol) | "safe_mode" (güvenli modda devam) | "cancel"
 
-def apply_safety_flow_with_gui(root: tk.Tk, user_input: dict, llm):
+    tier = safety_result.get("tier", "borderline")
+    score = safety_result.get("negativity_score", "?")
+    msg = safety_result.get("message", "Güvenlik filtresi devreye girdi.")
+    sug = safety_result.get("suggestion", "Lütfen daha güvenli bir içerik düşün.")
+    full_msg = f"Skor: {score}/10 | Seviye: {tier}\n\n{msg}\n\nÖneri: {sug}"
 
-    # GUI üzerinden güvenlik akışını yürütür.
+    # Hangi alanın hatalı olduğunu tespit ediyoruz
+    target_field = "theme"   # Varsayılan olarak Tema
+    display_label = "Tema"
     
-    guard = SafetyGuard(llm)
-    forced_safe_mode = False
-
-    while True:
-        safety_result = guard.check_and_input(user_input)
-
-        # Güvenli ise çık
-        if safety_result.get("safe", True):
-            break
-
-        tier = safety_result.get("tier", "borderline")
-        score = safety_result.get("negativity_score", "?")
-        msg = safety_result.get("message", "Güvenlik filtresi devreye girdi.")
-        sug = safety_result.get("suggestion", "Lütfen daha güvenli bir içerik düşün.")
-        full_msg = f"Skor: {score}/10 | Seviye: {tier}\n\n{msg}\n\nÖneri: {sug}"
-
-        # Hangi alanın hatalı olduğunu tespit ediyoruz
-        target_field = "theme"   # Varsayılan olarak Tema
-        display_label = "Tema"
+    # Mesajın içinde "Tür" veya "Başlık" geçiyorsa hedefi değiştiriyoruz
+    if "Tür" in msg or "Genre" in msg:
+        target_field = "genre"
+        display_label = "Tür (Genre)"
+    elif "Başlık" in msg or "Title" in msg:
+        target_field = "title"
+        display_label = "Başlık"
         
-        # Mesajın içinde "Tür" veya "Başlık" geçiyorsa hedefi değiştiriyoruz
-        if "Tür" in msg or "Genre" in msg:
-            target_field = "genre"
-            display_label = "Tür (Genre)"
-        elif "Başlık" in msg or "Title" in msg:
-            target_field = "title"
-            display_label = "Başlık"
-            
-        # Başlık girilirse otomatik baş harfleri büyütme fonksiyonu
-        def clean_input(val):
-            if not val: return val
-            if target_field == "title": # Sadece başlık ise Title Case yap
-                return val.strip().title()
-            return val.strip()
-
-        # ✅ 0) Yazim hatali bile olsa hassas kelime yakalandiysa
-        if safety_result.get("needs_theme_retry", False):
-            messagebox.showwarning(
-                f"{display_label} Değiştirilmeli",
-                full_msg + f"\n\nBu ifade hassas sayılır. Devam etmek için '{display_label}' alanını değiştirmelisin."
-            )
-            new_val = simpledialog.askstring(f"Yeni {display_label}", f"Yeni, daha güvenli bir {display_label} yazın:")
-            
-            if not new_val:
-                messagebox.showinfo("İptal", "Değişiklik yapılmadı, işlem iptal edildi.")
-                return False, None
-            
-            user_input[target_field] = clean_input(new_val) 
-            continue
-
-        # 1) HIGH RISK: block -> sadece ilgili alanı değiştir
-        if tier == "block":
-            messagebox.showwarning("Güvenlik Uyarısı", full_msg + "\n\nBu içerik ile devam edemeyiz.")
-            new_val = simpledialog.askstring(f"Yeni {display_label}", f"Yeni, daha güvenli bir {display_label} yazın:")
-            
-            if not new_val:
-                messagebox.showinfo("İptal", "Değişiklik yapılmadı, işlem iptal edildi.")
-                return False, None
-            
-            user_input[target_field] = clean_input(new_val) 
-            continue
-
-        # 2) BORDERLINE: değiştir mi, yoksa safe mode ile devam mı?
-        retry = messagebox.askyesno(
-            "Güvenlik Uyarısı",
-            full_msg + f"\n\nDaha güvenli bir {display_label} ile tekrar denemek ister misin?\n"
-                       f"(Evet: Yeni {display_label})  (Hayır: Güvenli modda devam)"
+    # Başlık girilirse otomatik baş harfleri büyütme fonksiyonu
+    def clean_input(val):
+        if not val: return val
+        if target_field == "title": # Sadece başlık ise Title Case yap
+            return val.strip().title()
+        return val.strip()
+
+    # ✅ 0) Yazim hatali bile olsa hassas kelime yakalandiysa
+    if safety_result.get("needs_theme_retry", False):
+        messagebox.showwarning(
+            f"{display_label} Değiştirilmeli",
+            full_msg + f"\n\nBu ifade hassas sayılır. Devam etmek için '{display_label}' alanını değiştirmelisin."
         )
+        new_val = simpledialog.askstring(f"Yeni {display_label}", f"Yeni, daha güvenli bir {display_label} yazın:")
+        
+        if not new_val:
+            messagebox.showinfo("İptal", "Değişiklik yapılmadı, işlem iptal edildi.")
+            return "cancel"
+        
+        user_input[target_field] = clean_input(new_val) 
+        return "retry"
 
-        if retry:
-            new_val = simpledialog.askstring(f"Yeni {display_label}", f"Yeni, daha güvenli bir {display_label} yazın:")
-            if not new_val:
-                messagebox.showinfo("İptal", "İşlem iptal edildi.")
-                return False, None
-            
-            user_input[target_field] = clean_input(new_val) 
-            continue
+    # 1) HIGH RISK: block -> sadece ilgili alanı değiştir
+    if tier == "block":
+        messagebox.showwarning("Güvenlik Uyarısı", full_msg + "\n\nBu içerik ile devam edemeyiz.")
+        new_val = simpledialog.askstring(f"Yeni {display_label}", f"Yeni, daha güvenli bir {display_label} yazın:")
+        
+        if not new_val:
+            messagebox.showinfo("İptal", "Değişiklik yapılmadı, işlem iptal edildi.")
+            return "cancel"
+        
+        user_input[target_field] = clean_input(new_val) 
+        return "retry"
+
+    # 2) BORDERLINE: değiştir mi, yoksa safe mode ile devam mı?
+    retry = messagebox.askyesno(
+        "Güvenlik Uyarısı",
+        full_msg + f"\n\nDaha güvenli bir {display_label} ile tekrar denemek ister misin?\n"
+                   f"(Evet: Yeni {display_label})  (Hayır: Güvenli modda devam)"
+    )
 
-        # Hayır -> safe mode ile devam (isteğe bağlı yaş sorusu)
+    if retry:
+        new_val = simpledialog.askstring(f"Yeni {display_label}", f"Yeni, daha güvenli bir {display_label} yazın:")
+        if not new_val:
+            messagebox.showinfo("İptal", "İşlem iptal edildi.")
+            return "cancel"
         
-        age = simpledialog.askinteger("Yaş (Opsiyonel)", "Daha uygun bir ton için yaşınızı girin (iptal = sorma):")
-        if age is not None and age < 13:
-            constraints = user_input.get("constraints") or []
-            constraints.append("Çocuk dostu: korku/şiddet yok, yumuşak dil, umut ve yardımlaşma odaklı.")
-            user_input["constraints"] = constraints
-
-        messagebox.showinfo(
-            "Güvenli Mod",
-            "Aynı konu korunacak ama güvenli/etik çerçevede (PG) işlenecek."
-        )
-        forced_safe_mode = True
-        break
+        user_input[target_field] = clean_input(new_val) 
+        return "retry"
 
-    # safe mode constraint
-    if forced_safe_mode:
+    # Hayır -> safe mode ile devam (isteğe bağlı yaş sorusu)
+    
+    age = simpledialog.askinteger("Yaş (Opsiyonel)", "Daha uygun bir ton için yaşınızı girin (iptal = sorma):")
+    if age is not None and age < 13:
         constraints = user_input.get("constraints") or []
-        constraints.append(
-            "Güvenli mod: zararlı eylemleri detaylı tarif etme/teşvik etme. "
-            "Grafik detay verme. Etik boyut, iyileşme, umut ve destek temasına odaklan."
-        )
+        constraints.append("Çocuk dostu: korku/şiddet yok, yumuşak dil, umut ve yardımlaşma odaklı.")
         user_input["constraints"] = constraints
-        user_input["style"] = (user_input.get("style") or "") + " | PG, grafik detaysız"
-
-    return True, user_input
 
-def run_workshop_no_safety(user_input: dict, llm) -> dict:
-    writer = WriterAgent(llm)
-    critic = CriticAgent(llm)
-    editor = EditorAgent(llm)
-    pipeline = StoryWorkshopPipeline(writer, critic, editor)
-    return pipeline.run(user_input)
+    messagebox.showinfo(
+        "Güvenli Mod",
+        "Aynı konu korunacak ama güvenli/etik çerçevede (PG) işlenecek."
+    )
+    return "safe_mode"
 
 def _pretty_json_if_possible(text: str) -> str:
     try:
@@ -320,6 +249,12 @@ def create_gui():
     btn_row.grid(row=6, column=0, columnspan=2, sticky="ew", pady=(12, 0))
     btn_row.columnconfigure(0, weight=1)
     btn_row.columnconfigure(1, weight=1)
+    btn_row.columnconfigure(2, weight=1)
+
+    # Tüm LLM işleri bu havuzda yürür; Tk ana thread'i hiç beklemez.
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="workshop")
+    # generation: her yeni çalıştırma/iptalde artar; eski işlerin geç gelen sonuçları atılır
+    run_state = {"generation": 0, "token": None}
 
     def clear_outputs():
         text_draft.delete("1.0", tk.END)
@@ -330,14 +265,77 @@ def create_gui():
         if is_running:
             run_button.config(state="disabled")
             clear_button.config(state="disabled")
+            cancel_button.config(state="normal")
             progress.start(12)
             # Not: status mesajını çağıran yere bırakalım
         else:
             progress.stop()
             run_button.config(state="normal")
             clear_button.config(state="normal")
+            cancel_button.config(state="disabled")
             status_var.set("Hazır")
 
+    def is_current(generation: int) -> bool:
+        token = run_state["token"]
+        return generation == run_state["generation"] and token is not None and not token.cancelled
+
+    def post(generation: int, fn, *args):
+        # Arka plandan ana thread'e aktarım; iptal edilmiş/eskimiş çalıştırmanın sonucu atılır
+        def deliver():
+            if is_current(generation):
+                fn(*args)
+        root.after(0, deliver)
+
+    def submit(generation: int, job, on_done):
+        # job arka planda iptal bayrağına bağlı çalışır, sonucu on_done ile ana thread'e gelir
+        token = run_state["token"]
+
+        def run():
+            try:
+                with cancel_scope(token):
+                    result = job()
+            except OperationCancelled:
+                return
+            except Exception as e:
+                post(generation, fail, e)
+                return
+            post(generation, on_done, result)
+
+        executor.submit(run)
+
+    def fail(error: Exception):
+        set_running(False)
+        messagebox.showerror("Hata", str(error))
+
+    def on_cancel():
+        token = run_state["token"]
+        if token is not None:
+            token.cancel()
+        run_state["generation"] += 1
+        set_running(False)
+        status_var.set("İptal edildi.")
+
+    def show_corrected(corrected_input: dict):
+        # Düzeltilenleri ekrana yansıtır (GUI Update)
+        entry_title.delete(0, tk.END)
+        entry_title.insert(0, corrected_input.get("title", ""))
+
+        entry_genre.delete(0, tk.END)
+        entry_genre.insert(0, corrected_input.get("genre", ""))
+
+        entry_theme.delete(0, tk.END)
+        entry_theme.insert(0, corrected_input.get("theme", ""))
+        
+        # Karakter listesini "Ali, Veli" formatına çevirip kutuya yaz
+        c_list = corrected_input.get("characters", [])
+        if isinstance(c_list, list):
+            c_str = ", ".join(c_list)
+        else:
+            c_str = str(c_list)
+            
+        entry_chars.delete(0, tk.END)
+        entry_chars.insert(0, c_str)
+
     def on_run():
         title = entry_title.get().strip()
         genre = entry_genre.get().strip()
@@ -366,94 +364,111 @@ def create_gui():
 
         clear_outputs()
 
+        # Yeni çalıştırma: önceki işin geç gelen sonuçları artık geçersiz
+        run_state["generation"] += 1
+        run_state["token"] = CancelToken()
+        generation = run_state["generation"]
+        set_running(True)
+
+        # Paylaşılan oturum: model/bağlantı ve etmenler her tıklamada yeniden kurulmaz
+        session = get_session()
+
         # ==========================================
-        # 0) LLM YÜKLEME VE YAZIM HATASI DÜZELTME
+        # 0) YAZIM HATASI DÜZELTME + GÜVENLİK SKORU (tek LLM çağrısı)
         # ==========================================
-        llm = get_llm()
-        
-        # Kullanıcıya bilgi ver
         status_var.set("Yazım hataları kontrol ediliyor...")
-        progress.start(10)
-        root.update()
 
-        # Typo düzeltme çağrısı
-        corrected_input = correct_typos_with_llm(user_input, llm)
+        def after_preflight(corrected_input: dict):
+            show_corrected(corrected_input)
+            check_safety(corrected_input)
 
-        # Düzeltilenleri ekrana yansıtır (GUI Update)
-        entry_title.delete(0, tk.END)
-        entry_title.insert(0, corrected_input.get("title", ""))
-
-        entry_genre.delete(0, tk.END)
-        entry_genre.insert(0, corrected_input.get("genre", ""))
-
-        entry_theme.delete(0, tk.END)
-        entry_theme.insert(0, corrected_input.get("theme", ""))
-        
-        # Karakter listesini "Ali, Veli" formatına çevirip kutuya yaz
-        c_list = corrected_input.get("characters", [])
-        if isinstance(c_list, list):
-            c_str = ", ".join(c_list)
-        else:
-            c_str = str(c_list)
-            
-        entry_chars.delete(0, tk.END)
-        entry_chars.insert(0, c_str)
-        
-        root.update() # Ekranı yenile
+        submit(generation, lambda: session.preflight.run(user_input), after_preflight)
 
         # ==========================================
         # 1) GÜVENLİK AKIŞI (Düzeltilmiş veriyle)
         # ==========================================
-        status_var.set("Güvenlik kontrolü yapılıyor...")
-        root.update()
-
-        proceed, safe_input = apply_safety_flow_with_gui(root, corrected_input, llm)
+        def check_safety(current_input: dict):
+            status_var.set("Güvenlik kontrolü yapılıyor...")
+            submit(
+                generation,
+                lambda: session.guard.check_and_input(current_input),
+                lambda safety_result: resolve_safety(current_input, safety_result),
+            )
 
-        if not proceed or safe_input is None:
-            # Kullanıcı iptal etti
-            progress.stop()
-            status_var.set("İptal edildi.")
-            return
+        def resolve_safety(current_input: dict, safety_result: dict):
+            if safety_result.get("safe", True):
+                start_pipeline(current_input)
+                return
+            # Diyaloglar ana thread'de; kontrol çağrıları arka planda
+            action = _ask_safety_resolution(current_input, safety_result)
+            if not is_current(generation):
+                return
+            if action == "retry":
+                check_safety(current_input)
+            elif action == "safe_mode":
+                apply_safe_mode(current_input)
+                start_pipeline(current_input)
+            else:
+                # Kullanıcı iptal etti
+                set_running(False)
+                status_var.set("İptal edildi.")
 
         # ==========================================
-        # 2) LLM + PIPELINE (Arka Planda)
+        # 2) PIPELINE (Arka Planda, akışlı)
         # ==========================================
-        set_running(True)
-        status_var.set("Hikaye üretiliyor...")
-        
-        safe_input = dict(safe_input)  # thread'e kopya verelim
-
-        def worker():
-            try:
-                result = run_workshop_no_safety(safe_input, llm)
-                if result is None:
-                    root.after(0, lambda: set_running(False))
-                    return
-
-                draft = result.get("draft_story", "")
-                critic = result.get("critic_feedback", "")
-                final = result.get("final_story", "")
-
-                def update_ui():
-                    text_draft.insert(tk.END, draft)
-                    text_feedback.insert(tk.END, _pretty_json_if_possible(critic))
-                    text_final.insert(tk.END, final)
-                    notebook.select(tab_final)
-                    set_running(False)
+        def start_pipeline(safe_input: dict):
+            status_var.set("Hikaye üretiliyor...")
+            safe_input = dict(safe_input)  # thread'e kopya verelim
+            targets = {"draft": (text_draft, tab_draft), "final": (text_final, tab_final)}
+
+            def append(widget, tab, chunk):
+                # İlk parça geldiğinde ilgili sekmeye geç
+                if widget.index("end-1c") == "1.0":
+                    notebook.select(tab)
+                widget.insert(tk.END, chunk)
+                widget.see(tk.END)
+
+            def show_critique(payload: str):
+                text_feedback.insert(tk.END, _pretty_json_if_possible(payload))
+                status_var.set("Editör revize ediyor...")
+
+            def stream_job() -> dict:
+                result = {}
+                for event, payload in session.pipeline.stream(safe_input):
+                    if event in targets:
+                        widget, tab = targets[event]
+                        post(generation, append, widget, tab, payload)
+                    elif event == "critique":
+                        post(generation, show_critique, payload)
+                    elif event == "result":
+                        result = payload
+                return result
+
+            def update_ui(result: dict):
+                status = result.get("status")
+                if status == "needs_clarification":
+                    text_draft.insert(tk.END, result.get("draft_story", ""))
+                    notebook.select(tab_draft)
+                set_running(False)
+                if status in ("partial", "timeout"):
+                    # Editör yetişemediyse final sekmesinde taslak gösterilir
+                    if status == "partial":
+                        text_final.delete("1.0", tk.END)
+                        text_final.insert(tk.END, result.get("final_story", ""))
+                    status_var.set(f"Süre doldu ({result.get('timed_out_stage')}); kısmi sonuç gösteriliyor.")
+                else:
                     status_var.set("Tamamlandı.")
 
-                root.after(0, update_ui)
-            except Exception as e:
-                root.after(0, lambda: messagebox.showerror("Hata", str(e)))
-                root.after(0, lambda: set_running(False))
-
-        threading.Thread(target=worker, daemon=True).start()
+            submit(generation, stream_job, update_ui)
 
     run_button = ttk.Button(btn_row, text="Atölyeyi Başlat", command=on_run)
     run_button.grid(row=0, column=0, sticky="ew", padx=(0, 6))
 
+    cancel_button = ttk.Button(btn_row, text="İptal", command=on_cancel, state="disabled")
+    cancel_button.grid(row=0, column=1, sticky="ew", padx=6)
+
     clear_button = ttk.Button(btn_row, text="Temizle", command=clear_outputs)
-    clear_button.grid(row=0, column=1, sticky="ew", padx=(6, 0))
+    clear_button.grid(row=0, column=2, sticky="ew", padx=(6, 0))
 
     # örnek default değerler
     entry_title.insert(0, "Kırık Pencere")
@@ -462,6 +477,7 @@ def create_gui():
     entry_theme.insert(0, "umut")
 
     root.mainloop()
+    executor.shutdown(wait=False, cancel_futures=True)
 
 
 if __name__ == "__main__":
@@ -1,55 +1,6 @@
 import sys
-import json
-from llm.llm_config import get_llm
-from agents.writer_agent import WriterAgent
-from agents.critic_agent import CriticAgent
-from agents.editor_agent import EditorAgent
-from core.pipeline import StoryWorkshopPipeline
-from agents.safety import SafetyGuard
-
-# --- AKILLI DÜZELTİCİ ---
-def correct_typos_with_llm(user_input: dict, llm) -> dict:
-    """
-    Kullanıcı girdisindeki bozuk yazımları, eksik harfleri ve karakter isimlerini düzeltir.
-    Örn: "Kucuk Prns" -> "Küçük Prens", "drma" -> "Dram", "nurhgül" -> "Nurgül"
-    """
-    print("⏳  Yapay zeka başlık ve isimleri analiz edip düzeltiyor...")
-    try:
-        prompt = f"""
-Sen uzman bir Türkçe Editörü ve Düzeltmenisin.
-Görevin: Aşağıdaki JSON verisindeki alanları analiz et ve hatalı/eksik yazımları EN DOĞRU Türkçe haline çevir.
-
-KURALLAR:
-1. "Kucuk prns", "Harry pottr" gibi bilinen kitap/film adlarını tanı ve tam doğrusunu yaz (Küçük Prens, Harry Potter).
-2. "drma", "fantstik", "korku" gibi türleri düzelt (Dram, Fantastik, Korku).
-3. Karakter isimlerindeki yazım yanlışlarını gider ve Baş Harflerini Büyüt (Örn: "nurhgül" -> "Nurgül", "aynur" -> "Aynur").
-4. İngilizce karakterlerle yazılmış Türkçe kelimeleri düzelt (s -> ş, i -> ı, g -> ğ, c -> ç vb. bağlama göre).
-5. SADECE JSON formatında yanıt ver.
-
-Örnek Davranış:
-Girdi: {{"title": "kucuk prns", "genre": "drma", "characters": ["aynur", "nurhgul"]}}
-Çıktı: {{"title": "Küçük Prens", "genre": "Dram", "characters": ["Aynur", "Nurgül"]}}
-
-ŞİMDİ BU VERİYİ DÜZELT:
-{json.dumps(user_input, ensure_ascii=False)}
-"""
-        response = llm(prompt).strip()
-        
-        # JSON temizleme
-        if "```" in response:
-            response = response.split("```")[1].replace("json", "").strip()
-        elif response.startswith("json"):
-            response = response[4:].strip()
-
-        corrected_data = json.loads(response)
-        
-        # Eski veriyle birleştir
-        user_input.update(corrected_data)
-        return user_input
-
-    except Exception as e:
-        print(f"⚠️  Düzeltme sırasında hata oluştu (önemsiz): {e}")
-        return user_input
+from agents.safety import apply_safe_mode
+from core.session import get_session
 
 def _ask_yes_no(prompt: str) -> bool:
     """Kullanıcıya E/H sorar, True/False döner."""
@@ -71,7 +22,8 @@ def _ask_age() -> int:
 
 def run_interface():
    
-    llm = get_llm()
+    # LLM istemcisi, guard ve pipeline süreç boyunca tekrar kullanılır
+    session = get_session()
 
     print("\n=== YAPAY HIKAYE ATOLYESI (TERMINAL) ===\n")
 
@@ -92,8 +44,10 @@ def run_interface():
         "style": "sade ve akici Turkce"
     }
 
-    # --- 1. ADIM: TYPO VE KARAKTER DÜZELTME ---
-    user_input = correct_typos_with_llm(user_input, llm)
+    # --- 1. ADIM: TYPO DÜZELTME + GÜVENLİK SKORU (tek LLM çağrısı) ---
+    print("⏳  Yapay zeka başlık ve isimleri analiz edip düzeltiyor...")
+    preflight = session.preflight
+    user_input = preflight.run(user_input)
     
     # Kullanıcıya neyin düzeltildiğini gösteriyoruz
     print(f"\n✅  Algılanan Başlık: {user_input['title']}")
@@ -103,8 +57,8 @@ def run_interface():
     print(f"✅  Algılanan Karakterler: {c_str}")
     print("-" * 30)
 
-    # SafetyGuard'a llm veriyoruz
-    guard = SafetyGuard(llm)
+    # SafetyGuard ön kontrolde hazırlanan güvenlik kararını önbelleğinde tutar
+    guard = preflight.guard
     forced_safe_mode = False 
 
     # 🔒 Güvenlik + Tekrar Deneme Döngüsü
@@ -169,35 +123,48 @@ def run_interface():
         break 
 
     if forced_safe_mode:
-        constraints = user_input.get("constraints") or []
-        constraints.append(
-            "Güvenli mod: zararlı eylemleri detaylı tarif etme/teşvik etme. "
-            "Grafik detay verme. Etik boyut, iyileşme, umut ve destek temasına odaklan."
-        )
-        user_input["constraints"] = constraints
-        user_input["style"] = (user_input.get("style") or "") + " | PG, grafik detaysız"
+        apply_safe_mode(user_input)
         print("⚠️ Not: Hikaye duygusal ve etik boyuta odaklanacak.\n")
 
-    writer = WriterAgent(llm)
-    critic = CriticAgent(llm)
-    editor = EditorAgent(llm)
-    pipeline = StoryWorkshopPipeline(writer, critic, editor)
+    pipeline = session.pipeline
 
     print("\n--- Hikaye üretiliyor... ---\n")
-    result = pipeline.run(user_input)
 
-    if result.get("status") == "needs_clarification":
-        print("\n❓ YAZARIN SORULARI VAR:\n")
-        print(result.get("draft_story"))
-    else:
-        print("\n" + "="*20 + " TASLAK " + "="*20)
-        print(result.get("draft_story", ""))
+    # Metin geldikçe ekrana yazılır; tüm hikayenin bitmesi beklenmez
+    current_section = None
+    for event, payload in pipeline.stream(user_input):
+        if event == "result":
+            if payload.get("status") == "needs_clarification":
+                print("\n❓ YAZARIN SORULARI VAR:\n")
+                print(payload.get("draft_story"))
+            elif payload.get("status") in ("partial", "timeout"):
+                print(f"\n\n⏱️ Süre doldu ({payload.get('timed_out_stage')} aşaması yetişemedi).")
+                if payload.get("status") == "partial":
+                    print("Final olarak taslak kullanıldı.")
+            else:
+                print()
+            break
 
-        print("\n" + "="*20 + " ELESTIRI " + "="*20)
-        print(result.get("critic_feedback", ""))
+        if event == "refine":
+            # İyileştirme turları finali değiştirdiyse yeni final baştan yazılır
+            rounds = payload.get("rounds", [])
+            print(f"\n\n🔁 İyileştirme: {len(rounds)} tur ({payload.get('stop_reason')})")
+            if payload.get("final_story"):
+                print("\n" + "="*20 + " IYILESTIRILMIS FINAL " + "="*20)
+                print(payload["final_story"], end="", flush=True)
+            continue
 
-        print("\n" + "="*20 + " FINAL HIKAYE " + "="*20)
-        print(result.get("final_story", ""))
+        if event != current_section:
+            current_section = event
+            label = {"draft": " TASLAK ", "critique": " ELESTIRI ", "final": " FINAL HIKAYE "}.get(event)
+            if label is None:
+                continue
+            print("\n" + "="*20 + label + "="*20)
+
+        if event == "critique":
+            print(payload)
+        else:
+            print(payload, end="", flush=True)
 
 if __name__ == "__main__":
     run_interface()
\ No newline at end of file
@@ -0,0 +1,407 @@
+"""
+Yerel HTTP servisi: tek bir sıcak süreç (paylaşılan LLM havuzu, SafetyGuard önbellekleri)
+birçok istemciye atölye hizmeti verir. Sadece standart kütüphane (asyncio) kullanılır.
+
+Uç noktalar:
+    POST   /jobs              {"user_input": {...}, "policy": {"auto_safe_mode": true},
+                               "correct_typos": true, "deadline_s": 120}
+                              -> 202 {"id": ..., "status": "queued"}  (kuyruk doluysa 429)
+    GET    /jobs/{id}         -> işin durumu ve (bittiyse) sonucu
+    GET    /jobs/{id}/events  -> Server-Sent Events: typo, safety, draft, critique, final, result, status
+    DELETE /jobs/{id}         -> işi iptal eder
+    GET    /metrics           -> Prometheus metin formatında LLM metrikleri
+    GET    /health            -> kuyruk ve havuz durumu
+
+Kullanım:
+    python -m app.server --port 8080 --workers 4 --queue-size 32
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.batch import SafetyPolicy, apply_safety_policy
+from core.session import WorkshopSession, get_session
+from llm.cancel import CancelToken, OperationCancelled, cancel_scope
+from llm.deadline import Deadline, deadline_scope
+from llm.metrics import GLOBAL_METRICS, metrics_scope
+
+_REASONS = {
+    200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error",
+}
+_MAX_BODY = 64 * 1024
+# Bitmiş işlerin durumu bu kadar iş boyunca sorgulanabilir kalır
+_MAX_FINISHED_JOBS = 1000
+_FINAL_STATUSES = {
+    "complete", "partial", "timeout", "needs_clarification", "blocked", "needs_review", "error", "cancelled",
+}
+
+
+class Job:
+    """
+    Kuyruktaki tek atölye isteği. Olaylar (event, veri) listesinde birikir; SSE abonesi
+    önce geçmişi, sonra canlı olayları alır. Olay ekleme her zaman event loop thread'inde olur.
+    """
+
+    def __init__(self, user_input: Dict, policy: SafetyPolicy, correct_typos: bool = True,
+                 deadline_s: Optional[float] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.user_input = user_input
+        self.policy = policy
+        self.correct_typos = correct_typos
+        self.deadline_s = deadline_s
+        self.status = "queued"
+        self.safety: Optional[Dict] = None
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.token = CancelToken()
+        self.events: List[Tuple[str, Any]] = []
+        self._subscribers: List[asyncio.Queue] = []
+
+    @property
+    def done(self) -> bool:
+        return self.status in _FINAL_STATUSES
+
+    def append(self, event: str, data: Any) -> None:
+        self.events.append((event, data))
+        for queue in self._subscribers:
+            queue.put_nowait((event, data))
+
+    def subscribe(self) -> Tuple[List[Tuple[str, Any]], asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        return list(self.events), queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        if queue in self._subscribers:
+            self._subscribers.remove(queue)
+
+    def set_status(self, status: str) -> None:
+        self.status = status
+        if status == "running":
+            self.started_at = time.time()
+        elif status in _FINAL_STATUSES:
+            self.finished_at = time.time()
+        self.append("status", {"status": status})
+
+    def to_dict(self) -> Dict:
+        out = {
+            "id": self.id,
+            "status": self.status,
+            "user_input": self.user_input,
+            "safety": self.safety,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.result is not None:
+            out["result"] = self.result
+        if self.error is not None:
+            out["error"] = self.error
+        return out
+
+
+class WorkshopService:
+    """
+    Sınırlı kuyruk + sabit sayıda worker. Worker'lar işi thread havuzunda (senkron akışla)
+    yürütür; üretilen olaylar call_soon_threadsafe ile event loop'a aktarılır.
+    Kuyruk doluysa submit QueueFull fırlatır (HTTP tarafında 429).
+    """
+
+    def __init__(self, session: WorkshopSession, workers: int = 4, queue_size: int = 32):
+        self.session = session
+        self.workers = max(1, workers)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="workshop-job")
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for job in self.jobs.values():
+            job.token.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, job: Job) -> Job:
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise
+        self.jobs[job.id] = job
+        self._forget_old_jobs()
+        job.append("status", {"status": job.status})
+        return job
+
+    def cancel(self, job: Job) -> None:
+        job.token.cancel()
+        if job.status == "queued":
+            # Worker kuyruktan aldığında atlar
+            job.set_status("cancelled")
+
+    def _forget_old_jobs(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - _MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            try:
+                if not job.done:
+                    job.set_status("running")
+                    await self._loop.run_in_executor(self._executor, self._run_job, job)
+            finally:
+                self.queue.task_done()
+
+    def _emit(self, job: Job, event: str, data: Any) -> None:
+        self._loop.call_soon_threadsafe(job.append, event, data)
+
+    def _finish(self, job: Job, status: str) -> None:
+        self._loop.call_soon_threadsafe(job.set_status, status)
+
+    def _run_job(self, job: Job) -> None:
+        # Worker thread'i: batch'teki akışla aynı adımlar, olaylar canlı yayınlanır
+        session = self.session
+        user_input = dict(job.user_input)
+        try:
+            with cancel_scope(job.token), deadline_scope(Deadline.from_env(job.deadline_s)), metrics_scope():
+                if job.correct_typos:
+                    user_input = session.preflight.run(user_input)
+                    self._emit(job, "typo", user_input)
+
+                job.safety = session.guard.check_and_input(user_input)
+                self._emit(job, "safety", job.safety)
+                verdict = apply_safety_policy(user_input, job.safety, job.policy)
+                job.user_input = user_input
+                if verdict is not None:
+                    self._finish(job, verdict)
+                    return
+
+                for event, payload in session.pipeline.stream(user_input):
+                    if event == "result":
+                        job.result = payload
+                    self._emit(job, event, payload)
+            self._finish(job, job.result.get("status", "complete") if job.result else "error")
+        except OperationCancelled:
+            self._finish(job, "cancelled")
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, "error")
+
+    def health(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "running": sum(1 for job in self.jobs.values() if job.status == "running"),
+            "rejected": self.rejected,
+            "session": self.session.stats(),
+        }
+
+
+# --- HTTP katmanı ---
+
+def _response(status: int, body: bytes, content_type: str = "application/json; charset=utf-8",
+              extra_headers: Optional[Dict[str, str]] = None) -> bytes:
+    headers = {"Content-Type": content_type, "Content-Length": str(len(body)), "Connection": "close"}
+    headers.update(extra_headers or {})
+    head = f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}\r\n"
+    head += "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+    return head.encode("latin-1") + b"\r\n" + body
+
+
+def _json_response(status: int, data: Any, extra_headers: Optional[Dict[str, str]] = None) -> bytes:
+    return _response(status, json.dumps(data, ensure_ascii=False).encode("utf-8"), extra_headers=extra_headers)
+
+
+def _sse(event: str, data: Any) -> bytes:
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    lines = "".join(f"data: {line}\n" for line in payload.split("\n"))
+    return f"event: {event}\n{lines}\n".encode("utf-8")
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Tuple[str, str, bytes]:
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    parts = request_line.split()
+    if len(parts) < 2:
+        raise ValueError("Geçersiz istek satırı")
+    method, path = parts[0].upper(), parts[1].split("?", 1)[0]
+
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1")
+        if line in ("\r\n", "\n", ""):
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length") or 0)
+    if length > _MAX_BODY:
+        raise OverflowError("İstek gövdesi çok büyük")
+    body = await reader.readexactly(length) if length else b""
+    return method, path, body
+
+
+def _parse_job(body: bytes) -> Job:
+    data = json.loads(body.decode("utf-8") or "{}")
+    user_input = data.get("user_input")
+    if not isinstance(user_input, dict):
+        raise ValueError("'user_input' bir JSON nesnesi olmalı")
+    policy = data.get("policy") or {}
+    deadline_s = data.get("deadline_s")
+    return Job(
+        user_input,
+        SafetyPolicy(auto_safe_mode=bool(policy.get("auto_safe_mode", False))),
+        correct_typos=bool(data.get("correct_typos", True)),
+        deadline_s=float(deadline_s) if deadline_s is not None else None,
+    )
+
+
+class WorkshopServer:
+    """asyncio.start_server üzerinde küçük bir HTTP/1.1 sunucusu (her yanıttan sonra bağlantı kapanır)."""
+
+    def __init__(self, service: WorkshopService):
+        self.service = service
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                method, path, body = await _read_request(reader)
+            except OverflowError as e:
+                writer.write(_json_response(413, {"error": str(e)}))
+                return
+            except (ValueError, asyncio.IncompleteReadError) as e:
+                writer.write(_json_response(400, {"error": str(e)}))
+                return
+            await self._route(method, path, body, writer)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            writer.write(_json_response(500, {"error": str(e)}))
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+
+    async def _route(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        parts = [p for p in path.split("/") if p]
+
+        if parts == ["jobs"]:
+            if method != "POST":
+                writer.write(_json_response(405, {"error": "POST bekleniyor"}))
+                return
+            try:
+                job = _parse_job(body)
+            except (ValueError, TypeError) as e:
+                writer.write(_json_response(400, {"error": str(e)}))
+                return
+            try:
+                self.service.submit(job)
+            except asyncio.QueueFull:
+                writer.write(_json_response(429, {"error": "Kuyruk dolu, daha sonra tekrar deneyin"},
+                                            {"Retry-After": "5"}))
+                return
+            writer.write(_json_response(202, {"id": job.id, "status": job.status},
+                                        {"Location": f"/jobs/{job.id}"}))
+            return
+
+        if parts == ["metrics"] and method == "GET":
+            writer.write(_response(200, GLOBAL_METRICS.to_prometheus().encode("utf-8"),
+                                   "text/plain; version=0.0.4; charset=utf-8"))
+            return
+
+        if parts == ["health"] and method == "GET":
+            writer.write(_json_response(200, self.service.health()))
+            return
+
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.service.jobs.get(parts[1])
+            if job is None:
+                writer.write(_json_response(404, {"error": "İş bulunamadı"}))
+            elif len(parts) == 3 and parts[2] == "events" and method == "GET":
+                await self._stream_events(job, writer)
+            elif len(parts) == 2 and method == "GET":
+                writer.write(_json_response(200, job.to_dict()))
+            elif len(parts) == 2 and method == "DELETE":
+                self.service.cancel(job)
+                writer.write(_json_response(200, {"id": job.id, "status": job.status}))
+            else:
+                writer.write(_json_response(405, {"error": "Desteklenmeyen yöntem"}))
+            return
+
+        writer.write(_json_response(404, {"error": "Bulunamadı"}))
+
+    async def _stream_events(self, job: Job, writer: asyncio.StreamWriter) -> None:
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+            b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n"
+        )
+        history, queue = job.subscribe()
+        try:
+            for event, data in history:
+                writer.write(_sse(event, data))
+            await writer.drain()
+            while not job.done:
+                event, data = await queue.get()
+                writer.write(_sse(event, data))
+                await writer.drain()
+        finally:
+            job.unsubscribe(queue)
+
+
+async def serve(host: str, port: int, workers: int, queue_size: int) -> None:
+    service = WorkshopService(get_session(), workers=workers, queue_size=queue_size)
+    service.start()
+    server = await asyncio.start_server(WorkshopServer(service).handle, host, port)
+    print(f"Atölye servisi http://{host}:{port} adresinde ({workers} worker, kuyruk {queue_size})",
+          file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Yapay Hikaye Atölyesi - HTTP servisi")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=4, help="Aynı anda işlenen iş sayısı")
+    parser.add_argument("--queue-size", type=int, default=32, help="Bekleyen iş sınırı (dolunca 429)")
+    args = parser.parse_args(argv)
+
+    from llm.llm_config import warmup_in_background
+    warmup_in_background()
+    try:
+        # Etmenlerin ilerleme print'leri stderr'e (batch'teki gibi)
+        with redirect_stdout(sys.stderr):
+            asyncio.run(serve(args.host, args.port, args.workers, args.queue_size))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+SafetyGuard bulanık anahtar kelime kontrolü: eski döngü vs. derlenmiş silme indeksi.
+
+Kullanım:
+    python -m benchmarks.bench_fuzzy --sizes 28 1000 20000 --texts 50
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+import re
+import time
+
+from agents.fuzzy_matcher import FuzzyKeywordMatcher
+from agents.safety import SafetyGuard
+
+_LETTERS = "abcçdefgğhıijklmnoöprsştuüvyz"
+
+
+def _levenshtein(a: str, b: str) -> int:
+    if a == b: return 0
+    if not a: return len(b)
+    if not b: return len(a)
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        curr = [i]
+        for j, cb in enumerate(b, start=1):
+            ins = curr[j - 1] + 1
+            dele = prev[j] + 1
+            sub = prev[j - 1] + (0 if ca == cb else 1)
+            curr.append(min(ins, dele, sub))
+        prev = curr
+    return prev[-1]
+
+
+def _contains_fuzzy_keyword(text: str, keyword: str, max_dist: int = 1) -> bool:
+    tokens = re.findall(r"[a-zA-ZçğıöşüÇĞİÖŞÜ]+", text.lower())
+    kw = keyword.lower()
+    for t in tokens:
+        if abs(len(t) - len(kw)) > max_dist:
+            continue
+        if _levenshtein(t, kw) <= max_dist:
+            return True
+    return False
+
+
+def _legacy_check(keywords, text: str):
+    # Değişiklik öncesi SafetyGuard._fuzzy_check_string ile birebir aynı döngü (karşılaştırma için)
+    txt = text.lower()
+    for kw, cat, max_dist, score in keywords:
+        if _contains_fuzzy_keyword(txt, kw, max_dist=max_dist):
+            return cat, kw, score
+    return None
+
+
+def _random_word(rng: random.Random) -> str:
+    return "".join(rng.choice(_LETTERS) for _ in range(rng.randint(4, 11)))
+
+
+def _keyword_list(size: int, rng: random.Random):
+    base = list(SafetyGuard()._FUZZY_KEYWORDS)
+    extra = []
+    while len(base) + len(extra) < size:
+        word = _random_word(rng)
+        if rng.random() < 0.1:
+            word += " " + _random_word(rng)
+        extra.append((word, "diger", rng.randint(0, 2), rng.randint(5, 10)))
+    return base + extra
+
+
+def _texts(count: int, keywords, rng: random.Random):
+    texts = []
+    for _ in range(count):
+        words = [_random_word(rng) for _ in range(rng.randint(2, 12))]
+        if rng.random() < 0.5:
+            kw = rng.choice(keywords)[0]
+            # Küçük bir yazım hatası ekle
+            if len(kw) > 3 and rng.random() < 0.5:
+                i = rng.randrange(len(kw))
+                kw = kw[:i] + kw[i + 1:]
+            words.insert(rng.randrange(len(words) + 1), kw)
+        texts.append(" ".join(words))
+    return texts
+
+
+def run(sizes, text_count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    report = []
+    for size in sizes:
+        keywords = _keyword_list(size, rng)
+        texts = _texts(text_count, keywords, rng)
+
+        t0 = time.perf_counter()
+        matcher = FuzzyKeywordMatcher(keywords)
+        build_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        legacy = [_legacy_check(keywords, t) for t in texts]
+        legacy_s = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        indexed = [matcher.match(t) for t in texts]
+        indexed_s = time.perf_counter() - t0
+
+        # Tek-token eşleşmeleri birebir aynı olmalı; fark sadece n-gram ile
+        # yakalanan çok kelimeli anahtarlardan gelebilir.
+        mismatches = 0
+        for old, new in zip(legacy, indexed):
+            if old != new:
+                assert new is not None and " " in new[1], (old, new)
+                mismatches += 1
+
+        report.append({
+            "keywords": len(keywords),
+            "texts": len(texts),
+            "build_s": round(build_s, 4),
+            "legacy_s": round(legacy_s, 4),
+            "indexed_s": round(indexed_s, 4),
+            "speedup": round(legacy_s / indexed_s, 1) if indexed_s else None,
+            "multiword_only_diffs": mismatches,
+        })
+    return report
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[28, 1000, 20000])
+    parser.add_argument("--texts", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+    for row in run(args.sizes, args.texts, args.seed):
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Başlangıç (import) süresi ölçümü: CLI ve GUI giriş noktaları için `python -X importtime`.
+
+Her giriş noktası ayrı bir süreçte import edilir; toplam süre, en pahalı modüller ve
+google.generativeai'nin başlangıçta yüklenip yüklenmediği raporlanır.
+
+Kullanım:
+    python -m benchmarks.bench_startup --repeat 5 --top 10
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+# Giriş noktası adı -> import edilecek modül
+ENTRY_POINTS = {
+    "main": "main",
+    "cli": "app.interface",
+    "gui": "app.gui_interface",
+    "batch": "app.batch",
+}
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _importtime(module: str) -> List[Dict]:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=_ROOT, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{module} import edilemedi:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # Girinti (iç içe import derinliği) korunur; ilk boşluk ayraçtır
+        rows.append({"module": name[1:].rstrip(), "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    return rows
+
+
+def measure(module: str, repeat: int, top: int) -> Dict:
+    totals, last = [], []
+    for _ in range(repeat):
+        last = _importtime(module)
+        # En üst düzey modüllerin (girintisiz) kümülatif süreleri toplamı = toplam import süresi
+        totals.append(sum(r["cumulative_us"] for r in last if not r["module"].startswith(" ")) / 1000.0)
+    slowest = sorted(last, key=lambda r: r["self_us"], reverse=True)[:top]
+    return {
+        "module": module,
+        "import_ms_median": round(statistics.median(totals), 1),
+        "import_ms_min": round(min(totals), 1),
+        "loads_genai": any(r["module"].strip() == "google.generativeai" for r in last),
+        "slowest_self": [{"module": r["module"].strip(), "self_ms": round(r["self_us"] / 1000.0, 2)} for r in slowest],
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entry", choices=sorted(ENTRY_POINTS), nargs="+", default=sorted(ENTRY_POINTS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+    report = {name: measure(ENTRY_POINTS[name], args.repeat, args.top) for name in args.entry}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
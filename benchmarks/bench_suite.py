@@ -0,0 +1,359 @@
+"""
+Sahte LLM (llm.fake.FakeLLM) üzerinde uçtan uca benchmark paketi; ağ ve API anahtarı gerekmez.
+
+Ölçülenler:
+- safety   : SafetyGuard.check_and_input verimi (önbelleksiz ve tekrar eden girdilerle)
+- pipeline : StoryWorkshopPipeline.run gecikme yüzdelikleri (p50/p90/p99)
+- batch    : app.batch verimi (thread ve async, farklı eşzamanlılık seviyeleri)
+- best_of_n: N paralel taslak + eleştiri seçiminin tek taslağa göre gecikmesi
+- quota    : kota (429) altında çıplak istemci ile llm.resilience katmanının başarılı çağrı verimi
+
+Kullanım:
+    python -m benchmarks.bench_suite --out rapor.json
+    python -m benchmarks.bench_suite --out yeni.json --compare eski.json
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import io
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from typing import Dict, List, Optional
+
+from agents.aspect_critic import AspectCriticAgent
+from agents.critic_agent import CriticAgent
+from agents.chunked_editor import ChunkedEditorAgent
+from agents.editor_agent import EditorAgent
+from agents.patch_editor import PatchEditorAgent
+from agents.safety import SafetyGuard
+from agents.writer_agent import WriterAgent
+from app.batch import BatchRunner, SafetyPolicy, run_batch_async, run_batch_threads
+from core.best_of_n import BestOfNDrafter
+from core.chapters import ChapterWorkshop
+from core.pipeline import StoryWorkshopPipeline
+from llm.fake import FakeLLM, LatencyModel
+from llm.metrics import InstrumentedLLM, metrics_scope
+from llm.resilience import AIMDLimiter, RateLimiter, ResilientLLM
+
+# Gerçek Gemini çağrılarına kabaca benzeyen aşama gecikmeleri (ms, lognormal medyan)
+_STAGE_LATENCY_MS = {
+    "preflight": 700, "typo": 600, "safety": 600,
+    "outline": 1500, "writer": 3000, "critic": 1800, "critic-repair": 900, "editor": 3000,
+}
+
+_THEMES = ["umut", "kayıp", "değişim", "dostluk", "yalnızlık", "cesaret", "özlem", "keşif"]
+_GENRES = ["dram", "fantastik", "macera", "gizem", "bilim kurgu"]
+_NAMES = ["Ali", "Zeynep", "Deniz", "Elif", "Murat", "Ece", "Kerem", "Aslı"]
+
+
+def _fake_llm(scale: float, error_rate: float, seed: int) -> FakeLLM:
+    latency = {stage: LatencyModel(mean_ms=ms * scale) for stage, ms in _STAGE_LATENCY_MS.items()}
+    return FakeLLM(latency=latency, error_rate=error_rate, seed=seed)
+
+
+def _inputs(count: int) -> List[Dict]:
+    out = []
+    for i in range(count):
+        out.append({
+            "title": f"Hikaye {i}",
+            "genre": _GENRES[i % len(_GENRES)],
+            "characters": [_NAMES[i % len(_NAMES)], _NAMES[(i + 3) % len(_NAMES)]],
+            "theme": f"{_THEMES[i % len(_THEMES)]} {i}",
+            "length": "short",
+        })
+    return out
+
+
+def _percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples_ms)
+
+    def pct(p: float) -> float:
+        idx = min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))
+        return round(ordered[idx], 2)
+
+    return {
+        "p50_ms": pct(50), "p90_ms": pct(90), "p99_ms": pct(99),
+        "mean_ms": round(statistics.fmean(ordered), 2), "max_ms": round(ordered[-1], 2),
+    }
+
+
+def bench_safety(count: int, seed: int) -> Dict:
+    guard = SafetyGuard(FakeLLM(seed=seed))
+    inputs = _inputs(count)
+
+    t0 = time.perf_counter()
+    for u in inputs:
+        guard.check_and_input(u)
+    cold_s = time.perf_counter() - t0
+
+    # Aynı girdiler tekrar: alan ve karar önbellekleri devrede
+    t0 = time.perf_counter()
+    for u in inputs:
+        guard.check_and_input(u)
+    warm_s = time.perf_counter() - t0
+
+    return {
+        "inputs": count,
+        "cold_ops_per_s": round(count / cold_s, 1) if cold_s else None,
+        "warm_ops_per_s": round(count / warm_s, 1) if warm_s else None,
+    }
+
+
+def bench_pipeline(runs: int, scale: float, error_rate: float, seed: int) -> Dict:
+    llm = _fake_llm(scale, error_rate, seed)
+    pipeline = StoryWorkshopPipeline(WriterAgent(llm), CriticAgent(llm), EditorAgent(llm))
+    samples, errors = [], 0
+    for u in _inputs(runs):
+        t0 = time.perf_counter()
+        try:
+            pipeline.run(u)
+        except Exception:
+            errors += 1
+            continue
+        samples.append((time.perf_counter() - t0) * 1000)
+    result = {"runs": runs, "errors": errors}
+    if samples:
+        result.update(_percentiles(samples))
+    return result
+
+
+def bench_batch(records: int, levels: List[int], scale: float, error_rate: float, seed: int) -> List[Dict]:
+    lines = "".join(json.dumps(u, ensure_ascii=False) + "\n" for u in _inputs(records))
+    rows = []
+    for mode in ("thread", "async"):
+        for workers in levels:
+            llm = _fake_llm(scale, error_rate, seed)
+            runner = BatchRunner(llm, SafetyPolicy(auto_safe_mode=True), correct_typos=True)
+            out = io.StringIO()
+            t0 = time.perf_counter()
+            if mode == "thread":
+                counts = run_batch_threads(runner, io.StringIO(lines), out, workers)
+            else:
+                counts = asyncio.run(run_batch_async(runner, io.StringIO(lines), out, workers))
+            elapsed = time.perf_counter() - t0
+            rows.append({
+                "mode": mode,
+                "workers": workers,
+                "records": records,
+                "records_per_s": round(records / elapsed, 2) if elapsed else None,
+                "elapsed_s": round(elapsed, 3),
+                "statuses": counts,
+            })
+    return rows
+
+
+def bench_best_of_n(runs: int, levels: List[int], scale: float, seed: int) -> List[Dict]:
+    rows = []
+    for n in levels:
+        llm = _fake_llm(scale, 0.0, seed)
+        writer, critic = WriterAgent(llm), CriticAgent(llm)
+        drafter = BestOfNDrafter(writer, critic, n=n) if n > 1 else None
+        pipeline = StoryWorkshopPipeline(writer, critic, EditorAgent(llm), drafter=drafter)
+        samples = []
+        for u in _inputs(runs):
+            t0 = time.perf_counter()
+            pipeline.run(u)
+            samples.append((time.perf_counter() - t0) * 1000)
+        rows.append({"n": n, "runs": runs, "llm_calls": llm.calls, **_percentiles(samples)})
+    return rows
+
+
+def bench_critic(runs: int, scale: float, seed: int) -> List[Dict]:
+    # Tek uzun eleştiri promptu vs eşzamanlı boyut promptları (gecikme çıktı uzunluğuyla artar)
+    rows = []
+    story = "\n\n".join(u["theme"] * 40 for u in _inputs(3))
+    for mode, agent in (("single", CriticAgent), ("aspects", AspectCriticAgent)):
+        latency = {stage: LatencyModel(mean_ms=ms * scale, per_token_ms=20 * scale)
+                   for stage, ms in _STAGE_LATENCY_MS.items()}
+        llm = FakeLLM(latency=latency, seed=seed)
+        critic = agent(llm)
+        samples = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            critic.run(story)
+            samples.append((time.perf_counter() - t0) * 1000)
+        rows.append({"mode": mode, "runs": runs, "llm_calls": llm.calls, **_percentiles(samples)})
+    return rows
+
+
+def bench_editor(runs: int, scale: float, seed: int) -> List[Dict]:
+    # Tam metin düzenleme vs düzenleme listesi (patch) vs parçalı (chunked, uzun taslak):
+    # editör çıktı tokenı ve gecikmesi
+    rows = []
+    modes = (("full", EditorAgent, "medium"), ("patch", PatchEditorAgent, "medium"),
+             ("full", EditorAgent, "long"), ("chunked", ChunkedEditorAgent, "long"))
+    for mode, agent, length in modes:
+        latency = {stage: LatencyModel(mean_ms=ms * scale, per_token_ms=20 * scale)
+                   for stage, ms in _STAGE_LATENCY_MS.items()}
+        llm = InstrumentedLLM(FakeLLM(latency=latency, seed=seed))
+        writer, critic, editor = WriterAgent(llm), CriticAgent(llm), agent(llm)
+        samples, output_tokens = [], 0
+        for u in _inputs(runs):
+            draft = writer.generate_draft(dict(u, length=length))["content"]
+            feedback = critic.run(draft)
+            # Sadece editör adımı ölçülür (eşzamanlı çağrılarda aşama toplamı değil, geçen süre)
+            with metrics_scope() as metrics:
+                t0 = time.perf_counter()
+                editor.revise(draft, feedback)
+                samples.append((time.perf_counter() - t0) * 1000)
+            output_tokens += metrics.summary().get("editor", {}).get("response_tokens", 0)
+        row = {"mode": mode, "length": length, "runs": runs,
+               "mean_output_tokens": round(output_tokens / runs, 1), **_percentiles(samples)}
+        if mode != "full":
+            row["editor_stats"] = editor.stats()
+        rows.append(row)
+    return rows
+
+
+def bench_long(runs: int, chapters: int, scale: float, seed: int) -> List[Dict]:
+    # Gecikme çıktı uzunluğuyla artar (token başına ~20 ms): tek parça uzun üretim vs paralel bölümler
+    rows = []
+    for mode in ("single", "chapters"):
+        latency = {stage: LatencyModel(mean_ms=ms * scale, per_token_ms=20 * scale)
+                   for stage, ms in _STAGE_LATENCY_MS.items()}
+        llm = FakeLLM(latency=latency, seed=seed)
+        writer, critic, editor = WriterAgent(llm), CriticAgent(llm), EditorAgent(llm)
+        long_form = ChapterWorkshop(writer, critic, editor, chapters=chapters) if mode == "chapters" else None
+        pipeline = StoryWorkshopPipeline(writer, critic, editor, long_form=long_form)
+        samples, chars = [], 0
+        for u in _inputs(runs):
+            t0 = time.perf_counter()
+            result = pipeline.run(dict(u, length="long"))
+            samples.append((time.perf_counter() - t0) * 1000)
+            chars += len(result["final_story"])
+        rows.append({"mode": mode, "runs": runs, "llm_calls": llm.calls,
+                     "mean_final_chars": chars // runs, **_percentiles(samples)})
+    return rows
+
+
+def bench_quota(calls: int, workers: int, quota_rpm: float, seed: int) -> List[Dict]:
+    rows = []
+    for mode in ("raw", "resilient"):
+        fake = FakeLLM(latency={"default": LatencyModel(kind="fixed", mean_ms=20)}, seed=seed, quota_rpm=quota_rpm)
+        llm = fake
+        if mode == "resilient":
+            llm = ResilientLLM(
+                fake, RateLimiter(rpm=quota_rpm, burst_s=1.0), AIMDLimiter(initial=workers, max_limit=workers),
+                max_retries=8, base_delay=0.05, max_delay=1.0, seed=seed,
+            )
+        ok = 0
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for fut in [pool.submit(llm, "merhaba") for _ in range(calls)]:
+                try:
+                    fut.result()
+                    ok += 1
+                except Exception:
+                    pass
+        elapsed = time.perf_counter() - t0
+        rows.append({
+            "mode": mode,
+            "calls": calls,
+            "ok": ok,
+            "rejected_by_server": fake.rejected,
+            "ok_per_s": round(ok / elapsed, 2) if elapsed else None,
+            "quota_per_s": round(quota_rpm / 60.0, 2),
+            "elapsed_s": round(elapsed, 3),
+        })
+    return rows
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(args) -> Dict:
+    # Etmenlerin ilerleme print'leri rapora karışmasın
+    with redirect_stdout(sys.stderr):
+        return {
+            "meta": {
+                "revision": _git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "seed": args.seed,
+                "latency_scale": args.latency_scale,
+                "error_rate": args.error_rate,
+            },
+            "safety": bench_safety(args.safety_inputs, args.seed),
+            "pipeline": bench_pipeline(args.pipeline_runs, args.latency_scale, args.error_rate, args.seed),
+            "batch": bench_batch(args.batch_records, args.levels, args.latency_scale, args.error_rate, args.seed),
+            "best_of_n": bench_best_of_n(args.best_of_n_runs, [1, 3, 5], args.latency_scale, args.seed),
+            "critic": bench_critic(args.critic_runs, args.latency_scale, args.seed),
+            "editor": bench_editor(args.editor_runs, args.latency_scale, args.seed),
+            "long": bench_long(args.long_runs, args.chapters, args.latency_scale, args.seed),
+            "quota": bench_quota(args.quota_calls, max(args.levels), args.quota_rpm, args.seed),
+        }
+
+
+def _flatten(report: Dict) -> Dict[str, float]:
+    flat = {}
+    for key in ("cold_ops_per_s", "warm_ops_per_s"):
+        flat[f"safety.{key}"] = report["safety"].get(key)
+    for key in ("p50_ms", "p90_ms", "p99_ms"):
+        flat[f"pipeline.{key}"] = report["pipeline"].get(key)
+    for row in report["batch"]:
+        flat[f"batch.{row['mode']}.w{row['workers']}.records_per_s"] = row["records_per_s"]
+    for row in report.get("best_of_n", []):
+        flat[f"best_of_n.n{row['n']}.p50_ms"] = row["p50_ms"]
+    for row in report.get("quota", []):
+        flat[f"quota.{row['mode']}.ok_per_s"] = row["ok_per_s"]
+    return flat
+
+
+def compare(new: Dict, old: Dict) -> List[Dict]:
+    """İki rapordaki ortak metriklerin oranları (yeni / eski)."""
+    old_flat, rows = _flatten(old), []
+    for key, value in _flatten(new).items():
+        before = old_flat.get(key)
+        ratio = round(value / before, 3) if value and before else None
+        rows.append({"metric": key, "old": before, "new": value, "ratio": ratio})
+    return rows
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="-", help="JSON rapor dosyası ('-' = stdout)")
+    parser.add_argument("--compare", help="Karşılaştırılacak önceki rapor")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--latency-scale", type=float, default=0.01,
+                        help="Aşama gecikmelerinin çarpanı (1.0 = gerçekçi, 0 = gecikmesiz)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--safety-inputs", type=int, default=2000)
+    parser.add_argument("--pipeline-runs", type=int, default=50)
+    parser.add_argument("--batch-records", type=int, default=64)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--best-of-n-runs", type=int, default=10)
+    parser.add_argument("--critic-runs", type=int, default=10)
+    parser.add_argument("--editor-runs", type=int, default=10)
+    parser.add_argument("--long-runs", type=int, default=5)
+    parser.add_argument("--chapters", type=int, default=4, help="Uzun mod ölçümündeki bölüm sayısı")
+    parser.add_argument("--quota-rpm", type=float, default=3000, help="Sahte sunucu kotası (istek/dakika)")
+    parser.add_argument("--quota-calls", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
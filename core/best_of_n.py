@@ -0,0 +1,133 @@
+from __future__ import annotations
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from llm.budget import DRAFT_TOKENS_BY_LENGTH
+from llm.metrics import estimate_tokens
+from llm.structured import parse_json_lenient
+
+# Eleştirmen promptunun sabit kısmı ve JSON yanıtı (yaklaşık token)
+_CRITIC_OVERHEAD_TOKENS = 600
+
+
+def critic_score(feedback: str) -> float:
+    """Eleştirmen JSON'ındaki confidence_score (okunamazsa 0)."""
+    try:
+        data = parse_json_lenient(feedback, record=False)
+        return float(data.get("confidence_score", 0)) if isinstance(data, dict) else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class BestOfNDrafter:
+    """
+    N taslağı eşzamanlı üretir, her birini (kendi taslağı biter bitmez) eleştirmene puanlatır
+    ve en yüksek confidence_score'lu taslağı eleştirisiyle birlikte döndürür.
+    Toplam süre en yavaş 'taslak + eleştiri' zinciri kadardır; zincirler gerçekten paraleldir
+    (senkron yolda thread havuzu, asenkron yolda asyncio.gather).
+
+    - n: aday sayısı
+    - max_concurrency: aynı anda çalışan aday zinciri sayısı (None = n)
+    - token_budget: adayların tahmini toplam token maliyeti üst sınırı; aşılacaksa n düşürülür
+      (en az 1 aday her zaman üretilir)
+    """
+
+    def __init__(self, writer, critic, n: int = 3, max_concurrency: Optional[int] = None,
+                 token_budget: Optional[int] = None):
+        self.writer = writer
+        self.critic = critic
+        self.n = max(1, n)
+        self.max_concurrency = max(1, max_concurrency or self.n)
+        self.token_budget = token_budget
+        self._lock = threading.Lock()
+        self._stats = {"runs": 0, "candidates": 0, "failed": 0, "budget_limited": 0, "best_score_total": 0.0}
+
+    def candidate_cost(self, user_input: Dict) -> int:
+        """Tek adayın tahmini token maliyeti: yazar promptu + taslak + taslağı okuyan eleştirmen."""
+        draft = DRAFT_TOKENS_BY_LENGTH.get(user_input.get("length", "short"), DRAFT_TOKENS_BY_LENGTH["medium"])
+        return estimate_tokens(self.writer._build_prompt(user_input)) + 2 * draft + _CRITIC_OVERHEAD_TOKENS
+
+    def candidates_for(self, user_input: Dict) -> int:
+        if self.token_budget is None:
+            return self.n
+        return max(1, min(self.n, self.token_budget // max(1, self.candidate_cost(user_input))))
+
+    # --- tek aday zinciri ---
+    def _candidate(self, user_input: Dict) -> Tuple[Dict, Optional[str]]:
+        writer_output = self.writer.generate_draft(user_input)
+        if writer_output.get("type") == "clarification":
+            return writer_output, None
+        return writer_output, self.critic.run(writer_output.get("content", ""))
+
+    async def _acandidate(self, user_input: Dict, semaphore: asyncio.Semaphore) -> Tuple[Dict, Optional[str]]:
+        async with semaphore:
+            writer_output = await self.writer.agenerate_draft(user_input)
+            if writer_output.get("type") == "clarification":
+                return writer_output, None
+            return writer_output, await self.critic.arun(writer_output.get("content", ""))
+
+    def run(self, user_input: Dict) -> Tuple[Dict, Optional[str]]:
+        """(writer_output, critic_feedback) döndürür; belirsiz girdide critic_feedback None'dır."""
+        n = self.candidates_for(user_input)
+        if n == 1:
+            return self._select(n, [self._outcome(self._candidate, user_input)])
+        with ThreadPoolExecutor(max_workers=min(n, self.max_concurrency)) as pool:
+            # Her aday kendi bağlam kopyasında: aşama, metrik, süre ve iptal kapsamları thread'e taşınır
+            futures = [
+                pool.submit(contextvars.copy_context().run, self._outcome, self._candidate, user_input)
+                for _ in range(n)
+            ]
+            outcomes = [f.result() for f in futures]
+        return self._select(n, outcomes)
+
+    async def arun(self, user_input: Dict) -> Tuple[Dict, Optional[str]]:
+        n = self.candidates_for(user_input)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results = await asyncio.gather(
+            *(self._acandidate(user_input, semaphore) for _ in range(n)), return_exceptions=True
+        )
+        outcomes = [(None, r) if isinstance(r, BaseException) else (r, None) for r in results]
+        for _, error in outcomes:
+            if isinstance(error, asyncio.CancelledError):
+                raise error
+        return self._select(n, outcomes)
+
+    @staticmethod
+    def _outcome(fn, *args) -> Tuple[Any, Optional[BaseException]]:
+        try:
+            return fn(*args), None
+        except Exception as e:
+            return None, e
+
+    def _select(self, n: int, outcomes: List[Tuple[Any, Optional[BaseException]]]) -> Tuple[Dict, Optional[str]]:
+        done = [value for value, error in outcomes if error is None]
+        errors = [error for _, error in outcomes if error is not None]
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["candidates"] += n
+            self._stats["failed"] += len(errors)
+            self._stats["budget_limited"] += int(n < self.n)
+        if not done:
+            # Hiç aday yoksa ilk hata (örn. DeadlineExceeded) pipeline'a iletilir
+            raise errors[0]
+
+        for writer_output, feedback in done:
+            if feedback is None:
+                return writer_output, None
+
+        scored = [(critic_score(feedback), writer_output, feedback) for writer_output, feedback in done]
+        best_score, writer_output, feedback = max(scored, key=lambda item: item[0])
+        with self._lock:
+            self._stats["best_score_total"] += best_score
+        writer_output = dict(writer_output, candidate_scores=[score for score, _, _ in scored])
+        return writer_output, feedback
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats.pop("best_score_total")
+        stats["mean_best_score"] = round(total / stats["runs"], 2) if stats["runs"] else None
+        return stats
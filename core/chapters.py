@@ -0,0 +1,125 @@
+from __future__ import annotations
+import asyncio
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from core.best_of_n import critic_score
+from llm.deadline import DeadlineExceeded
+from llm.structured import parse_json_lenient
+
+DEFAULT_CHAPTERS = 4
+
+
+class ChapterWorkshop:
+    """
+    Uzun ("long") hikayeler için bölüm bazlı atölye.
+    1) Yazar önce bölüm planı çıkarır (karakterler, mekan, bölüm özetleri).
+    2) Her bölüm kendi zincirinde yazılır -> eleştirilir -> düzenlenir; zincirler eşzamanlıdır.
+       Bölüm promptu ortak karakter/tema bilgisini ve sadece komşu bölümlerin özetlerini içerir.
+    3) Bölümler sırasıyla birleştirilir.
+    Toplam süre yaklaşık 'plan + en yavaş bölüm zinciri' kadardır (bölüm sayısıyla doğrusal değil).
+
+    Süre dolarsa: plan ya da herhangi bir bölüm taslağı yetişmezse DeadlineExceeded pipeline'a
+    iletilir; eleştiri/düzenlemesi yetişmeyen bölümde o bölümün taslağı kullanılır ve sonuçta
+    "timed_out_stage" işaretlenir.
+    """
+
+    def __init__(self, writer, critic, editor, chapters: int = DEFAULT_CHAPTERS,
+                 max_concurrency: Optional[int] = None):
+        self.writer = writer
+        self.critic = critic
+        self.editor = editor
+        self.chapters = max(1, chapters)
+        self.max_concurrency = max(1, max_concurrency or self.chapters)
+
+    def applies(self, user_input: Dict) -> bool:
+        return user_input.get("length") == "long" and not self.writer._needs_clarification(user_input)
+
+    # --- tek bölüm zinciri ---
+    def _chapter(self, user_input: Dict, outline: Dict, index: int) -> Dict[str, Any]:
+        draft = self.writer.generate_chapter(user_input, outline, index)
+        chapter = {"index": index, "draft": draft, "feedback": "", "final": draft}
+        try:
+            chapter["feedback"] = self.critic.run(draft)
+            chapter["final"] = self.editor.revise(draft, chapter["feedback"])
+        except DeadlineExceeded as e:
+            chapter["timed_out_stage"] = e.stage or ("editor" if chapter["feedback"] else "critic")
+        return chapter
+
+    async def _achapter(self, user_input: Dict, outline: Dict, index: int,
+                        semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        async with semaphore:
+            draft = await self.writer.agenerate_chapter(user_input, outline, index)
+            chapter = {"index": index, "draft": draft, "feedback": "", "final": draft}
+            try:
+                chapter["feedback"] = await self.critic.arun(draft)
+                chapter["final"] = await self.editor.arevise(draft, chapter["feedback"])
+            except DeadlineExceeded as e:
+                chapter["timed_out_stage"] = e.stage or ("editor" if chapter["feedback"] else "critic")
+            return chapter
+
+    def run(self, user_input: Dict) -> Dict[str, Any]:
+        """
+        Dönüş:
+        {"outline": {...}, "chapters": [{"index", "draft", "feedback", "final"[, "timed_out_stage"]}, ...]}
+        """
+        outline = self.writer.generate_outline(user_input, self.chapters)
+        count = len(outline["chapters"])
+        with ThreadPoolExecutor(max_workers=min(count, self.max_concurrency)) as pool:
+            # Her bölüm kendi bağlam kopyasında: aşama, metrik, süre ve iptal kapsamları thread'e taşınır
+            futures = [
+                pool.submit(contextvars.copy_context().run, self._chapter, user_input, outline, index)
+                for index in range(count)
+            ]
+            chapters = [f.result() for f in futures]
+        return {"outline": outline, "chapters": chapters}
+
+    async def arun(self, user_input: Dict) -> Dict[str, Any]:
+        outline = await self.writer.agenerate_outline(user_input, self.chapters)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        chapters = await asyncio.gather(
+            *(self._achapter(user_input, outline, index, semaphore) for index in range(len(outline["chapters"])))
+        )
+        return {"outline": outline, "chapters": list(chapters)}
+
+    # --- birleştirme ---
+    @staticmethod
+    def stitch(outline: Dict, chapters: List[Dict], key: str) -> str:
+        """Bölüm metinlerini (key: "draft" | "final") bölüm başlıklarıyla sırasıyla birleştirir."""
+        parts = []
+        for chapter in sorted(chapters, key=lambda c: c["index"]):
+            title = outline["chapters"][chapter["index"]]["title"]
+            parts.append(f"{chapter['index'] + 1}. {title}\n\n{chapter[key]}")
+        return "\n\n".join(parts)
+
+    @staticmethod
+    def merge_feedback(outline: Dict, chapters: List[Dict]) -> str:
+        """
+        Bölüm eleştirilerini tek JSON'da toplar: bölüm bazlı değerlendirmeler "chapters" altında,
+        confidence_score eleştirilen bölümlerin ortalamasıdır.
+        """
+        reviews = []
+        for chapter in sorted(chapters, key=lambda c: c["index"]):
+            if not chapter["feedback"]:
+                continue
+            try:
+                parsed = parse_json_lenient(chapter["feedback"], record=False)
+            except ValueError:
+                parsed = {}
+            review = {"chapter": chapter["index"] + 1, "title": outline["chapters"][chapter["index"]]["title"]}
+            review.update(parsed if isinstance(parsed, dict) else {})
+            reviews.append(review)
+        scores = [critic_score(c["feedback"]) for c in chapters if c["feedback"]]
+        merged = {
+            "general_evaluation": f"{len(reviews)}/{len(chapters)} bölüm ayrı ayrı değerlendirildi.",
+            "confidence_score": round(sum(scores) / len(scores), 1) if scores else 0,
+            "chapters": reviews,
+        }
+        return json.dumps(merged, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def timed_out_stage(chapters: List[Dict]) -> Optional[str]:
+        stages = [c["timed_out_stage"] for c in chapters if "timed_out_stage" in c]
+        return stages[0] if stages else None
@@ -0,0 +1,73 @@
+from __future__ import annotations
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List
+
+
+class CheckpointStore:
+    """
+    İş (job) bazlı aşama kayıtları; diskte (SQLite) tutulur.
+    - Anahtar: (job_id, aşama). Aşamalar: "input" (düzeltilmiş girdi), "safety", "draft",
+      "critique", "final".
+    - Bir iş tekrar çalıştırıldığında kaydı olan aşamalar LLM çağrılmadan geçilir;
+      böylece editör hatasında taslak/eleştiri tekrar ödenmez, çöken batch kaldığı yerden sürer.
+    """
+
+    def __init__(self, path: str = "checkpoints.sqlite3"):
+        self.path = path
+        self.resumed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " job_id TEXT NOT NULL,"
+            " stage TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (job_id, stage))"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def job_key(record_id: str, user_input: Dict) -> str:
+        """Kayıt kimliği + girdinin özeti: girdi değişirse eski kayıtlar kullanılmaz."""
+        digest = hashlib.sha256(
+            json.dumps(user_input, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:16]
+        return f"{record_id}:{digest}"
+
+    def load(self, job_id: str) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, data FROM checkpoints WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return {stage: json.loads(data) for stage, data in rows}
+
+    def save(self, job_id: str, stage: str, data: Any) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints(job_id, stage, data, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, stage, json.dumps(data, ensure_ascii=False), time.time()),
+            )
+            self._conn.commit()
+
+    def note_resumed(self, stage: str) -> None:
+        with self._lock:
+            self.resumed[stage] = self.resumed.get(stage, 0) + 1
+
+    def clear(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+
+    def jobs(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT job_id FROM checkpoints")]
+
+    def stats(self) -> dict:
+        with self._lock:
+            jobs = self._conn.execute("SELECT COUNT(DISTINCT job_id) FROM checkpoints").fetchone()[0]
+            return {"jobs": jobs, "resumed": dict(self.resumed)}
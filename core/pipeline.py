@@ -1,63 +1,412 @@
 from __future__ import annotations
+from typing import Any, Iterator, Optional, Tuple
+
+from agents.critic_agent import CriticAgent
+
+from core.best_of_n import BestOfNDrafter
+from core.chapters import ChapterWorkshop
+from core.checkpoint import CheckpointStore
+from core.refine import RefinementLoop
+from llm.budget import budget_report, log_budget
+from llm.deadline import Deadline, DeadlineExceeded, current_deadline, deadline_scope
+from llm.metrics import MetricsRecorder, metrics_scope
 
 class StoryWorkshopPipeline:
     """
     Yapay Hikaye Atolyesi Pipeline'i
     """
 
-    def __init__(self, writer, critic, editor):
+    def __init__(self, writer, critic, editor, checkpoints: Optional[CheckpointStore] = None,
+                 drafter: Optional[BestOfNDrafter] = None, refiner: Optional[RefinementLoop] = None,
+                 long_form: Optional[ChapterWorkshop] = None):
         self.writer = writer
         self.critic = critic
         self.editor = editor
+        self.checkpoints = checkpoints
+        # Verilirse taslak + eleştiri adımı N adaylı paralel seçimle yapılır (core.best_of_n)
+        self.drafter = drafter
+        # Verilirse ilk düzenlemeden sonra eleştirmen -> editör turları yapılır (core.refine)
+        self.refiner = refiner
+        # Verilirse "long" hikayeler bölüm planıyla, bölümler paralel yazılarak üretilir (core.chapters)
+        self.long_form = long_form
 
-    def run(self, user_input: dict) -> dict:
+    def run(self, user_input: dict, deadline: Optional[Deadline] = None, job_id: Optional[str] = None) -> dict:
 
         """
         Atolye akisini baslatir.
         Başlık, Baş Harfleri Büyük (Title Case) formatında eklenir.
-        
+        Sonuçta "metrics" anahtarı altında aşama bazlı LLM metrikleri, "budget" altında
+        isteğin token bütçesi özeti (llm.budget.budget_report) bulunur.
+
+        deadline: isteğin süre bütçesi (llm.deadline). Verilmezse bağlı olan (örn. batch'in
+        kurduğu) ya da ortam değişkenlerinden (LLM_DEADLINE_S, LLM_STAGE_TIMEOUTS) yenisi kullanılır.
+        Süre dolarsa kısmi sonuç döner:
+        - Yazar yetişemezse  -> status "timeout" (hikaye yok)
+        - Eleştirmen/Editör  -> status "partial", final_story = taslak
+        Hangi aşamada kesildiği "timed_out_stage" anahtarındadır.
+
+        job_id ve checkpoints (core.checkpoint) verilirse taslak, eleştiri ve final kaydedilir;
+        aynı job_id ile tekrar çalıştırmada kaydı olan aşamalar atlanır (son tamamlanan aşamadan devam).
+        Hata sonrası dönen yedek eleştiri (CriticAgent.is_fallback) ve ona dayanan final kaydedilmez.
+
+        refiner verilirse final, iyileştirme turlarından geçmiş metindir; tur kayıtları ve durma
+        sebebi "refinement" anahtarındadır (critic_feedback ilk eleştiri olarak kalır).
+
+        long_form verilirse length == "long" isteklerde bölüm modu kullanılır: taslak/final bölümlerin
+        birleşimi, critic_feedback bölüm eleştirilerinin birleşimidir ve plan "outline" anahtarındadır
+        (best-of-N ve iyileştirme turları bu modda uygulanmaz; sadece final kaydedilir).
         """
+        with metrics_scope() as metrics, deadline_scope(self._deadline(deadline)):
+            result = self._run(user_input, job_id)
+        return self._with_metrics(result, metrics, job_id)
 
-        # Başlığı al ve düzgün formatla (Örn: "kırık pencere" -> "Kırık Pencere")
-        raw_title = user_input.get("title", "Başlıksız")
-        display_title = raw_title.strip().title()
+    def _run(self, user_input: dict, job_id: Optional[str] = None) -> dict:
+        saved = self._load(job_id)
+        if "final" in saved:
+            return self._resumed(saved, "final")
+
+        if self._is_long_form(user_input):
+            try:
+                work = self.long_form.run(user_input)
+            except DeadlineExceeded as e:
+                return self._timeout_result(user_input, "", e.stage or "writer")
+            return self._save_long_form(job_id, self._long_form_result(user_input, work))
+
+        # 1️⃣ Writer: Hikaye taslagi (best-of-N modunda eleştirisiyle birlikte gelir)
+        critic_feedback = None
+        try:
+            if "draft" in saved:
+                writer_output = self._resumed(saved, "draft")
+            elif self.drafter is not None:
+                writer_output, critic_feedback = self.drafter.run(user_input)
+            else:
+                writer_output = self.writer.generate_draft(user_input)
+        except DeadlineExceeded:
+            return self._timeout_result(user_input, "", "writer")
+        self._save(job_id, saved, "draft", writer_output)
 
-        # 1️⃣ Writer: Hikaye taslagi
-        writer_output = self.writer.generate_draft(user_input)
-        
         # Eğer soru sorma durumu varsa (Belirsizlik):
-        if isinstance(writer_output, dict) and writer_output.get("type") == "clarification":
-            # Soruları olduğu gibi döndür
-            questions = "\n".join(f"- {q}" for q in writer_output["content"])
-            return {
-                "status": "needs_clarification",
-                "draft_story": questions,
-                "critic_feedback": "",
-                "final_story": ""
-            }
-        
-        # İçeriği al
-        draft_text = ""
-        if isinstance(writer_output, dict):
-            draft_text = writer_output.get("content", "")
-        else:
-            draft_text = writer_output
+        if self._is_clarification(writer_output):
+            return self._clarification_result(writer_output)
 
-        # --- Başlığı Taslağın Başına Ekle ---
-        full_draft_story = f"📄 {display_title}\n{'-'*len(display_title)}\n\n{draft_text}"
+        draft_text = self._draft_text(writer_output)
 
         # 2️⃣ Eleştirmen: (Orijinal metni değerlendirsin)
-        critic_feedback = self.critic.run(draft_text)
+        try:
+            if "critique" in saved:
+                critic_feedback = self._resumed(saved, "critique")
+            elif critic_feedback is None:
+                critic_feedback = self.critic.run(draft_text)
+        except DeadlineExceeded:
+            return self._timeout_result(user_input, draft_text, "critic")
+        self._save(job_id, saved, "critique", critic_feedback)
 
         # 3️⃣ Editör: Düzenleme
-        final_text = self.editor.revise(draft_text, critic_feedback)
+        try:
+            final_text = self.editor.revise(draft_text, critic_feedback)
+        except DeadlineExceeded:
+            return self._timeout_result(user_input, draft_text, "editor", critic_feedback)
+
+        # 4️⃣ İyileştirme turları (isteğe bağlı)
+        refinement = None
+        if self.refiner is not None:
+            final_text, _, refinement = self.refiner.run(draft_text, final_text, critic_feedback)
+
+        result = self._complete_result(user_input, draft_text, critic_feedback, final_text, refinement)
+        return self._save_final(job_id, result)
 
-        # --- Başlığı Finalin Başına Ekle ---
-        full_final_story = f"📖 {display_title}\n{'-'*len(display_title)}\n\n{final_text}"
+    async def arun(self, user_input: dict, deadline: Optional[Deadline] = None, job_id: Optional[str] = None) -> dict:
+        """
+        run'ın asenkron sürümü. Aynı event loop'ta yüzlerce atölye
+        eşzamanlı yürütülebilir; dönüş formatı ve süre davranışı run ile aynıdır.
+        """
+        with metrics_scope() as metrics, deadline_scope(self._deadline(deadline)):
+            result = await self._arun(user_input, job_id)
+        return self._with_metrics(result, metrics, job_id)
+
+    async def _arun(self, user_input: dict, job_id: Optional[str] = None) -> dict:
+        saved = self._load(job_id)
+        if "final" in saved:
+            return self._resumed(saved, "final")
+
+        if self._is_long_form(user_input):
+            try:
+                work = await self.long_form.arun(user_input)
+            except DeadlineExceeded as e:
+                return self._timeout_result(user_input, "", e.stage or "writer")
+            return self._save_long_form(job_id, self._long_form_result(user_input, work))
+
+        critic_feedback = None
+        try:
+            if "draft" in saved:
+                writer_output = self._resumed(saved, "draft")
+            elif self.drafter is not None:
+                writer_output, critic_feedback = await self.drafter.arun(user_input)
+            else:
+                writer_output = await self.writer.agenerate_draft(user_input)
+        except DeadlineExceeded:
+            return self._timeout_result(user_input, "", "writer")
+        self._save(job_id, saved, "draft", writer_output)
+
+        if self._is_clarification(writer_output):
+            return self._clarification_result(writer_output)
+
+        draft_text = self._draft_text(writer_output)
+        try:
+            if "critique" in saved:
+                critic_feedback = self._resumed(saved, "critique")
+            elif critic_feedback is None:
+                critic_feedback = await self.critic.arun(draft_text)
+        except DeadlineExceeded:
+            return self._timeout_result(user_input, draft_text, "critic")
+        self._save(job_id, saved, "critique", critic_feedback)
+        try:
+            final_text = await self.editor.arevise(draft_text, critic_feedback)
+        except DeadlineExceeded:
+            return self._timeout_result(user_input, draft_text, "editor", critic_feedback)
+
+        refinement = None
+        if self.refiner is not None:
+            final_text, _, refinement = await self.refiner.arun(draft_text, final_text, critic_feedback)
 
+        result = self._complete_result(user_input, draft_text, critic_feedback, final_text, refinement)
+        return self._save_final(job_id, result)
+
+    def stream(self, user_input: dict, deadline: Optional[Deadline] = None,
+               job_id: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+        """
+        run'ın akış sürümü. Sırasıyla (olay, veri) ikilileri üretir:
+        - ("draft", parça)     : taslak metni geldikçe (ilk parça başlık satırıdır)
+        - ("critique", json)   : eleştirmen geri bildirimi
+        - ("final", parça)     : final metni geldikçe (ilk parça başlık satırıdır)
+        - ("refine", sözlük)   : refiner varsa, iyileştirme turları bitince tur kayıtları;
+                                 metin değiştiyse "final_story" anahtarında yeni final bulunur
+        - ("result", sözlük)   : en son, run ile aynı formattaki sonuç
+        Belirsiz girdide sadece ("result", ...) üretilir.
+        Süre dolarsa run'daki kısmi sonuç kuralları geçerlidir; editör akışı yarıda kesilirse
+        "result" içindeki final_story taslaktır. Kaydı olan aşamaların ve bölüm modunun metni
+        tek parça halinde gelir.
+        """
+        # Metrik ve süre kapsamları sadece iç akış ilerletilirken açıktır (tüketen tarafa sızmaz)
+        metrics = MetricsRecorder(keep_records=True)
+        deadline = self._deadline(deadline)
+        events = self._stream(user_input, job_id)
+        while True:
+            with metrics_scope(metrics), deadline_scope(deadline):
+                item = next(events, None)
+            if item is None:
+                return
+            event, payload = item
+            if event == "result":
+                payload = self._with_metrics(payload, metrics, job_id)
+            yield event, payload
+
+    def _stream(self, user_input: dict, job_id: Optional[str] = None) -> Iterator[Tuple[str, Any]]:
+        saved = self._load(job_id)
+        if "final" in saved:
+            result = self._resumed(saved, "final")
+            yield "draft", result["draft_story"]
+            yield "critique", result["critic_feedback"]
+            yield "final", result["final_story"]
+            yield "result", result
+            return
+
+        if self._is_long_form(user_input):
+            # Bölümler paralel yazıldığından metin sırayla akmaz; birleşik metin tek parça verilir
+            try:
+                work = self.long_form.run(user_input)
+            except DeadlineExceeded as e:
+                yield "result", self._timeout_result(user_input, "", e.stage or "writer")
+                return
+            result = self._long_form_result(user_input, work)
+            yield "draft", result["draft_story"]
+            yield "critique", result["critic_feedback"]
+            yield "final", result["final_story"]
+            yield "result", self._save_long_form(job_id, result)
+            return
+
+        display_title = self._display_title(user_input)
+        critic_feedback = None
+        if "draft" in saved or self.drafter is not None:
+            # Kayıttan gelen ya da adaylar arasından seçilen taslak tek parça halinde verilir
+            try:
+                if "draft" in saved:
+                    writer_output = self._resumed(saved, "draft")
+                else:
+                    writer_output, critic_feedback = self.drafter.run(user_input)
+            except DeadlineExceeded:
+                yield "result", self._timeout_result(user_input, "", "writer")
+                return
+            self._save(job_id, saved, "draft", writer_output)
+            if not self._is_clarification(writer_output):
+                yield "draft", self._header("📄", display_title) + self._draft_text(writer_output)
+        else:
+            draft_stream = self.writer.stream_draft(user_input)
+            draft_parts = []
+            writer_output = None
+            while True:
+                try:
+                    piece = next(draft_stream)
+                except StopIteration as stop:
+                    writer_output = stop.value
+                    break
+                except DeadlineExceeded:
+                    yield "result", self._timeout_result(user_input, "".join(draft_parts), "writer")
+                    return
+                if not draft_parts:
+                    yield "draft", self._header("📄", display_title)
+                draft_parts.append(piece)
+                yield "draft", piece
+            self._save(job_id, saved, "draft", writer_output)
+
+        if self._is_clarification(writer_output):
+            yield "result", self._clarification_result(writer_output)
+            return
+
+        draft_text = self._draft_text(writer_output)
+
+        try:
+            if "critique" in saved:
+                critic_feedback = self._resumed(saved, "critique")
+            elif critic_feedback is None:
+                critic_feedback = self.critic.run(draft_text)
+        except DeadlineExceeded:
+            yield "result", self._timeout_result(user_input, draft_text, "critic")
+            return
+        self._save(job_id, saved, "critique", critic_feedback)
+        yield "critique", critic_feedback
+
+        yield "final", self._header("📖", display_title)
+        final_parts = []
+        try:
+            for piece in self.editor.stream_revise(draft_text, critic_feedback):
+                final_parts.append(piece)
+                yield "final", piece
+        except DeadlineExceeded:
+            yield "result", self._timeout_result(user_input, draft_text, "editor", critic_feedback)
+            return
+
+        final_text = "".join(final_parts)
+        refinement = None
+        if self.refiner is not None:
+            refined_text, _, refinement = self.refiner.run(draft_text, final_text, critic_feedback)
+            event = dict(refinement)
+            if refined_text != final_text:
+                event["final_story"] = self._header("📖", display_title) + refined_text
+            final_text = refined_text
+            yield "refine", event
+
+        result = self._complete_result(user_input, draft_text, critic_feedback, final_text, refinement)
+        yield "result", self._save_final(job_id, result)
+
+    # --- kayıt (checkpoint) yardımcıları ---
+    def _load(self, job_id: Optional[str]) -> dict:
+        if self.checkpoints is None or not job_id:
+            return {}
+        return self.checkpoints.load(job_id)
+
+    def _resumed(self, saved: dict, stage: str):
+        self.checkpoints.note_resumed(stage)
+        return saved[stage]
+
+    def _save(self, job_id: Optional[str], saved: dict, stage: str, data) -> None:
+        # Hata sonrası yedek eleştiri kaydedilmez; tekrar çalıştırmada eleştirmen yeniden denenir
+        if stage == "critique" and CriticAgent.is_fallback(data):
+            return
+        if self.checkpoints is not None and job_id and stage not in saved:
+            self.checkpoints.save(job_id, stage, data)
+
+    def _save_final(self, job_id: Optional[str], result: dict) -> dict:
+        # Sadece tamamlanmış ve gerçek eleştiriyle düzenlenmiş sonuç kaydedilir; kısmi sonuçta
+        # tekrar çalıştırma editörden, yedek eleştiride eleştirmenden devam eder
+        if not CriticAgent.is_fallback(result["critic_feedback"]):
+            self._save(job_id, {}, "final", result)
+        return result
+
+    def _save_long_form(self, job_id: Optional[str], result: dict) -> dict:
+        return self._save_final(job_id, result) if result["status"] == "complete" else result
+
+    # --- bölüm modu ---
+    def _is_long_form(self, user_input: dict) -> bool:
+        return self.long_form is not None and self.long_form.applies(user_input)
+
+    def _long_form_result(self, user_input: dict, work: dict) -> dict:
+        outline, chapters = work["outline"], work["chapters"]
+        result = self._complete_result(
+            user_input,
+            ChapterWorkshop.stitch(outline, chapters, "draft"),
+            ChapterWorkshop.merge_feedback(outline, chapters),
+            ChapterWorkshop.stitch(outline, chapters, "final"),
+        )
+        result["outline"] = outline
+        # Eleştirisi/düzenlemesi yetişmeyen bölüm varsa o bölümde taslak kullanılmıştır
+        stage = ChapterWorkshop.timed_out_stage(chapters)
+        if stage:
+            result["status"] = "partial"
+            result["timed_out_stage"] = stage
+        return result
+
+    def _deadline(self, deadline: Optional[Deadline]) -> Deadline:
+        return deadline or current_deadline() or Deadline.from_env()
+
+    def _with_metrics(self, result: dict, metrics: MetricsRecorder, job_id: Optional[str] = None) -> dict:
+        result["metrics"] = metrics.summary()
+        # İstek başına token bütçesi özeti (LLM_BUDGET_LOG tanımlıysa dosyaya da yazılır)
+        result["budget"] = budget_report(result["metrics"])
+        log_budget(result["budget"], job_id=job_id, status=result.get("status"))
+        return result
+
+    def _is_clarification(self, writer_output) -> bool:
+        return isinstance(writer_output, dict) and writer_output.get("type") == "clarification"
+
+    def _clarification_result(self, writer_output: dict) -> dict:
+        # Soruları olduğu gibi döndür
+        questions = "\n".join(f"- {q}" for q in writer_output["content"])
         return {
+            "status": "needs_clarification",
+            "draft_story": questions,
+            "critic_feedback": "",
+            "final_story": ""
+        }
+
+    def _draft_text(self, writer_output) -> str:
+        # İçeriği al
+        if isinstance(writer_output, dict):
+            return writer_output.get("content", "")
+        return writer_output
+
+    def _display_title(self, user_input: dict) -> str:
+        # Başlığı al ve düzgün formatla (Örn: "kırık pencere" -> "Kırık Pencere")
+        raw_title = user_input.get("title", "Başlıksız")
+        return raw_title.strip().title()
+
+    def _header(self, icon: str, display_title: str) -> str:
+        return f"{icon} {display_title}\n{'-'*len(display_title)}\n\n"
+
+    def _complete_result(self, user_input: dict, draft_text: str, critic_feedback: str, final_text: str,
+                         refinement: Optional[dict] = None) -> dict:
+        display_title = self._display_title(user_input)
+
+        # --- Başlığı Taslağın ve Finalin Başına Ekle ---
+        full_draft_story = self._header("📄", display_title) + draft_text
+        full_final_story = self._header("📖", display_title) + final_text
+
+        result = {
             "status": "complete",
             "draft_story": full_draft_story,
             "critic_feedback": critic_feedback,
             "final_story": full_final_story
-        }
\ No newline at end of file
+        }
+        if refinement is not None:
+            result["refinement"] = refinement
+        return result
+
+    def _timeout_result(self, user_input: dict, draft_text: str, stage: str, critic_feedback: str = "") -> dict:
+        # Süre dolduğunda eldeki en iyi metin: taslak varsa final yerine o döner
+        if draft_text:
+            result = self._complete_result(user_input, draft_text, critic_feedback, draft_text)
+            result["status"] = "partial"
+        else:
+            result = {"status": "timeout", "draft_story": "", "critic_feedback": "", "final_story": ""}
+        result["timed_out_stage"] = stage
+        return result
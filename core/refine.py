@@ -0,0 +1,210 @@
+from __future__ import annotations
+import difflib
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.best_of_n import critic_score
+from llm.cancel import OperationCancelled
+from llm.deadline import DeadlineExceeded, current_deadline
+from llm.metrics import MetricsRecorder, metrics_scope
+
+# İstek katmanına göre hazır ayarlar: tur sayısı, hedef puan ve bütçe (kalite/gecikme dengesi)
+REFINE_TIERS: Dict[str, Dict[str, Any]] = {
+    "fast": {"max_rounds": 0},
+    "standard": {"max_rounds": 1, "target_score": 80, "token_budget": 6000},
+    "premium": {"max_rounds": 3, "target_score": 90, "token_budget": 20000},
+}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s+")
+
+
+def _sentences(text: str) -> List[str]:
+    out = []
+    for paragraph in text.split("\n"):
+        out.extend(s for s in _SENTENCE_END.split(paragraph.strip()) if s)
+    return out
+
+
+def revision_diff(before: str, after: str) -> str:
+    """
+    İki metin arasındaki cümle düzeyinde fark ('-' çıkan, '+' eklenen cümle).
+    Eleştirmene hikayenin tamamı yerine bu fark gönderilir; değişiklik yoksa boş döner.
+    """
+    lines = difflib.unified_diff(_sentences(before), _sentences(after), lineterm="", n=0)
+    return "\n".join(line for line in lines if line[:1] in "+-" and line[:3] not in ("---", "+++"))
+
+
+class RefinementLoop:
+    """
+    Eleştirmen -> editör döngüsü. Pipeline'ın ilk düzenlemesinden sonra devreye girer; her turda
+    eleştirmen SADECE son turdan beri değişen cümleleri (revision_diff) ve önceki değerlendirmesini
+    görür, gerekiyorsa editör yeniden düzenler.
+
+    Durma koşulları:
+    - "target"    : confidence_score >= target_score
+    - "plateau"   : puan önceki sürüme göre min_improvement kadar artmadı
+    - "budget"    : token_budget (tahmini token) ya da time_budget_s doldu
+    - "deadline"  : isteğin süre bütçesi (llm.deadline) bir tur daha kaldırmıyor
+    - "no_change" : editör metni değiştirmedi
+    - "max_rounds": tur sınırı
+    - "error"     : turda eleştirmen/editör çağrısı hata verdi
+    Puanı düşen bir düzenleme olursa o ana kadarki en yüksek puanlı sürüm döner.
+    Her turun aşama metrikleri (çağrı, süre, token) tur kaydında tutulur.
+    """
+
+    def __init__(self, critic, editor, max_rounds: int = 2, target_score: float = 85,
+                 min_improvement: float = 1.0, token_budget: Optional[int] = None,
+                 time_budget_s: Optional[float] = None):
+        self.critic = critic
+        self.editor = editor
+        self.max_rounds = max(0, max_rounds)
+        self.target_score = target_score
+        self.min_improvement = min_improvement
+        self.token_budget = token_budget
+        self.time_budget_s = time_budget_s
+
+    @classmethod
+    def for_tier(cls, critic, editor, tier: str) -> "RefinementLoop":
+        if tier not in REFINE_TIERS:
+            raise ValueError(f"Bilinmeyen katman: {tier} (seçenekler: {', '.join(REFINE_TIERS)})")
+        return cls(critic, editor, **REFINE_TIERS[tier])
+
+    def _budget_stop(self, used_tokens: int, started: float, rounds: List[Dict]) -> Optional[str]:
+        if self.token_budget is not None and used_tokens >= self.token_budget:
+            return "budget"
+        elapsed = time.monotonic() - started
+        if self.time_budget_s is not None and elapsed >= self.time_budget_s:
+            return "budget"
+        deadline = current_deadline()
+        remaining = deadline.remaining() if deadline is not None else None
+        if remaining is not None and rounds and remaining < rounds[-1]["wall_ms"] / 1000:
+            return "deadline"
+        return None
+
+    @staticmethod
+    def _round_record(index: int, diff: str, score: float, started: float, metrics: MetricsRecorder) -> Dict:
+        stages = metrics.summary()
+        return {
+            "round": index,
+            "score": score,
+            "diff_lines": diff.count("\n") + 1 if diff else 0,
+            "tokens": sum(st["prompt_tokens"] + st["response_tokens"] for st in stages.values()),
+            "wall_ms": round((time.perf_counter() - started) * 1000, 1),
+            "stages": stages,
+        }
+
+    def _decide(self, score: float, last_score: float) -> Optional[str]:
+        if score >= self.target_score:
+            return "target"
+        if score - last_score < self.min_improvement:
+            return "plateau"
+        return None
+
+    def run(self, draft_text: str, final_text: str, feedback: str) -> Tuple[str, str, Dict]:
+        """
+        (final_text, son eleştiri, {"rounds": [...], "stop_reason": ...}) döndürür.
+        draft_text/feedback: ilk eleştirinin yapıldığı taslak ve o eleştiri; final_text: ilk düzenleme.
+        """
+        state = _LoopState(draft_text, final_text, feedback)
+        started = time.monotonic()
+        for index in range(1, self.max_rounds + 1):
+            stop = self._budget_stop(state.used_tokens, started, state.rounds)
+            if stop:
+                return state.finish(stop)
+            diff = revision_diff(state.prev_text, state.text)
+            if not diff:
+                return state.finish("no_change")
+            round_started = time.perf_counter()
+            with metrics_scope() as metrics:
+                try:
+                    new_feedback = self.critic.review_revision(diff, state.feedback)
+                    score = critic_score(new_feedback)
+                    state.scored(score, new_feedback)
+                    stop = self._decide(score, state.last_score)
+                    if stop is None:
+                        state.revised(self.editor.revise(state.text, new_feedback), score, new_feedback)
+                except DeadlineExceeded:
+                    stop = "deadline"
+                except OperationCancelled:
+                    raise
+                except Exception:
+                    # Tur başarısız (eleştirmen/editör hatası): o ana kadarki en iyi sürümle bitir
+                    stop = "error"
+            state.add_round(self._round_record(index, diff, state.last_scored, round_started, metrics))
+            if stop:
+                return state.finish(stop)
+        return state.finish("max_rounds")
+
+    async def arun(self, draft_text: str, final_text: str, feedback: str) -> Tuple[str, str, Dict]:
+        """run'ın asenkron sürümü (aynı durma koşulları ve dönüş formatı)."""
+        state = _LoopState(draft_text, final_text, feedback)
+        started = time.monotonic()
+        for index in range(1, self.max_rounds + 1):
+            stop = self._budget_stop(state.used_tokens, started, state.rounds)
+            if stop:
+                return state.finish(stop)
+            diff = revision_diff(state.prev_text, state.text)
+            if not diff:
+                return state.finish("no_change")
+            round_started = time.perf_counter()
+            with metrics_scope() as metrics:
+                try:
+                    new_feedback = await self.critic.areview_revision(diff, state.feedback)
+                    score = critic_score(new_feedback)
+                    state.scored(score, new_feedback)
+                    stop = self._decide(score, state.last_score)
+                    if stop is None:
+                        state.revised(await self.editor.arevise(state.text, new_feedback), score, new_feedback)
+                except DeadlineExceeded:
+                    stop = "deadline"
+                except OperationCancelled:
+                    raise
+                except Exception:
+                    # Tur başarısız (eleştirmen/editör hatası): o ana kadarki en iyi sürümle bitir
+                    stop = "error"
+            state.add_round(self._round_record(index, diff, state.last_scored, round_started, metrics))
+            if stop:
+                return state.finish(stop)
+        return state.finish("max_rounds")
+
+
+class _LoopState:
+    """Döngünün metin/puan durumu; en iyi puanlı sürümü ve son sürümün puanlanıp puanlanmadığını izler."""
+
+    def __init__(self, draft_text: str, final_text: str, feedback: str):
+        self.prev_text = draft_text
+        self.text = final_text
+        self.feedback = feedback
+        self.last_score = critic_score(feedback)  # ilk eleştiri taslağı puanlamıştı
+        self.last_scored: Optional[float] = None
+        self.text_scored = False
+        self.best: Optional[Tuple[float, str, str]] = None
+        self.rounds: List[Dict] = []
+        self.used_tokens = 0
+
+    def scored(self, score: float, feedback: str) -> None:
+        self.last_scored = score
+        self.text_scored = True
+        if self.best is None or score > self.best[0]:
+            self.best = (score, self.text, feedback)
+
+    def revised(self, new_text: str, score: float, feedback: str) -> None:
+        self.prev_text, self.text = self.text, new_text
+        self.feedback = feedback
+        self.last_score = score
+        self.text_scored = False
+
+    def add_round(self, record: Dict) -> None:
+        self.rounds.append(record)
+        self.used_tokens += record["tokens"]
+
+    def finish(self, stop_reason: str) -> Tuple[str, str, Dict]:
+        info = {"rounds": self.rounds, "stop_reason": stop_reason}
+        if self.text_scored and self.best is not None:
+            # Son sürüm puanlandıysa en yüksek puanlı sürüm (puan düştüyse önceki) seçilir
+            score, text, feedback = self.best
+            info["final_score"] = score
+            return text, feedback, info
+        # Son düzenleme puanlanmadan bittiyse (tur/bütçe sınırı) o düzenleme kullanılır
+        return self.text, self.feedback, info
@@ -0,0 +1,54 @@
+from __future__ import annotations
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from agents.critic_agent import CriticAgent
+from agents.editor_agent import EditorAgent
+from agents.preflight import PreflightAgent
+from agents.safety import SafetyGuard
+from agents.writer_agent import WriterAgent
+from core.chapters import ChapterWorkshop
+from core.pipeline import StoryWorkshopPipeline
+
+
+class WorkshopSession:
+    """
+    Bir süreç boyunca tekrar kullanılan atölye nesneleri: LLM, SafetyGuard, ön kontrol ve pipeline.
+    Etmenler durumsuz olduğundan (guard'ın önbellekleri hariç, ki onlar paylaşıldıkça kazandırır)
+    her hikayede yeniden kurulmalarına gerek yoktur.
+    """
+
+    def __init__(self, llm: Callable[[str], str]):
+        self.llm = llm
+        self.guard = SafetyGuard(llm)
+        self.preflight = PreflightAgent(llm, self.guard)
+        writer, critic, editor = WriterAgent(llm), CriticAgent(llm), EditorAgent(llm)
+        # Uzun hikayeler bölüm planıyla, bölümler paralel yazılarak üretilir
+        self.pipeline = StoryWorkshopPipeline(
+            writer, critic, editor, long_form=ChapterWorkshop(writer, critic, editor)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "safety_cache": self.guard.cache_stats(),
+            "preflight_local_hits": self.preflight.local_hits,
+        }
+        pool = getattr(self.llm, "pool", None)
+        if pool is not None:
+            out["pool"] = pool.stats()
+        return out
+
+
+_session: Optional[WorkshopSession] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> WorkshopSession:
+    """Süreç genelindeki oturum (ilk çağrıda havuzdaki paylaşılan LLM ile kurulur)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                from llm.llm_config import get_llm
+                _session = WorkshopSession(get_llm())
+    return _session
@@ -0,0 +1,15 @@
+from __future__ import annotations
+import asyncio
+from typing import Callable
+
+
+async def acall_llm(llm: Callable[[str], str], prompt: str) -> str:
+    """
+    LLM'i asenkron çağırır.
+    - llm bir LLMClient ise (acall metodu varsa) doğrudan await edilir.
+    - Düz bir senkron fonksiyonsa thread havuzunda çalıştırılır (event loop bloklanmaz).
+    """
+    acall = getattr(llm, "acall", None)
+    if acall is not None:
+        return await acall(prompt)
+    return await asyncio.to_thread(llm, prompt)
@@ -0,0 +1,199 @@
+from __future__ import annotations
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from llm.aio import acall_llm
+from llm.streaming import stream_llm
+from llm.structured import parse_json_lenient
+
+# Token bütçesi: çıktı üst sınırları (max_output_tokens), yapılandırılmış girdilerin sıkıştırılması
+# ve istek başına bütçe raporu. Rapordaki tahminler llm.metrics.estimate_tokens (~4 karakter/token) iledir.
+# Sınıra takılan yanıt OutputCaps'te RETRY_CAP_FACTOR katı sınırla bir kez tekrar istenir; sınırlar
+# tekrar nadir olsun diye cömert tutulur.
+
+# Uzunluğa göre beklenen taslak boyu (estimate_tokens cinsinden)
+DRAFT_TOKENS_BY_LENGTH = {"short": 450, "medium": 900, "long": 2000}
+# Sabit şemalı JSON çıktıları için üst sınırlar
+STAGE_OUTPUT_TOKENS = {"critic": 1024, "critic-aspect": 512, "outline": 1024}
+# Sınır hesabında Türkçe metin için karakter/token oranı: Türkçe ~4'ten az karakterde bir token
+# tutar, estimate_tokens'la hesaplanan sınır gerçek çıktıyı kesebilir
+_CAP_CHARS_PER_TOKEN = 3
+# Beklenen boyun üstüne pay: yazar ve editör metni (editörden "daha edebi" hali istendiği için)
+# çoğu zaman uzatır; sınır sadece kaçak üretimi keser
+OUTPUT_HEADROOM = 2.0
+# Kesilen yanıtın tekrarında sınır bu katla büyütülür (tekrar da sınırlıdır)
+RETRY_CAP_FACTOR = 2
+# Düzenleme çıktısına eklenen sabit pay (kısa metinlerde)
+_EDIT_BASE_TOKENS = 128
+# Sınırlar bu katlara yuvarlanır: istemci/önbellek anahtarı sayısı sınırlı kalır
+_BUCKET = 256
+
+
+class OutputTruncated(RuntimeError):
+    """Yanıt max_output_tokens sınırında kesildi (finish_reason == MAX_TOKENS); partial_text kesik metindir."""
+
+    def __init__(self, partial_text: str = "", limit: Optional[int] = None):
+        self.partial_text = partial_text
+        self.limit = limit
+        super().__init__(f"Yanıt çıktı sınırında kesildi (max_output_tokens={limit})")
+
+
+def _bucket(tokens: float) -> int:
+    return max(_BUCKET, int(-(-tokens // _BUCKET)) * _BUCKET)
+
+
+def caps_enabled() -> bool:
+    """LLM_OUTPUT_CAPS=0 ile çıktı sınırları kapatılabilir."""
+    return os.getenv("LLM_OUTPUT_CAPS", "1") != "0"
+
+
+def draft_output_limit(length: Optional[str]) -> int:
+    """Yazarın tek parça taslağı için max_output_tokens (length: short | medium | long)."""
+    draft = DRAFT_TOKENS_BY_LENGTH.get(length or "short", DRAFT_TOKENS_BY_LENGTH["medium"])
+    return _bucket(draft * 4 / _CAP_CHARS_PER_TOKEN * OUTPUT_HEADROOM)
+
+
+def edit_output_limit(text: str) -> int:
+    """Verilen metni yeniden yazan (editör, pencere, ek yeri) çağrının max_output_tokens'ı."""
+    return _bucket(len(text) / _CAP_CHARS_PER_TOKEN * OUTPUT_HEADROOM + _EDIT_BASE_TOKENS)
+
+
+def stage_output_limit(stage: str) -> int:
+    return STAGE_OUTPUT_TOKENS[stage]
+
+
+class OutputCaps:
+    """
+    Bir istemcinin max_output_tokens ile sınırlanmış kopyalarını (yuvarlanmış sınır başına bir kez)
+    oluşturup saklar. İstemci with_generation_config desteklemiyorsa ya da sınırlar kapalıysa
+    istemcinin kendisi döner.
+    Sınıra takılan yanıt (OutputTruncated) RETRY_CAP_FACTOR katı sınırlı kopyayla bir kez tekrar
+    istenir. Tekrar da sarmalayıcı zincirinden (hız sınırı, AIMD, metrikler) geçer; o da
+    kesilirse OutputTruncated çağırana iletilir (yarım metin dönmez).
+    """
+
+    def __init__(self, llm: Callable[[str], str]):
+        self.llm = llm
+        self._clients: Dict[int, Callable[[str], str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, max_output_tokens: Optional[int]) -> Callable[[str], str]:
+        configure = getattr(self.llm, "with_generation_config", None)
+        if max_output_tokens is None or configure is None or not caps_enabled():
+            return self.llm
+        return _CappedLLM(self, _bucket(max_output_tokens))
+
+    def client(self, limit: int) -> Callable[[str], str]:
+        with self._lock:
+            client = self._clients.get(limit)
+            if client is None:
+                client = self._clients[limit] = self.llm.with_generation_config(max_output_tokens=limit)
+        return client
+
+
+class _CappedLLM:
+    """OutputCaps.get'in döndürdüğü çağrılabilir: limit sınırıyla çağırır, kesilirse bir kez büyütür."""
+
+    def __init__(self, caps: OutputCaps, limit: int):
+        self.caps = caps
+        self.limit = limit
+
+    def __call__(self, prompt: str) -> str:
+        try:
+            return self.caps.client(self.limit)(prompt)
+        except OutputTruncated:
+            return self.caps.client(self.limit * RETRY_CAP_FACTOR)(prompt)
+
+    async def acall(self, prompt: str) -> str:
+        try:
+            return await acall_llm(self.caps.client(self.limit), prompt)
+        except OutputTruncated:
+            return await acall_llm(self.caps.client(self.limit * RETRY_CAP_FACTOR), prompt)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        # Verilmiş parçalar geri alınamadığından akış tekrar edilemez: sınırsız istemciden akar
+        return stream_llm(self.caps.llm, prompt)
+
+
+# --- girdi sıkıştırma ---
+def minify_json(text: str) -> str:
+    """JSON metnini boşluksuz yazar (okunamazsa metin olduğu gibi döner)."""
+    try:
+        data = parse_json_lenient(text, record=False)
+    except ValueError:
+        return text.strip()
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def compact_feedback(critic_feedback_json: str) -> str:
+    """
+    Editör için eleştirinin sadece uygulanabilir kısmı: boyut bazlı "suggestion" alanları ve
+    next_step_for_writer, boşluksuz JSON olarak. Okunamazsa minify_json'a düşer.
+    """
+    try:
+        data = parse_json_lenient(critic_feedback_json, record=False)
+    except ValueError:
+        return critic_feedback_json.strip()
+    if not isinstance(data, dict):
+        return minify_json(critic_feedback_json)
+    compact: Dict[str, Any] = {}
+    for key, value in data.items():
+        if isinstance(value, dict) and value.get("suggestion"):
+            compact[key] = {"suggestion": value["suggestion"]}
+    if data.get("next_step_for_writer"):
+        compact["next_step_for_writer"] = data["next_step_for_writer"]
+    if not compact:
+        # Şemaya uymayan eleştiri (örn. bölüm birleşimi) olduğu gibi, sadece küçültülerek gider
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(compact, ensure_ascii=False, separators=(",", ":"))
+
+
+# --- istek başına rapor ---
+def request_token_budget() -> Optional[int]:
+    """LLM_REQUEST_TOKEN_BUDGET: istek başına (girdi + çıktı) tahmini token hedefi (raporda karşılaştırılır)."""
+    value = os.getenv("LLM_REQUEST_TOKEN_BUDGET")
+    return int(value) if value else None
+
+
+def budget_report(metrics_summary: Dict[str, Dict[str, Any]], token_budget: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Aşama metriklerinden (MetricsRecorder.summary) istek bütçe özeti:
+    aşama başına girdi/çıktı tokenı ve çıktı sınırı, toplamlar ve (verildiyse) bütçe kullanımı.
+    """
+    by_stage = {
+        stage: {
+            "prompt_tokens": st.get("prompt_tokens", 0),
+            "response_tokens": st.get("response_tokens", 0),
+            "output_cap_tokens": st.get("output_cap_tokens", 0),
+        }
+        for stage, st in metrics_summary.items()
+    }
+    prompt_tokens = sum(st["prompt_tokens"] for st in by_stage.values())
+    response_tokens = sum(st["response_tokens"] for st in by_stage.values())
+    report: Dict[str, Any] = {
+        "prompt_tokens": prompt_tokens,
+        "response_tokens": response_tokens,
+        "total_tokens": prompt_tokens + response_tokens,
+        "by_stage": by_stage,
+    }
+    token_budget = token_budget if token_budget is not None else request_token_budget()
+    if token_budget:
+        report["token_budget"] = token_budget
+        report["budget_used_pct"] = round(100.0 * report["total_tokens"] / token_budget, 1)
+        report["over_budget"] = report["total_tokens"] > token_budget
+    return report
+
+
+_log_lock = threading.Lock()
+
+
+def log_budget(report: Dict[str, Any], **fields: Any) -> None:
+    """LLM_BUDGET_LOG tanımlıysa istek bütçe raporunu JSON satırı olarak dosyaya ekler."""
+    path = os.getenv("LLM_BUDGET_LOG")
+    if not path:
+        return
+    line = json.dumps({**fields, **report}, ensure_ascii=False) + "\n"
+    with _log_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line)
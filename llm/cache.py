@@ -0,0 +1,221 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from llm.aio import acall_llm
+from llm.context import current_stage
+from llm.metrics import note_cache_hit
+from llm.streaming import stream_llm
+
+# Varsayılan olarak sadece deterministik/tekrarlayan aşamalar önbelleğe alınır.
+# Yaratıcı taslaklar (writer/editor) isteğe bağlıdır.
+DEFAULT_CACHED_STAGES = ("typo", "preflight", "safety", "critic")
+
+
+class LLMCache:
+    """
+    Diskte (SQLite) tutulan, içerik-adresli LLM yanıt önbelleği.
+    - Anahtar: model adı + üretim parametreleri + prompt'un SHA-256 özeti
+    - Eviction: TTL süresi dolan kayıtlar silinir, max_entries aşılınca en eski
+      erişilen kayıtlar (LRU) atılır.
+    - Aşama bazlı opt-in: sadece `stages` içindeki aşamaların çağrıları önbelleğe girer.
+    """
+
+    def __init__(
+        self,
+        path: str = "llm_cache.sqlite3",
+        max_entries: int = 5000,
+        ttl_seconds: float = 7 * 24 * 3600,
+        stages: Iterable[str] = DEFAULT_CACHED_STAGES,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stages = set(stages)
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name: str, params: Optional[dict], prompt: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        material = json.dumps(
+            {"model": model_name, "params": params or {}, "prompt": prompt_hash},
+            sort_keys=True, ensure_ascii=False,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def enabled_for(self, stage: Optional[str]) -> bool:
+        return stage is not None and stage in self.stages
+
+    def get(self, key: str, stage: Optional[str] = None) -> Optional[str]:
+        now = time.time()
+        label = stage or "-"
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses[label] = self.misses.get(label, 0) + 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits[label] = self.hits.get(label, 0) + 1
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        if not response:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache(key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            return {
+                "entries": entries,
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+                "hit_total": sum(self.hits.values()),
+                "miss_total": sum(self.misses.values()),
+            }
+
+
+class CachedLLM:
+    """
+    Herhangi bir LLM çağrılabilirini (llm(prompt) -> str) önbellekle sarar.
+    Aşama bilgisi llm.context.stage_scope ile belirlenir.
+    """
+
+    def __init__(self, llm: Callable[[str], str], cache: LLMCache):
+        self.llm = llm
+        self.cache = cache
+        self.model_name = getattr(llm, "model_name", "unknown")
+        self.generation_config = getattr(llm, "generation_config", None) or {}
+
+    def with_generation_config(self, **overrides) -> "CachedLLM":
+        configure = getattr(self.llm, "with_generation_config", None)
+        if configure is None:
+            return self
+        return CachedLLM(configure(**overrides), self.cache)
+
+    def _key(self, prompt: str) -> str:
+        return LLMCache.make_key(self.model_name, self.generation_config, prompt)
+
+    def __call__(self, prompt: str) -> str:
+        stage = current_stage()
+        if not self.cache.enabled_for(stage):
+            return self.llm(prompt)
+
+        key = self._key(prompt)
+        cached = self.cache.get(key, stage)
+        if cached is not None:
+            note_cache_hit()
+            return cached
+
+        text = self.llm(prompt)
+        self.cache.put(key, text)
+        return text
+
+    async def acall(self, prompt: str) -> str:
+        stage = current_stage()
+        if not self.cache.enabled_for(stage):
+            return await acall_llm(self.llm, prompt)
+
+        key = self._key(prompt)
+        cached = self.cache.get(key, stage)
+        if cached is not None:
+            note_cache_hit()
+            return cached
+
+        text = await acall_llm(self.llm, prompt)
+        self.cache.put(key, text)
+        return text
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        stage = current_stage()
+        if not self.cache.enabled_for(stage):
+            yield from stream_llm(self.llm, prompt)
+            return
+
+        key = self._key(prompt)
+        cached = self.cache.get(key, stage)
+        if cached is not None:
+            note_cache_hit()
+            yield cached
+            return
+
+        # Parçaları iletirken biriktir; akış tamamlanınca önbelleğe yaz
+        parts = []
+        for chunk in stream_llm(self.llm, prompt):
+            parts.append(chunk)
+            yield chunk
+        self.cache.put(key, "".join(parts))
+
+
+_default_cache: Optional[LLMCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[LLMCache]:
+    """
+    LLM_CACHE_PATH ortam değişkeni tanımlıysa süreç genelinde tek bir önbellek döner.
+    - LLM_CACHE_STAGES: virgülle ayrılmış aşamalar (örn: "typo,safety,critic,writer")
+    - LLM_CACHE_MAX_ENTRIES / LLM_CACHE_TTL: eviction ayarları
+    """
+    global _default_cache
+    path = os.getenv("LLM_CACHE_PATH")
+    if not path:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            stages = os.getenv("LLM_CACHE_STAGES")
+            _default_cache = LLMCache(
+                path=path,
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000")),
+                ttl_seconds=float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600))),
+                stages=[s.strip() for s in stages.split(",") if s.strip()] if stages else DEFAULT_CACHED_STAGES,
+            )
+        return _default_cache
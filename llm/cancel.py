@@ -0,0 +1,54 @@
+from __future__ import annotations
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+
+class OperationCancelled(Exception):
+    """İşlem kullanıcı (veya çağıran) tarafından iptal edildi."""
+
+
+class CancelToken:
+    """
+    Thread-safe iptal bayrağı. İptal edildikten sonra başlayan LLM çağrıları ve
+    akıştan çekilen yeni parçalar OperationCancelled fırlatır.
+    Uçuştaki senkron bir HTTP çağrısı kesilemez; sonucu çağıran tarafta atılmalıdır.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise OperationCancelled("İşlem iptal edildi")
+
+
+_current_token: ContextVar[Optional[CancelToken]] = ContextVar("llm_cancel_token", default=None)
+
+
+def current_token() -> Optional[CancelToken]:
+    return _current_token.get()
+
+
+@contextmanager
+def cancel_scope(token: CancelToken) -> Iterator[CancelToken]:
+    """Blok içindeki LLM çağrılarını verilen iptal bayrağına bağlar."""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def check_cancelled() -> None:
+    token = _current_token.get()
+    if token is not None:
+        token.raise_if_cancelled()
@@ -0,0 +1,27 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+# Şu an hangi aşamanın (typo, safety, writer, critic, editor...) LLM çağırdığını tutar.
+# ContextVar olduğu için thread'ler ve asyncio görevleri arasında karışmaz.
+_current_stage: ContextVar[Optional[str]] = ContextVar("llm_stage", default=None)
+
+
+def current_stage() -> Optional[str]:
+    return _current_stage.get()
+
+
+@contextmanager
+def stage_scope(stage: str) -> Iterator[None]:
+    """
+    Blok içindeki LLM çağrılarını verilen aşama adıyla etiketler.
+    Örn:
+        with stage_scope("critic"):
+            raw = self.llm(prompt)
+    """
+    token = _current_stage.set(stage)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
@@ -0,0 +1,112 @@
+from __future__ import annotations
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+# İstek düzeyinde süre sınırı: toplam bütçe (deadline) + aşama başına çağrı zaman aşımı.
+# Pipeline/batch bir Deadline kurup deadline_scope ile bağlar; LLM katmanı (InstrumentedLLM,
+# LLMClient, stream_llm, FakeLLM) çağrı başına kalan süreyi call_timeout ile sorar.
+
+# Aşama başına tek LLM çağrısının üst sınırı (saniye)
+DEFAULT_STAGE_TIMEOUTS: Dict[str, float] = {
+    "preflight": 20.0,
+    "typo": 20.0,
+    "safety": 20.0,
+    "outline": 45.0,
+    "writer": 90.0,
+    "critic": 45.0,
+    "critic-repair": 20.0,
+    "editor": 90.0,
+}
+
+
+class DeadlineExceeded(TimeoutError):
+    """Aşama zaman aşımı veya isteğin toplam süre bütçesi doldu."""
+
+    def __init__(self, stage: Optional[str] = None, message: Optional[str] = None):
+        self.stage = stage
+        super().__init__(message or f"Süre aşıldı (aşama: {stage or 'bilinmiyor'})")
+
+
+def _parse_stage_timeouts(spec: str) -> Dict[str, float]:
+    # "writer=60,editor=45" -> {"writer": 60.0, "editor": 45.0}
+    out = {}
+    for part in spec.split(","):
+        if "=" in part:
+            stage, seconds = part.split("=", 1)
+            try:
+                out[stage.strip()] = float(seconds)
+            except ValueError:
+                continue
+    return out
+
+
+class Deadline:
+    """
+    Bir isteğin süre bütçesi.
+    - total_s: isteğin tamamı için üst sınır (None = sınırsız)
+    - stage_timeouts: aşama -> tek çağrı üst sınırı (verilmeyenler DEFAULT_STAGE_TIMEOUTS'tan)
+    Süre, nesne oluşturulduğu anda başlar.
+    """
+
+    def __init__(self, total_s: Optional[float] = None, stage_timeouts: Optional[Dict[str, float]] = None):
+        self.total_s = total_s
+        self.stage_timeouts = {**DEFAULT_STAGE_TIMEOUTS, **(stage_timeouts or {})}
+        self._expires = time.monotonic() + total_s if total_s is not None else None
+
+    @classmethod
+    def from_env(cls, total_s: Optional[float] = None) -> "Deadline":
+        """LLM_DEADLINE_S (toplam bütçe) ve LLM_STAGE_TIMEOUTS ("writer=60,editor=45")."""
+        if total_s is None and os.getenv("LLM_DEADLINE_S"):
+            total_s = float(os.getenv("LLM_DEADLINE_S"))
+        return cls(total_s, _parse_stage_timeouts(os.getenv("LLM_STAGE_TIMEOUTS", "")))
+
+    def remaining(self) -> Optional[float]:
+        if self._expires is None:
+            return None
+        return max(0.0, self._expires - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def timeout_for(self, stage: Optional[str]) -> Optional[float]:
+        """Aşamanın tek çağrısı için süre: aşama sınırı ile kalan bütçenin küçüğü."""
+        limits = [t for t in (self.stage_timeouts.get(stage or ""), self.remaining()) if t is not None]
+        return min(limits) if limits else None
+
+    def check(self, stage: Optional[str] = None) -> None:
+        if self.expired:
+            raise DeadlineExceeded(stage, "İsteğin süre bütçesi doldu")
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("llm_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """Blok içindeki LLM çağrılarını verilen süre bütçesine bağlar."""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def call_timeout(stage: Optional[str]) -> Optional[float]:
+    """Bağlı bir Deadline varsa bu aşamadaki tek çağrıya ayrılan süre; yoksa None."""
+    deadline = _current_deadline.get()
+    return deadline.timeout_for(stage) if deadline is not None else None
+
+
+def check_deadline(stage: Optional[str] = None) -> None:
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.check(stage)
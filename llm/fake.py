@@ -0,0 +1,300 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterator, Optional
+
+from llm.budget import OutputTruncated
+from llm.context import current_stage
+from llm.deadline import DeadlineExceeded, call_timeout
+from llm.resilience import TokenBucket
+
+# Sahte (çevrimdışı) LLM arka ucu: ağ ve API anahtarı olmadan ölçüm/benchmark yapmak için.
+# Her aşamaya (current_stage) şemaya uygun sabit yanıt döner; gecikme ve hata oranı ayarlanabilir.
+
+_STORY_PARAGRAPH = (
+    "Sabahın ilk ışıkları kasabanın dar sokaklarına düşerken {name} pencerenin önünde "
+    "durmuş, uzun zamandır ertelediği kararı düşünüyordu. Rüzgar eski perdeleri hafifçe "
+    "kıpırdatıyor, uzaklardan bir geminin düdüğü duyuluyordu. İçindeki ses ona artık "
+    "beklemenin bir anlamı olmadığını söylüyordu."
+)
+
+_CRITIC_RESPONSE = {
+    "general_evaluation": "Hikaye tutarlı, atmosfer güçlü; karakterin iç dünyası daha görünür olabilir.",
+    "theme": {"comment": "Tema net.", "suggestion": "Son paragrafta umudu somut bir eylemle göster."},
+    "language": {"comment": "Dil akıcı.", "suggestion": "Tekrarlanan 'uzun' kelimesini azalt."},
+    "characters": {"comment": "Ana karakter belirgin.", "suggestion": "Karakter bir diyalogla kendini ifade etsin."},
+    "plot": {"comment": "Kurgu sade.", "suggestion": "Orta bölüme küçük bir engel ekle."},
+    "strengths": ["Atmosfer", "Akıcı dil"],
+    "areas_to_improve": ["Diyalog eksikliği", "Tempo"],
+    "confidence_score": 82,
+    "next_step_for_writer": "Ana karaktere bir diyalog sahnesi ekle.",
+}
+
+_ASPECT_RESPONSE = {
+    "comment": "Bu boyut genel olarak yerinde; bazı yerlerde derinleşebilir.",
+    "suggestion": "İkinci paragrafa karakterin kararını gösteren kısa bir sahne ekle.",
+    "strength": "Atmosfer",
+    "weakness": "Tempo",
+    "score": 82,
+}
+
+# SafetyGuard.SCORING_SCHEMA ile aynı anahtarlar; kategori şemadaki listeden
+_SAFETY_RESPONSE = {
+    "olumsuzluk_skoru": 1,
+    "kategori": "diger",
+    "risk_dagilimi": {"kendine_zarar": 0, "siddet": 0, "nefret": 0, "taciz": 0,
+                      "yasa_disi": 0, "cinsel": 0, "diger": 1},
+    "gerekceler": ["Zararlı içerik yok."],
+    "oneri": "Devam edebilirsin.",
+}
+
+# Yazar promptundaki uzunluk ipucu -> paragraf sayısı
+_LENGTH_HINTS = (("2-3 paragraf", 3), ("3-4 paragraf", 4), ("4-6 paragraf", 6), ("detaylı ve uzun", 12))
+_DEFAULT_PARAGRAPHS = 4
+
+
+class FakeLLMError(RuntimeError):
+    """Sahte arka ucun enjekte ettiği hata (ağ/kota hatası benzetimi)."""
+
+
+class FakeRateLimited(FakeLLMError):
+    """Kota aşıldı (Gemini'deki 429 ResourceExhausted benzetimi)."""
+    code = 429
+
+
+@dataclass
+class LatencyModel:
+    """
+    Çağrı gecikmesi dağılımı (milisaniye).
+    kind: "fixed" (mean_ms), "uniform" (mean_ms ± spread_ms), "lognormal" (medyan mean_ms, sigma)
+    per_token_ms: yanıtın her (tahmini) tokenı için eklenen üretim süresi; uzun çıktı daha geç biter
+    """
+    kind: str = "lognormal"
+    mean_ms: float = 0.0
+    spread_ms: float = 0.0
+    sigma: float = 0.35
+    per_token_ms: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.mean_ms <= 0:
+            return 0.0
+        if self.kind == "fixed":
+            return self.mean_ms
+        if self.kind == "uniform":
+            return max(0.0, rng.uniform(self.mean_ms - self.spread_ms, self.mean_ms + self.spread_ms))
+        return self.mean_ms * rng.lognormvariate(0.0, self.sigma)
+
+
+def _last_json_line(prompt: str) -> Dict:
+    # typo/preflight promptlarında kullanıcı girdisi son JSON satırıdır
+    for line in reversed(prompt.strip().splitlines()):
+        line = line.strip()
+        if line.startswith("{"):
+            try:
+                return json.loads(line)
+            except json.JSONDecodeError:
+                return {}
+    return {}
+
+
+def _paragraph_count(prompt: str) -> int:
+    # Açık paragraf sayısı (parçalı editör) > editördeki taslağın paragraf sayısı > yazar uzunluk ipucu
+    explicit = _prompt_field(prompt, "Paragraf sayısı:")
+    if explicit.isdigit():
+        return int(explicit)
+    if "Hikaye Taslağı:" in prompt and "Eleştirmen Geri Bildirimi" in prompt:
+        draft = prompt.split("Hikaye Taslağı:", 1)[1].split("Eleştirmen Geri Bildirimi", 1)[0]
+        return max(1, len([p for p in draft.split("\n\n") if p.strip()]))
+    return next((n for hint, n in _LENGTH_HINTS if hint in prompt), _DEFAULT_PARAGRAPHS)
+
+
+def _prompt_field(prompt: str, label: str) -> str:
+    for line in prompt.splitlines():
+        if line.startswith(label):
+            return line[len(label):].strip()
+    return ""
+
+
+class FakeLLM:
+    """
+    LLMClient ile aynı arayüz: llm(prompt), await llm.acall(prompt), llm.stream(prompt).
+
+    - latency: aşama -> LatencyModel (bilinmeyen aşamalar için "default")
+    - error_rate: her çağrının FakeLLMError ile başarısız olma olasılığı
+    - seed: aynı tohumla gecikme ve hata dizisi tekrarlanabilir
+    - quota_rpm: sunucu tarafı dakikalık istek kotası; aşan çağrılar FakeRateLimited alır
+      (patlama payı bir saniyelik kota kadardır)
+    """
+
+    def __init__(
+        self,
+        latency: Optional[Dict[str, LatencyModel]] = None,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        chunk_chars: int = 80,
+        quota_rpm: Optional[float] = None,
+    ):
+        self.model_name = "fake"
+        self.generation_config: Dict = {}
+        self.latency = latency or {}
+        self.error_rate = error_rate
+        self.chunk_chars = chunk_chars
+        # Sayaçlar with_generation_config kopyalarıyla paylaşılır (JSON istemcisi dahil)
+        self._counts = {"calls": 0, "rejected": 0, "truncated": 0}
+        self._quota = TokenBucket(quota_rpm / 60.0, max(1.0, quota_rpm / 60.0)) if quota_rpm else None
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "FakeLLM":
+        """
+        LLM_FAKE_LATENCY_MS (tüm aşamalar için medyan gecikme), LLM_FAKE_ERROR_RATE, LLM_FAKE_SEED,
+        LLM_FAKE_QUOTA_RPM.
+        """
+        mean_ms = float(os.getenv("LLM_FAKE_LATENCY_MS", "0"))
+        quota = os.getenv("LLM_FAKE_QUOTA_RPM")
+        return cls(
+            latency={"default": LatencyModel(mean_ms=mean_ms)},
+            error_rate=float(os.getenv("LLM_FAKE_ERROR_RATE", "0")),
+            seed=int(os.getenv("LLM_FAKE_SEED", "0")),
+            quota_rpm=float(quota) if quota else None,
+        )
+
+    @property
+    def calls(self) -> int:
+        return self._counts["calls"]
+
+    @property
+    def rejected(self) -> int:
+        return self._counts["rejected"]
+
+    @property
+    def truncated(self) -> int:
+        return self._counts["truncated"]
+
+    def with_generation_config(self, **overrides) -> "FakeLLM":
+        # Aynı gecikme/hata durumu paylaşılır; sadece ayar kaydı değişir
+        clone = object.__new__(FakeLLM)
+        clone.__dict__.update(self.__dict__)
+        clone.generation_config = {**self.generation_config, **overrides}
+        return clone
+
+    # --- yanıtlar ---
+    def respond(self, prompt: str, stage: Optional[str]) -> str:
+        if stage == "preflight":
+            fields = _last_json_line(prompt)
+            return json.dumps({"duzeltilmis": fields, "guvenlik": _SAFETY_RESPONSE}, ensure_ascii=False)
+        if stage == "typo":
+            return json.dumps(_last_json_line(prompt), ensure_ascii=False)
+        if stage == "safety":
+            return json.dumps(_SAFETY_RESPONSE, ensure_ascii=False)
+        if stage in ("critic", "critic-repair"):
+            # Boyut bazlı eleştirmen (agents.aspect_critic) kısa boyut JSON'ı bekler
+            aspect = _prompt_field(prompt, "Boyut:")
+            return json.dumps(dict(_ASPECT_RESPONSE, comment=f"{aspect}: {_ASPECT_RESPONSE['comment']}")
+                              if aspect else _CRITIC_RESPONSE, ensure_ascii=False)
+        if stage == "outline":
+            return json.dumps(self._outline(prompt), ensure_ascii=False)
+        if stage == "editor" and "[P1]" in prompt:
+            # Düzenleme listesi isteyen editör (agents.patch_editor): ilk paragraf değişir
+            return json.dumps({"edits": [{"op": "replace", "paragraph": 1,
+                                          "text": _STORY_PARAGRAPH.format(name="Deniz")}]}, ensure_ascii=False)
+        if stage in ("writer", "editor"):
+            return self._story(prompt)
+        return "{}"
+
+    def _story(self, prompt: str) -> str:
+        name = _prompt_field(prompt, "Karakterler:").split(",")[0].strip("[]'\" ") or "Deniz"
+        paragraphs = _paragraph_count(prompt)
+        return "\n\n".join(_STORY_PARAGRAPH.format(name=name) for _ in range(paragraphs))
+
+    def _outline(self, prompt: str) -> Dict:
+        try:
+            chapters = int(_prompt_field(prompt, "Bölüm sayısı:") or 4)
+        except ValueError:
+            chapters = 4
+        name = _prompt_field(prompt, "Karakterler:").split(",")[0].strip("[]'\" ") or "Deniz"
+        return {
+            "characters": f"{name}: kıyı kasabasında yaşayan, kararsız ama meraklı biri.",
+            "setting": "Bir kıyı kasabası, sonbahar.",
+            "chapters": [{"title": f"Bölüm {i + 1}", "summary": f"{name} kararına bir adım daha yaklaşır."}
+                         for i in range(chapters)],
+        }
+
+    # --- gecikme / hata ---
+    def _draw(self, stage: Optional[str]) -> float:
+        model = self.latency.get(stage or "") or self.latency.get("default") or LatencyModel()
+        with self._lock:
+            self._counts["calls"] += 1
+            delay = model.sample(self._rng) / 1000.0
+            fail = self._rng.random() < self.error_rate
+            rejected = self._quota is not None and not self._quota.try_take()
+            if rejected:
+                self._counts["rejected"] += 1
+        if rejected:
+            raise FakeRateLimited(f"Sahte kota aşıldı (aşama: {stage})")
+        if fail:
+            raise FakeLLMError(f"Sahte LLM hatası (aşama: {stage})")
+        return delay
+
+    def _cut(self, text: str) -> Optional[str]:
+        # max_output_tokens verilmişse gerçek model gibi çıktı o noktada kesilir (~4 karakter/token);
+        # LLMClient gibi kesik yanıt metin olarak dönmez, OutputTruncated fırlatılır
+        limit = self.generation_config.get("max_output_tokens")
+        if not limit or len(text) <= limit * 4:
+            return None
+        with self._lock:
+            self._counts["truncated"] += 1
+        return text[:limit * 4]
+
+    def _output_delay(self, stage: Optional[str], text: str) -> float:
+        model = self.latency.get(stage or "") or self.latency.get("default") or LatencyModel()
+        return model.per_token_ms * (len(text) / 4) / 1000.0
+
+    def __call__(self, prompt: str) -> str:
+        stage = current_stage()
+        text = self.respond(prompt, stage)
+        cut = self._cut(text)
+        delay = self._draw(stage) + self._output_delay(stage, text if cut is None else cut)
+        # Gerçek istemcideki request_options timeout'u gibi: süre dolunca hata
+        timeout = call_timeout(stage)
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise DeadlineExceeded(stage)
+        if delay:
+            time.sleep(delay)
+        if cut is not None:
+            raise OutputTruncated(cut, self.generation_config["max_output_tokens"])
+        return text
+
+    async def acall(self, prompt: str) -> str:
+        stage = current_stage()
+        text = self.respond(prompt, stage)
+        cut = self._cut(text)
+        delay = self._draw(stage) + self._output_delay(stage, text if cut is None else cut)
+        if delay:
+            await asyncio.sleep(delay)
+        if cut is not None:
+            raise OutputTruncated(cut, self.generation_config["max_output_tokens"])
+        return text
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        stage = current_stage()
+        text = self.respond(prompt, stage)
+        cut = self._cut(text)
+        if cut is not None:
+            text = cut
+        delay = self._draw(stage) + self._output_delay(stage, text)
+        pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or [""]
+        for piece in pieces:
+            # Toplam gecikme parçalara bölünür (ilk parça süresi gerçek akışa benzer)
+            if delay:
+                time.sleep(delay / len(pieces))
+            yield piece
+        if cut is not None:
+            raise OutputTruncated(cut, self.generation_config["max_output_tokens"])
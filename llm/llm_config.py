@@ -1,20 +1,233 @@
 import os
-from dotenv import load_dotenv
-import google.generativeai as genai
+import asyncio
+import threading
+import weakref
+from typing import Iterator, Optional
+from llm.budget import OutputTruncated
+from llm.cache import CachedLLM, LLMCache, get_default_cache
+from llm.context import current_stage
+from llm.deadline import DeadlineExceeded, call_timeout
+from llm.metrics import InstrumentedLLM
 
-load_dotenv()
+# google.generativeai ağır bir modüldür (~1 sn import); menü/GUI açılırken beklememek için
+# import ve yapılandırma ilk gerçek LLM çağrısına (ya da warmup'a) ertelenir.
 
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    raise RuntimeError("GOOGLE_API_KEY bulunamadi")
+MODEL_NAME = "gemini-2.5-flash-lite"
 
-genai.configure(api_key=api_key)
+# Aynı anda uçuşta olabilecek asenkron istek sayısı (LLM_MAX_CONCURRENCY ile ayarlanabilir)
+DEFAULT_MAX_CONCURRENCY = 16
 
-def get_llm():
-    model = genai.GenerativeModel("gemini-2.5-flash-lite")
+# google.api_core / requests'in zaman aşımı hata sınıfları (import etmeden adla tanınır)
+_TIMEOUT_ERRORS = ("DeadlineExceeded", "Timeout", "ReadTimeout", "TimeoutError")
 
-    def llm_call(prompt: str) -> str:
-        response = model.generate_content(prompt)
+_env_loaded = False
+_genai = None
+_config_lock = threading.Lock()
+
+
+def _load_env() -> None:
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def _require_api_key() -> str:
+    # API anahtarı sadece Gemini istemcisi gerçekten oluşturulurken istenir;
+    # böylece sahte arka uçla (LLM_BACKEND=fake) anahtarsız çalışılabilir.
+    _load_env()
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise RuntimeError("GOOGLE_API_KEY bulunamadi")
+    return api_key
+
+
+def _ensure_configured():
+    """google.generativeai'yi ilk ihtiyaçta import edip yapılandırır; modülü döndürür."""
+    global _genai
+    if _genai is not None:
+        return _genai
+    with _config_lock:
+        if _genai is None:
+            api_key = _require_api_key()
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _genai = genai
+    return _genai
+
+
+def _truncated(response) -> bool:
+    """Yanıt max_output_tokens sınırına takılıp yarıda mı kesildi? (finish_reason == MAX_TOKENS)"""
+    try:
+        reason = response.candidates[0].finish_reason
+    except (AttributeError, IndexError, TypeError):
+        return False
+    return getattr(reason, "name", str(reason)) in ("MAX_TOKENS", "2")
+
+
+def warmup() -> bool:
+    """
+    Gemini arka ucunu önceden hazırlar (import + yapılandırma); ağ çağrısı yapmaz.
+    Kullanıcı menüde seçim yaparken arka planda çağrılması için tasarlanmıştır.
+    """
+    try:
+        _load_env()
+        if os.getenv("LLM_BACKEND", "gemini").lower() != "fake":
+            _ensure_configured()
+        from llm.pool import get_pool
+        get_pool().warm()
+        return True
+    except Exception:
+        # Anahtar yoksa vb. hata, asıl kullanımda (get_llm) kullanıcıya gösterilir
+        return False
+
+
+def warmup_in_background() -> threading.Thread:
+    thread = threading.Thread(target=warmup, name="llm-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+class LLMClient:
+    """
+    Gemini istemcisi.
+    - Senkron kullanım: client(prompt) -> str  (eski llm_call ile aynı)
+    - Asenkron kullanım: await client.acall(prompt) -> str
+    - Akış (streaming): for chunk in client.stream(prompt): ...
+    Asenkron tarafta uçuştaki istek sayısı max_concurrency ile sınırlanır.
+    generation_config'te max_output_tokens varsa ve yanıt bu sınırda kesilirse (MAX_TOKENS)
+    yarım metin dönmez, OutputTruncated fırlatılır (tekrar kararı llm.budget.OutputCaps'indir).
+    """
+
+    def __init__(
+        self,
+        model_name: str = MODEL_NAME,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        generation_config: Optional[dict] = None,
+    ):
+        _require_api_key()
+        self.model_name = model_name
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.generation_config = generation_config or {}
+        self._model = None
+        self._model_lock = threading.Lock()
+        # asyncio.Semaphore bir event loop'a bağlanır; her loop için ayrı tutuyoruz
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    @property
+    def model(self):
+        # GenerativeModel ilk çağrıda oluşturulur (genai import'u da o zaman yapılır)
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    genai = _ensure_configured()
+                    self._model = genai.GenerativeModel(
+                        self.model_name, generation_config=self.generation_config or None
+                    )
+        return self._model
+
+    def with_generation_config(self, **overrides) -> "LLMClient":
+        """
+        Aynı model ve eşzamanlılık sınırıyla, üretim ayarları güncellenmiş bir kopya döndürür
+        (örn. response_mime_type="application/json").
+        """
+        clone = LLMClient(
+            self.model_name,
+            self.max_concurrency,
+            generation_config={**self.generation_config, **overrides},
+        )
+        clone._semaphores = self._semaphores
+        return clone
+
+    def _text(self, response) -> str:
+        limit = self.generation_config.get("max_output_tokens")
+        if limit and _truncated(response):
+            try:
+                partial = response.text
+            except ValueError:
+                partial = ""
+            raise OutputTruncated(partial, limit)
         return response.text
 
-    return llm_call
\ No newline at end of file
+    def _request_options(self) -> Optional[dict]:
+        # Bağlı bir Deadline varsa (llm.deadline) HTTP isteği aşamanın kalan süresiyle sınırlanır
+        timeout = call_timeout(current_stage())
+        return {"timeout": timeout} if timeout is not None else None
+
+    def __call__(self, prompt: str) -> str:
+        options = self._request_options()
+        try:
+            response = self.model.generate_content(prompt, request_options=options)
+        except Exception as e:
+            # google.api_core'un DeadlineExceeded/Timeout hatalarını ortak türe çevir
+            if options is not None and type(e).__name__ in _TIMEOUT_ERRORS:
+                raise DeadlineExceeded(current_stage()) from e
+            raise
+        return self._text(response)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """
+        Yanıtı parça parça (chunk) döndürür; ilk parça geldiği anda kullanılabilir.
+        Akış max_output_tokens sınırında kesilirse son parçadan sonra OutputTruncated fırlatılır.
+        """
+        response = self.model.generate_content(prompt, stream=True, request_options=self._request_options())
+        limit = self.generation_config.get("max_output_tokens")
+        parts, truncated = [], False
+        for chunk in response:
+            truncated = truncated or bool(limit) and _truncated(chunk)
+            try:
+                text = chunk.text
+            except ValueError:
+                # Metin içermeyen parça (örn. sadece finish_reason)
+                continue
+            if text:
+                parts.append(text)
+                yield text
+        if truncated:
+            raise OutputTruncated("".join(parts), limit)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        sem = self._semaphores.get(loop)
+        if sem is None:
+            sem = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = sem
+        return sem
+
+    async def acall(self, prompt: str) -> str:
+        async with self._semaphore():
+            response = await self.model.generate_content_async(prompt)
+        return self._text(response)
+
+
+def get_llm(max_concurrency: Optional[int] = None, cache: Optional[LLMCache] = None):
+    """
+    LLM istemcisini döndürür.
+    Argümansız çağrıldığında süreç genelindeki havuzun (llm.pool) paylaşılan istemcisi döner;
+    böylece her tıklamada/hikayede yeni model ve bağlantı kurulmaz.
+    cache verilirse (veya LLM_CACHE_PATH tanımlıysa) yanıtlar diskteki önbellekten
+    okunur; hangi aşamaların önbelleğe gireceğini LLMCache.stages belirler.
+    Her çağrı aşama etiketiyle llm.metrics'e kaydedilir (önbellek isabetleri dahil).
+    LLM_BACKEND=fake ise ağa çıkmayan sahte arka uç (llm.fake.FakeLLM) kullanılır.
+    Çağrılar hız sınırı, AIMD eşzamanlılık ve tekrar deneme katmanından (llm.resilience) geçer.
+    """
+    if max_concurrency is None and cache is None:
+        from llm.pool import get_pool
+        return get_pool().llm()
+
+    _load_env()
+    if max_concurrency is None:
+        max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", str(DEFAULT_MAX_CONCURRENCY)))
+    if os.getenv("LLM_BACKEND", "gemini").lower() == "fake":
+        from llm.fake import FakeLLM
+        client = FakeLLM.from_env()
+    else:
+        client = LLMClient(max_concurrency=max_concurrency)
+    from llm.resilience import ResilientLLM, resilience_from_env
+    client = ResilientLLM(client, **resilience_from_env(max_concurrency))
+    if cache is None:
+        cache = get_default_cache()
+    if cache is not None:
+        return InstrumentedLLM(CachedLLM(client, cache))
+    return InstrumentedLLM(client)
@@ -0,0 +1,318 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO
+
+from llm.aio import acall_llm
+from llm.budget import OutputTruncated
+from llm.cancel import check_cancelled
+from llm.context import current_stage
+from llm.deadline import DeadlineExceeded, call_timeout, check_deadline
+from llm.streaming import stream_llm
+from llm.structured import json_parse_stats
+
+# Gecikme histogramı sınırları (saniye)
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def estimate_tokens(text: str) -> int:
+    """Kaba token tahmini (~4 karakter/token); istemci yanıtla birlikte token sayısı döndürmüyor."""
+    return (len(text) + 3) // 4 if text else 0
+
+
+@dataclass
+class CallRecord:
+    stage: str
+    wall_ms: float
+    prompt_chars: int
+    response_chars: int
+    prompt_tokens: int
+    response_tokens: int
+    cache_hit: bool = False
+    retries: int = 0
+    error: Optional[str] = None
+    first_chunk_ms: Optional[float] = None  # sadece akışlı çağrılarda
+    max_output_tokens: Optional[int] = None  # istemcinin çıktı sınırı (varsa)
+    ts: float = field(default_factory=time.time)
+
+
+@dataclass
+class StageStats:
+    calls: int = 0
+    errors: int = 0
+    cache_hits: int = 0
+    retries: int = 0
+    wall_seconds: float = 0.0
+    max_wall_seconds: float = 0.0
+    prompt_chars: int = 0
+    response_chars: int = 0
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+    output_cap_tokens: int = 0
+    buckets: List[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+
+    def add(self, rec: CallRecord) -> None:
+        seconds = rec.wall_ms / 1000.0
+        self.calls += 1
+        self.errors += rec.error is not None
+        self.cache_hits += rec.cache_hit
+        self.retries += rec.retries
+        self.wall_seconds += seconds
+        self.max_wall_seconds = max(self.max_wall_seconds, seconds)
+        self.prompt_chars += rec.prompt_chars
+        self.response_chars += rec.response_chars
+        self.prompt_tokens += rec.prompt_tokens
+        self.response_tokens += rec.response_tokens
+        self.output_cap_tokens += rec.max_output_tokens or 0
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+
+class MetricsRecorder:
+    """
+    LLM çağrı metriklerini aşama (stage) bazında toplar.
+    keep_records=True ise tek tek çağrı kayıtları da tutulur (koşu bazlı kayıtçılar için).
+    """
+
+    def __init__(self, keep_records: bool = False):
+        self.keep_records = keep_records
+        self.records: List[CallRecord] = []
+        self._stages: Dict[str, StageStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, rec: CallRecord) -> None:
+        with self._lock:
+            self._stages.setdefault(rec.stage, StageStats()).add(rec)
+            if self.keep_records:
+                self.records.append(rec)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Aşama -> {calls, wall_ms, ...} (sonuç sözlüğüne eklenen JSON uyumlu özet)."""
+        with self._lock:
+            out = {}
+            for stage, st in self._stages.items():
+                out[stage] = {
+                    "calls": st.calls,
+                    "errors": st.errors,
+                    "cache_hits": st.cache_hits,
+                    "retries": st.retries,
+                    "wall_ms": round(st.wall_seconds * 1000, 1),
+                    "max_wall_ms": round(st.max_wall_seconds * 1000, 1),
+                    "prompt_chars": st.prompt_chars,
+                    "response_chars": st.response_chars,
+                    "prompt_tokens": st.prompt_tokens,
+                    "response_tokens": st.response_tokens,
+                    "output_cap_tokens": st.output_cap_tokens,
+                }
+            return out
+
+    def write_jsonl(self, out: TextIO) -> None:
+        with self._lock:
+            records = list(self.records)
+        for rec in records:
+            out.write(json.dumps(asdict(rec), ensure_ascii=False) + "\n")
+
+    def to_prometheus(self, prefix: str = "story_llm") -> str:
+        """Prometheus text exposition formatında metrikler."""
+        with self._lock:
+            stages = {k: StageStats(**{**asdict(v), "buckets": list(v.buckets)}) for k, v in self._stages.items()}
+
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, attr: str) -> None:
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for stage, st in sorted(stages.items()):
+                lines.append(f'{prefix}_{name}{{stage="{stage}"}} {getattr(st, attr)}')
+
+        metric("calls_total", "counter", "LLM cagri sayisi", "calls")
+        metric("errors_total", "counter", "Hata ile biten LLM cagrilari", "errors")
+        metric("cache_hits_total", "counter", "Onbellekten donen LLM cagrilari", "cache_hits")
+        metric("retries_total", "counter", "Tekrar denemeler", "retries")
+        metric("prompt_chars_total", "counter", "Prompt karakter sayisi", "prompt_chars")
+        metric("response_chars_total", "counter", "Yanit karakter sayisi", "response_chars")
+        metric("prompt_tokens_total", "counter", "Tahmini prompt token sayisi", "prompt_tokens")
+        metric("response_tokens_total", "counter", "Tahmini yanit token sayisi", "response_tokens")
+        metric("output_cap_tokens_total", "counter", "Cagrilara verilen cikti token siniri toplami", "output_cap_tokens")
+
+        name = f"{prefix}_call_duration_seconds"
+        lines.append(f"# HELP {name} LLM cagri suresi")
+        lines.append(f"# TYPE {name} histogram")
+        for stage, st in sorted(stages.items()):
+            for bound, count in zip(LATENCY_BUCKETS, st.buckets):
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {st.calls}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {st.wall_seconds:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {st.calls}')
+
+        name = f"{prefix}_json_parse_total"
+        lines.append(f"# HELP {name} Yapilandirilmis cikti ayristirma yollari")
+        lines.append(f"# TYPE {name} counter")
+        for outcome, count in sorted(json_parse_stats().items()):
+            lines.append(f'{name}{{outcome="{outcome}"}} {count}')
+
+        return "\n".join(lines) + "\n"
+
+
+# Süreç geneli toplam ve (varsa) koşu bazlı kayıtçı
+GLOBAL_METRICS = MetricsRecorder()
+# İç içe kapsamlarda çağrı, açık olan tüm kayıtçılara işlenir (örn. batch kaydı + pipeline sonucu)
+_run_recorders: ContextVar[tuple] = ContextVar("llm_run_metrics", default=())
+# O an yürüyen çağrının ek bilgileri (önbellek isabeti, tekrar deneme sayısı)
+_call_info: ContextVar[Optional[Dict[str, Any]]] = ContextVar("llm_call_info", default=None)
+
+_log_lock = threading.Lock()
+
+
+@contextmanager
+def metrics_scope(recorder: Optional[MetricsRecorder] = None) -> Iterator[MetricsRecorder]:
+    """
+    Blok içindeki LLM çağrılarını (global toplama ek olarak) ayrı bir kayıtçıda da toplar.
+    Örn:
+        with metrics_scope() as m:
+            pipeline.run(user_input)
+        m.summary()
+    """
+    recorder = recorder if recorder is not None else MetricsRecorder(keep_records=True)
+    token = _run_recorders.set(_run_recorders.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        _run_recorders.reset(token)
+
+
+def note_cache_hit() -> None:
+    info = _call_info.get()
+    if info is not None:
+        info["cache_hit"] = True
+
+
+def note_retry() -> None:
+    info = _call_info.get()
+    if info is not None:
+        info["retries"] = info.get("retries", 0) + 1
+
+
+def _emit(rec: CallRecord) -> None:
+    GLOBAL_METRICS.record(rec)
+    for run in _run_recorders.get():
+        run.record(rec)
+    # LLM_METRICS_LOG tanımlıysa her çağrı JSON satırı olarak dosyaya eklenir
+    path = os.getenv("LLM_METRICS_LOG")
+    if path:
+        line = json.dumps(asdict(rec), ensure_ascii=False) + "\n"
+        with _log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def _partial_text(error: BaseException) -> str:
+    # Çıktı sınırında kesilen yanıtın metni de token sayımına girer
+    return error.partial_text if isinstance(error, OutputTruncated) else ""
+
+
+class InstrumentedLLM:
+    """
+    LLM çağrılabilirini sararak her çağrının süresini, boyutlarını, önbellek isabetini
+    ve tekrar denemelerini aşama etiketiyle kaydeder.
+    """
+
+    def __init__(self, llm: Callable[[str], str]):
+        self.llm = llm
+        self.model_name = getattr(llm, "model_name", "unknown")
+        self.generation_config = getattr(llm, "generation_config", None) or {}
+
+    def with_generation_config(self, **overrides) -> "InstrumentedLLM":
+        configure = getattr(self.llm, "with_generation_config", None)
+        if configure is None:
+            return self
+        return InstrumentedLLM(configure(**overrides))
+
+    def _finish(self, stage: str, info: Dict[str, Any], prompt: str, text: str, started: float,
+                error: Optional[BaseException] = None, first_chunk: Optional[float] = None) -> None:
+        _emit(CallRecord(
+            stage=stage,
+            wall_ms=round((time.perf_counter() - started) * 1000, 3),
+            prompt_chars=len(prompt),
+            response_chars=len(text),
+            prompt_tokens=estimate_tokens(prompt),
+            response_tokens=estimate_tokens(text),
+            cache_hit=bool(info.get("cache_hit")),
+            retries=int(info.get("retries", 0)),
+            error=type(error).__name__ if error is not None else None,
+            first_chunk_ms=round((first_chunk - started) * 1000, 3) if first_chunk is not None else None,
+            max_output_tokens=self.generation_config.get("max_output_tokens"),
+        ))
+
+    def __call__(self, prompt: str) -> str:
+        check_cancelled()  # iptal edilmiş işlemde yeni çağrı başlatma
+        stage = current_stage() or "unknown"
+        check_deadline(stage)  # bütçesi dolmuş istekte yeni çağrı başlatma
+        info: Dict[str, Any] = {}
+        token = _call_info.set(info)
+        started = time.perf_counter()
+        try:
+            text = self.llm(prompt)
+        except BaseException as e:
+            self._finish(stage, info, prompt, _partial_text(e), started, e)
+            raise
+        finally:
+            _call_info.reset(token)
+        self._finish(stage, info, prompt, text, started)
+        return text
+
+    async def acall(self, prompt: str) -> str:
+        check_cancelled()
+        stage = current_stage() or "unknown"
+        check_deadline(stage)
+        timeout = call_timeout(stage)
+        info: Dict[str, Any] = {}
+        token = _call_info.set(info)
+        started = time.perf_counter()
+        try:
+            # Asenkron tarafta zaman aşımı her arka uç için burada uygulanır (görev iptal edilir)
+            try:
+                text = await asyncio.wait_for(acall_llm(self.llm, prompt), timeout)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(stage) from None
+        except BaseException as e:
+            self._finish(stage, info, prompt, _partial_text(e), started, e)
+            raise
+        finally:
+            _call_info.reset(token)
+        self._finish(stage, info, prompt, text, started)
+        return text
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        stage = current_stage() or "unknown"
+        info: Dict[str, Any] = {}
+        started = time.perf_counter()
+        first_chunk = None
+        parts: List[str] = []
+        inner = stream_llm(self.llm, prompt)
+        try:
+            while True:
+                # Bilgi bağlamı sadece iç akış ilerletilirken kurulur (yield'ler arasında sızmaz)
+                token = _call_info.set(info)
+                try:
+                    chunk = next(inner)
+                except StopIteration:
+                    break
+                finally:
+                    _call_info.reset(token)
+                if first_chunk is None:
+                    first_chunk = time.perf_counter()
+                parts.append(chunk)
+                yield chunk
+        except BaseException as e:
+            # Tüketicinin akışı erken kapatması (GeneratorExit) hata değildir; o ana kadarki metinle kaydedilir
+            self._finish(stage, info, prompt, "".join(parts), started,
+                         e if isinstance(e, Exception) else None, first_chunk)
+            raise
+        self._finish(stage, info, prompt, "".join(parts), started, first_chunk=first_chunk)
@@ -0,0 +1,193 @@
+from __future__ import annotations
+import os
+import threading
+import weakref
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from llm.aio import acall_llm
+from llm.cache import CachedLLM, get_default_cache
+from llm.context import current_stage
+from llm.llm_config import DEFAULT_MAX_CONCURRENCY, MODEL_NAME, LLMClient, _load_env, _require_api_key
+from llm.metrics import InstrumentedLLM
+from llm.resilience import ResilientLLM, resilience_from_env
+from llm.streaming import stream_llm
+
+
+def _parse_stage_models(spec: str) -> Dict[str, str]:
+    # "writer=gemini-2.5-flash,editor=gemini-2.5-flash" -> {"writer": ..., "editor": ...}
+    out = {}
+    for part in spec.split(","):
+        if "=" in part:
+            stage, model = part.split("=", 1)
+            if stage.strip() and model.strip():
+                out[stage.strip()] = model.strip()
+    return out
+
+
+class LLMPool:
+    """
+    Süreç geneli LLM istemci havuzu.
+
+    - Her (model, üretim ayarı) için TEK istemci oluşturulur ve tekrar kullanılır;
+      genai'nin alttaki HTTP/gRPC bağlantısı da böylece açık kalır (keep-alive).
+    - Aşama bazlı model seçilebilir (örn. writer için daha güçlü model):
+      stage_models={"writer": "gemini-2.5-flash"} veya LLM_STAGE_MODELS ortam değişkeni.
+    - Tüm istemciler aynı asenkron eşzamanlılık sınırını, hız sınırını (LLM_RPM/LLM_TPM)
+      ve AIMD eşzamanlılık denetimini paylaşır (llm.resilience); geçici hatalar tekrar denenir.
+    """
+
+    def __init__(
+        self,
+        default_model: str = MODEL_NAME,
+        stage_models: Optional[Dict[str, str]] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        backend: str = "gemini",
+        cache=None,
+        resilience: Optional[Dict[str, Any]] = None,
+    ):
+        self.default_model = default_model
+        self.stage_models = dict(stage_models or {})
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.backend = backend
+        self.cache = cache
+        # ResilientLLM ayarları; limiter/concurrency nesneleri tüm istemcilerde ortaktır
+        self.resilience = resilience if resilience is not None else resilience_from_env(self.max_concurrency)
+        self._clients: Dict[Tuple[str, Tuple], Any] = {}
+        self._raw_clients: Dict[Tuple[str, Tuple], Any] = {}  # sarmalayıcısız istemciler (warm için)
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._reused = 0
+        self._requests: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "LLMPool":
+        _load_env()
+        backend = os.getenv("LLM_BACKEND", "gemini").lower()
+        if backend != "fake":
+            _require_api_key()  # anahtar eksikse hata hemen (ilk çağrıyı beklemeden) görülsün
+        return cls(
+            default_model=os.getenv("LLM_MODEL", MODEL_NAME),
+            stage_models=_parse_stage_models(os.getenv("LLM_STAGE_MODELS", "")),
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", str(DEFAULT_MAX_CONCURRENCY))),
+            backend=backend,
+            cache=get_default_cache(),
+        )
+
+    def model_for(self, stage: Optional[str]) -> str:
+        return self.stage_models.get(stage or "", self.default_model)
+
+    def _build(self, model_name: str, overrides: Dict[str, Any]) -> Tuple[Any, Any]:
+        if self.backend == "fake":
+            from llm.fake import FakeLLM
+            client = FakeLLM.from_env()
+            client.model_name = model_name
+            if overrides:
+                client = client.with_generation_config(**overrides)
+        else:
+            client = LLMClient(model_name, self.max_concurrency, generation_config=overrides)
+            client._semaphores = self._semaphores
+        raw = client
+        client = ResilientLLM(client, **self.resilience)
+        # Önbellek isabetleri kotaya sayılmaz: önbellek dayanıklılık katmanının dışında
+        if self.cache is not None:
+            client = CachedLLM(client, self.cache)
+        return InstrumentedLLM(client), raw
+
+    def client(self, stage: Optional[str] = None, overrides: Optional[Dict[str, Any]] = None):
+        """Aşamanın modeli ve verilen üretim ayarları için paylaşılan istemci."""
+        with self._lock:
+            self._requests[stage or "unknown"] = self._requests.get(stage or "unknown", 0) + 1
+        return self._get(stage, overrides or {})
+
+    def _get(self, stage: Optional[str], overrides: Dict[str, Any]):
+        model_name = self.model_for(stage)
+        key = (model_name, tuple(sorted((k, repr(v)) for k, v in overrides.items())))
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._reused += 1
+                return client
+        built, raw = self._build(model_name, overrides)
+        with self._lock:
+            # Aynı anda iki thread oluşturduysa ilk kaydedilen kullanılır
+            client = self._clients.setdefault(key, built)
+            if client is built:
+                self._raw_clients[key] = raw
+                self._created += 1
+            else:
+                self._reused += 1
+        return client
+
+    def warm(self) -> None:
+        """Varsayılan ve aşama bazlı modellerin istemcilerini önceden kurar (ağ çağrısı yok)."""
+        for stage in [None, *self.stage_models]:
+            self._get(stage, {})
+        with self._lock:
+            raws = list(self._raw_clients.values())
+        for raw in raws:
+            if isinstance(raw, LLMClient):
+                raw.model  # GenerativeModel'i oluştur
+
+    def llm(self) -> "PooledLLM":
+        """Etmenlere verilecek, çağrıyı o anki aşamanın istemcisine yönlendiren LLM."""
+        return PooledLLM(self)
+
+    def stats(self) -> Dict[str, Any]:
+        limiter, concurrency = self.resilience.get("limiter"), self.resilience.get("concurrency")
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "concurrency_limit": round(concurrency.limit, 2) if concurrency is not None else None,
+                "throttles": concurrency.throttles if concurrency is not None else 0,
+                "rate_wait_s": round(limiter.waited_s, 3) if limiter is not None else 0.0,
+                "clients": len(self._clients),
+                "created": self._created,
+                "reused": self._reused,
+                "models": sorted({model for model, _ in self._clients}),
+                "requests_by_stage": dict(self._requests),
+            }
+
+
+class PooledLLM:
+    """
+    LLM arayüzü (llm(prompt), acall, stream, with_generation_config); her çağrıda
+    llm.context'teki aşamaya göre havuzdaki istemciyi seçer.
+    """
+
+    def __init__(self, pool: LLMPool, overrides: Optional[Dict[str, Any]] = None):
+        self.pool = pool
+        self.generation_config = dict(overrides or {})
+
+    @property
+    def model_name(self) -> str:
+        return self.pool.model_for(current_stage())
+
+    def _client(self):
+        return self.pool.client(current_stage(), self.generation_config)
+
+    def with_generation_config(self, **overrides) -> "PooledLLM":
+        return PooledLLM(self.pool, {**self.generation_config, **overrides})
+
+    def __call__(self, prompt: str) -> str:
+        return self._client()(prompt)
+
+    async def acall(self, prompt: str) -> str:
+        return await acall_llm(self._client(), prompt)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        return stream_llm(self._client(), prompt)
+
+
+_pool: Optional[LLMPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> LLMPool:
+    """Süreç genelindeki tek havuz (ilk çağrıda ortam değişkenlerinden kurulur)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = LLMPool.from_env()
+    return _pool
@@ -0,0 +1,357 @@
+from __future__ import annotations
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterator, Optional
+
+from llm.aio import acall_llm
+from llm.budget import OutputTruncated
+from llm.cancel import check_cancelled
+from llm.context import current_stage
+from llm.deadline import DeadlineExceeded, call_timeout
+from llm.metrics import estimate_tokens, note_retry
+from llm.streaming import stream_llm
+
+# Gemini kotası altında dayanıklı çağrı katmanı:
+# - RateLimiter: süreç geneli istek/dakika ve token/dakika kovası (token bucket)
+# - AIMDLimiter: kısıtlamada (429/503) eşzamanlılığı yarıya indirir, başarıda yavaşça artırır
+# - ResilientLLM: bu ikisini uygular, geçici hatalarda jitter'lı üstel bekleme ile tekrar dener
+
+# Geçici (tekrar denenebilir) hatalar; google.api_core sınıfları import edilmeden adla tanınır
+_THROTTLE_ERRORS = ("ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "FakeRateLimited")
+_TRANSIENT_ERRORS = _THROTTLE_ERRORS + (
+    "InternalServerError", "BadGateway", "GatewayTimeout", "ConnectionError", "FakeLLMError",
+)
+
+
+def is_throttle(error: BaseException) -> bool:
+    """Kota/aşırı yük sinyali mi (AIMD eşzamanlılığı düşürür)."""
+    return type(error).__name__ in _THROTTLE_ERRORS or getattr(error, "code", None) in (429, 503)
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, DeadlineExceeded):
+        return False
+    code = getattr(error, "code", None)
+    return type(error).__name__ in _TRANSIENT_ERRORS or (isinstance(code, int) and (code == 429 or code >= 500))
+
+
+def backoff_delay(attempt: int, base: float, cap: float, rng: random.Random) -> float:
+    """'Full jitter' üstel bekleme: [0, min(cap, base * 2^attempt)] aralığında rastgele."""
+    return rng.uniform(0.0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """
+    Thread-safe token kovası. reserve(n) hemen döner ve çağıranın beklemesi gereken süreyi
+    verir (kova borçlanabilir); böylece aynı kova hem thread'lerden hem asyncio'dan kullanılır.
+    """
+
+    def __init__(self, rate_per_s: float, capacity: float):
+        self.rate = rate_per_s
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def try_take(self, amount: float = 1.0) -> bool:
+        """Yeterli token varsa düşer ve True döner; borçlanmaz."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < amount:
+                return False
+            self._tokens -= amount
+            return True
+
+    def debit(self, amount: float) -> None:
+        """Sonradan öğrenilen tüketimi (örn. yanıt token'ları) beklemeden düşer."""
+        with self._lock:
+            self._tokens -= amount
+
+    def refund(self, amount: float) -> None:
+        """reserve edilip kullanılmayan tokenları geri verir."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class RateLimiter:
+    """
+    Dakikalık istek (rpm) ve token (tpm) kotası. None olan sınır uygulanmaz.
+    burst_s: kovanın kapasitesi kaç saniyelik kota kadar (varsayılan 60 = Gemini'nin dakikalık
+    penceresi); daha küçük değer çağrıları zamana daha düzgün yayar.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None, burst_s: float = 60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = TokenBucket(rpm / 60.0, max(1.0, rpm * burst_s / 60.0)) if rpm else None
+        self._tokens = TokenBucket(tpm / 60.0, max(1.0, tpm * burst_s / 60.0)) if tpm else None
+        self.waited_s = 0.0
+
+    def reserve(self, prompt_tokens: int) -> float:
+        wait = 0.0
+        if self._requests is not None:
+            wait = max(wait, self._requests.reserve(1))
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.reserve(prompt_tokens))
+        self.waited_s += wait
+        return wait
+
+    def refund(self, prompt_tokens: int, wait: float) -> None:
+        """Ayrılıp hiç yapılmayan çağrının kotasını geri verir (örn. sıra beklerken süre doldu)."""
+        if self._requests is not None:
+            self._requests.refund(1)
+        if self._tokens is not None:
+            self._tokens.refund(prompt_tokens)
+        self.waited_s -= wait
+
+    def record_response(self, response_tokens: int) -> None:
+        if self._tokens is not None:
+            self._tokens.debit(response_tokens)
+
+
+class AIMDLimiter:
+    """
+    Toplamsal artış / çarpımsal azalış (AIMD) eşzamanlılık sınırı.
+    - Her başarılı çağrıda sınır 1/limit kadar artar (yaklaşık her 'limit' başarıda +1)
+    - Kısıtlama hatasında sınır decrease ile çarpılır (en az min_limit)
+    """
+
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 16, decrease: float = 0.5):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.decrease = decrease
+        self.in_flight = 0
+        self.throttles = 0
+        self._cond = threading.Condition()
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Yer açılana kadar bekler; timeout dolarsa False döner."""
+        with self._cond:
+            return self._cond.wait_for(self._try_acquire, timeout)
+
+    async def aacquire(self) -> None:
+        # Sınır thread'lerle paylaşıldığından asyncio tarafı kısa aralıklarla yoklar
+        delay = 0.005
+        while True:
+            with self._cond:
+                if self._try_acquire():
+                    return
+            await asyncio.sleep(delay)
+            delay = min(0.1, delay * 2)
+
+    def release(self, throttled: bool = False, success: bool = True) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttles += 1
+                self.limit = max(float(self.min_limit), self.limit * self.decrease)
+            elif success:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+class ResilientLLM:
+    """
+    LLM çağrılabilirini hız sınırı, AIMD eşzamanlılık ve tekrar deneme ile sarar.
+    Limitler paylaşılan nesnelerdir; havuzdaki tüm istemcilere aynıları verilir.
+    Akışta sadece ilk parça gelmeden oluşan hatalar tekrar denenir (yarım metin tekrarlanmaz).
+    Bekleme süresi bağlı Deadline'ın kalan süresini aşacaksa son hata hemen fırlatılır.
+    """
+
+    def __init__(
+        self,
+        llm: Callable[[str], str],
+        limiter: Optional[RateLimiter] = None,
+        concurrency: Optional[AIMDLimiter] = None,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        seed: Optional[int] = None,
+    ):
+        self.llm = llm
+        self.limiter = limiter
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.model_name = getattr(llm, "model_name", "unknown")
+        self.generation_config = getattr(llm, "generation_config", None) or {}
+        self._rng = random.Random(seed)
+
+    def with_generation_config(self, **overrides) -> "ResilientLLM":
+        configure = getattr(self.llm, "with_generation_config", None)
+        if configure is None:
+            return self
+        clone = object.__new__(ResilientLLM)
+        clone.__dict__.update(self.__dict__)
+        clone.llm = configure(**overrides)
+        clone.generation_config = getattr(clone.llm, "generation_config", None) or {}
+        return clone
+
+    def _acquire_slot(self) -> None:
+        if self.concurrency is not None and not self.concurrency.acquire(call_timeout(current_stage())):
+            raise DeadlineExceeded(current_stage(), "Eşzamanlılık sırası süre bütçesini aştı")
+
+    def _admission_wait(self, prompt: str) -> float:
+        if self.limiter is None:
+            return 0.0
+        wait = self.limiter.reserve(estimate_tokens(prompt))
+        try:
+            self._check_budget(wait, None)
+        except DeadlineExceeded:
+            self._refund(prompt, wait)
+            raise
+        return wait
+
+    def _refund(self, prompt: str, wait: float) -> None:
+        # Kota ayrıldı ama çağrı hiç yapılmadı
+        if self.limiter is not None:
+            self.limiter.refund(estimate_tokens(prompt), wait)
+
+    def _admit(self, prompt: str, wait: float) -> None:
+        try:
+            self._acquire_slot()
+        except DeadlineExceeded:
+            self._refund(prompt, wait)
+            raise
+
+    def _retry_delay(self, attempt: int, error: BaseException) -> float:
+        if attempt >= self.max_retries or not is_retryable(error):
+            raise error
+        delay = backoff_delay(attempt, self.base_delay, self.max_delay, self._rng)
+        self._check_budget(delay, error)
+        note_retry()
+        return delay
+
+    @staticmethod
+    def _check_budget(wait: float, error: Optional[BaseException]) -> None:
+        remaining = call_timeout(current_stage())
+        if remaining is not None and wait >= remaining:
+            if error is not None:
+                raise error
+            raise DeadlineExceeded(current_stage(), "Hız sınırı beklemesi süre bütçesini aşıyor")
+
+    def _finish(self, text: str, error: Optional[BaseException]) -> None:
+        # Çıktı sınırında kesilen yanıt da üretilmiş (ve kotadan düşülen) bir yanıttır
+        if isinstance(error, OutputTruncated):
+            text, error = error.partial_text, None
+        if self.concurrency is not None:
+            self.concurrency.release(throttled=error is not None and is_throttle(error), success=error is None)
+        if error is None and self.limiter is not None:
+            self.limiter.record_response(estimate_tokens(text))
+
+    def _abandon(self) -> None:
+        # İptal edilen ya da tüketicinin kapattığı çağrı: yer boşalır ama AIMD sınırı büyümez
+        if self.concurrency is not None:
+            self.concurrency.release(throttled=False, success=False)
+
+    def __call__(self, prompt: str) -> str:
+        attempt = 0
+        while True:
+            check_cancelled()
+            wait = self._admission_wait(prompt)
+            if wait:
+                time.sleep(wait)
+            self._admit(prompt, wait)
+            try:
+                text = self.llm(prompt)
+            except Exception as e:
+                self._finish("", e)
+                time.sleep(self._retry_delay(attempt, e))
+                attempt += 1
+                continue
+            self._finish(text, None)
+            return text
+
+    async def acall(self, prompt: str) -> str:
+        attempt = 0
+        while True:
+            check_cancelled()
+            wait = self._admission_wait(prompt)
+            try:
+                if wait:
+                    await asyncio.sleep(wait)
+                if self.concurrency is not None:
+                    await self.concurrency.aacquire()
+            except asyncio.CancelledError:
+                self._refund(prompt, wait)
+                raise
+            try:
+                text = await acall_llm(self.llm, prompt)
+            except asyncio.CancelledError:
+                self._abandon()
+                raise
+            except Exception as e:
+                self._finish("", e)
+                await asyncio.sleep(self._retry_delay(attempt, e))
+                attempt += 1
+                continue
+            self._finish(text, None)
+            return text
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        attempt = 0
+        while True:
+            check_cancelled()
+            wait = self._admission_wait(prompt)
+            if wait:
+                time.sleep(wait)
+            self._admit(prompt, wait)
+            parts = []
+            try:
+                for chunk in stream_llm(self.llm, prompt):
+                    parts.append(chunk)
+                    yield chunk
+            except Exception as e:
+                self._finish("", e)
+                if parts:
+                    raise
+                time.sleep(self._retry_delay(attempt, e))
+                attempt += 1
+                continue
+            except BaseException:
+                # GeneratorExit vb.: akış tüketici tarafından kapatıldı
+                self._abandon()
+                raise
+            self._finish("".join(parts), None)
+            return
+
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+def resilience_from_env(max_concurrency: int) -> Dict[str, object]:
+    """
+    ResilientLLM için paylaşılacak limitler ve ayarlar:
+    LLM_RPM, LLM_TPM (dakikalık kota; boşsa sınırsız), LLM_MAX_RETRIES (varsayılan 4),
+    LLM_RETRY_BASE_S (varsayılan 0.5). AIMD sınırı 1..max_concurrency arasında gezer.
+    """
+    rpm, tpm = _env_float("LLM_RPM"), _env_float("LLM_TPM")
+    return {
+        "limiter": RateLimiter(rpm, tpm) if rpm or tpm else None,
+        "concurrency": AIMDLimiter(initial=max_concurrency, max_limit=max_concurrency),
+        "max_retries": int(os.getenv("LLM_MAX_RETRIES", "4")),
+        "base_delay": float(os.getenv("LLM_RETRY_BASE_S", "0.5")),
+    }
@@ -0,0 +1,47 @@
+from __future__ import annotations
+import time
+from typing import Callable, Iterator, Optional
+
+from llm.cancel import current_token
+from llm.context import current_stage, stage_scope
+from llm.deadline import DeadlineExceeded, call_timeout
+
+
+def stream_llm(llm: Callable[[str], str], prompt: str, stage: Optional[str] = None) -> Iterator[str]:
+    """
+    LLM yanıtını parça parça döndürür.
+    - llm'in stream metodu varsa gerçek akış kullanılır.
+    - Yoksa tam yanıt tek parça olarak verilir (düz fonksiyonlarla uyumluluk).
+    stage verilirse her parça çekilirken çağrı o aşamayla etiketlenir; böylece
+    generator'ın tükettiği taraf (GUI/terminal) aşama bilgisinden etkilenmez.
+    Her parçadan önce iptal bayrağı (llm.cancel) ve aşamanın süre sınırı (llm.deadline)
+    kontrol edilir; iptalde/zaman aşımında akış kapatılır.
+    """
+    def _source() -> Iterator[str]:
+        stream = getattr(llm, "stream", None)
+        if stream is None:
+            yield llm(prompt)
+        else:
+            yield from stream(prompt)
+
+    chunks = _source()
+    # Akışın tamamı tek çağrı sayılır: süre ilk parça istenirken başlar
+    limit_stage = stage or current_stage()
+    timeout = call_timeout(limit_stage)
+    expires = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        token = current_token()
+        if token is not None and token.cancelled:
+            chunks.close()  # alttaki HTTP akışı da kapanır
+            token.raise_if_cancelled()
+        if expires is not None and time.monotonic() >= expires:
+            chunks.close()
+            raise DeadlineExceeded(limit_stage)
+        if stage is None:
+            chunk = next(chunks, None)
+        else:
+            with stage_scope(stage):
+                chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
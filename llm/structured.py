@@ -0,0 +1,185 @@
+from __future__ import annotations
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, Optional
+
+# Modelden JSON istemek için üretim ayarı (Gemini: response_mime_type).
+JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+# Ayrıştırma yolu sayaçları:
+# - strict            : çıktı doğrudan json.loads ile okundu
+# - lenient           : yerel onarımla (kod bloğu, sondaki virgül, tek tırnak, yarım kalan nesne) okundu
+# - unparsed          : yerel olarak okunamadı
+# - llm_repair        : onarım için ek LLM çağrısı yapıldı ve başarılı oldu
+# - llm_repair_failed : LLM onarımı da başarısız oldu
+_COUNTER_NAMES = ("strict", "lenient", "unparsed", "llm_repair", "llm_repair_failed")
+_counters: Dict[str, int] = {name: 0 for name in _COUNTER_NAMES}
+_counters_lock = threading.Lock()
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_PY_LITERALS = (
+    (re.compile(r"(?<![\w\"])True(?![\w\"])"), "true"),
+    (re.compile(r"(?<![\w\"])False(?![\w\"])"), "false"),
+    (re.compile(r"(?<![\w\"])None(?![\w\"])"), "null"),
+)
+
+
+def record_parse(outcome: str) -> None:
+    with _counters_lock:
+        _counters[outcome] = _counters.get(outcome, 0) + 1
+
+
+def json_parse_stats() -> Dict[str, int]:
+    """Süreç genelindeki ayrıştırma yolu sayaçları (metrik olarak dışa aktarılır)."""
+    with _counters_lock:
+        return dict(_counters)
+
+
+def reset_json_parse_stats() -> None:
+    with _counters_lock:
+        for name in list(_counters):
+            _counters[name] = 0
+
+
+def as_json_llm(llm: Callable[[str], str], schema: Optional[dict] = None) -> Callable[[str], str]:
+    """
+    İstemci destekliyorsa (with_generation_config) JSON çıktı moduna alınmış bir kopyasını döndürür;
+    desteklemiyorsa llm'i olduğu gibi döndürür (yerel ayrıştırıcı yine devrededir).
+    """
+    configure = getattr(llm, "with_generation_config", None)
+    if configure is None:
+        return llm
+    overrides = dict(JSON_GENERATION_CONFIG)
+    if schema is not None:
+        overrides["response_schema"] = schema
+    return configure(**overrides)
+
+
+def _strip_fences(text: str) -> str:
+    m = _FENCE_RE.search(text)
+    if m:
+        text = m.group(1)
+    text = text.strip()
+    if text[:4].lower() == "json":
+        text = text[4:].lstrip()
+    return text
+
+
+def _extract_json_span(text: str) -> str:
+    """İlk { veya [ ile başlayan kısmı (varsa son kapanışa kadar) alır."""
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return text
+    start = min(starts)
+    closer = "}" if text[start] == "{" else "]"
+    end = text.rfind(closer)
+    return text[start:end + 1] if end > start else text[start:]
+
+
+def _swap_single_quotes(text: str) -> str:
+    """Tek tırnaklı dizgeleri çift tırnaklıya çevirir (çift tırnak içindekilere dokunmaz)."""
+    out = []
+    quote = None
+    escaped = False
+    for ch in text:
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote:
+                quote = None
+                ch = '"'
+            elif ch == '"' and quote == "'":
+                ch = '\\"'
+        elif ch in ("'", '"'):
+            quote = ch
+            ch = '"'
+        out.append(ch)
+    return "".join(out)
+
+
+def _close_truncated(text: str) -> str:
+    """Yarıda kesilmiş çıktıyı kapatır: açık dizge, sondaki virgül/anahtar ve açık parantezler."""
+    stack = []
+    in_string = False
+    escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    if not stack and not in_string:
+        return text
+    if in_string:
+        text += '"'
+    text = text.rstrip()
+    # Değeri gelmemiş anahtarı ya da sondaki virgülü at
+    text = re.sub(r',?\s*"[^"]*"\s*:\s*$', "", text)
+    text = text.rstrip().rstrip(",")
+    return text + "".join(reversed(stack))
+
+
+def parse_json_lenient(raw: str, record: bool = True) -> Any:
+    """
+    Model çıktısını JSON olarak okur; önce katı, olmazsa adım adım yerel onarımla.
+    Okunamazsa ValueError fırlatır. record=True ise izlenen yol sayaçlara işlenir
+    (LLM onarımının çıktısı okunurken kapatılır; o sonuç llm_repair* olarak sayılır).
+    """
+    def _record(outcome: str) -> None:
+        if record:
+            record_parse(outcome)
+
+    if not raw or not raw.strip():
+        _record("unparsed")
+        raise ValueError("Boş yanıt")
+
+    text = raw.strip()
+    try:
+        value = json.loads(text)
+        _record("strict")
+        return value
+    except json.JSONDecodeError:
+        pass
+
+    text = _extract_json_span(_strip_fences(text))
+    candidates = [text]
+    text = _TRAILING_COMMA_RE.sub(r"\1", text)
+    candidates.append(text)
+    text = _swap_single_quotes(text)
+    for pattern, repl in _PY_LITERALS:
+        text = pattern.sub(repl, text)
+    candidates.append(text)
+    candidates.append(_TRAILING_COMMA_RE.sub(r"\1", _close_truncated(text)))
+
+    last_error: Optional[Exception] = None
+    for candidate in candidates:
+        try:
+            value = json.loads(candidate)
+            _record("lenient")
+            return value
+        except json.JSONDecodeError as e:
+            last_error = e
+
+    _record("unparsed")
+    raise ValueError(str(last_error))
+
+
+def parse_json_object(raw: str) -> Dict[str, Any]:
+    """parse_json_lenient gibi; ama sadece nesne kabul eder, okunamazsa {} döner."""
+    try:
+        value = parse_json_lenient(raw)
+    except ValueError:
+        return {}
+    return value if isinstance(value, dict) else {}
@@ -5,6 +5,10 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 def main():
+    # Kullanıcı mod seçerken LLM arka ucu (google.generativeai import + yapılandırma) hazırlanır
+    from llm.llm_config import warmup_in_background
+    warmup_in_background()
+
     print("==========================================")
     print("   YAPAY HIKAYE ATÖLYESİ - BAŞLATICI")
     print("==========================================")
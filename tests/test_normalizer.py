@@ -0,0 +1,59 @@
+from agents.normalizer import TurkishNormalizer, deasciify, tr_title
+
+
+def _normalize(**user_input):
+    normalizer = TurkishNormalizer()
+    result = normalizer.normalize(user_input)
+    return result, normalizer.is_confident(result)
+
+
+def test_ascii_capital_i_is_deasciified():
+    result, confident = _normalize(title="Ay Isigi")
+    assert result.fields["title"] == "Ay Işığı"
+    assert confident
+
+
+def test_unknown_ascii_name_is_uncertain():
+    result, confident = _normalize(characters=["Isil", "Ali"])
+    assert result.uncertain == ["Isil"]
+    assert result.fields["characters"] == ["Isil", "Ali"]
+    assert not confident
+
+
+def test_typed_turkish_characters_are_kept():
+    text, uncertain = deasciify("Işıl ve Ömer")
+    assert text == "Işıl ve Ömer"
+    assert uncertain == []
+
+
+def test_single_uncertain_word_is_not_confident():
+    result, confident = _normalize(title="Gece Yarisi Masali", theme="dostluk ve umut")
+    assert result.uncertain == ["Yarisi"]
+    assert result.confidence > 0.8
+    assert not confident
+
+
+def test_unknown_word_without_ambiguous_letters_is_uncertain():
+    _, uncertain = deasciify("kelebk")
+    assert uncertain == ["kelebk"]
+
+
+def test_known_title_exact_and_single_typo():
+    assert _normalize(title="kucuk prens")[0].fields["title"] == "Küçük Prens"
+    assert _normalize(title="Pamuk Prenzes")[0].fields["title"] == "Pamuk Prenses"
+
+
+def test_similar_user_titles_are_not_rewritten():
+    result, _ = _normalize(title="Kucuk Prenses")
+    assert result.fields["title"] == "Küçük Prenses"
+    result, confident = _normalize(title="Pamuk Prensler")
+    assert result.fields["title"] == "Pamuk Prensler"
+    assert not confident
+
+
+def test_known_genre():
+    assert _normalize(genre="bilimkurgu")[0].fields["genre"] == "Bilim Kurgu"
+
+
+def test_tr_title_keeps_conjunctions_lower():
+    assert tr_title("suç ve ceza") == "Suç ve Ceza"